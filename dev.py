@@ -1,4 +1,6 @@
-from LSP.plugin.core.typing import Any, Dict, TypeVar
+from LSP.plugin.core.typing import Any, Callable, Dict, Optional, TypeVar
+import copy
+import functools
 import getpass
 import os
 import sublime
@@ -8,8 +10,31 @@ import sys
 T = TypeVar("T")
 
 
-def expand_variables(val: T) -> T:
-    w = sublime.active_window()
+def memoize_per_window(func: Callable[[sublime.Window], T]) -> Callable[[Optional[sublime.Window]], T]:
+    """
+    Memoizes the result of `func(window)` until the window's folders change.
+
+    A deep copy of the memoized result is returned so callers are free to modify it.
+    """
+
+    cache = {}  # type: Dict[int, tuple[tuple[str, ...], T]]
+
+    @functools.wraps(func)
+    def wrapped(window: Optional[sublime.Window] = None) -> T:
+        w = window or sublime.active_window()
+        folders = tuple(w.folders())
+
+        cached = cache.get(w.id())
+        if not cached or cached[0] != folders:
+            cached = cache[w.id()] = (folders, func(w))
+
+        return copy.deepcopy(cached[1])
+
+    return wrapped
+
+
+def expand_variables(val: T, window: Optional[sublime.Window] = None) -> T:
+    w = window or sublime.active_window()
 
     variables = w.extract_variables()
     variables.update(
@@ -23,7 +48,8 @@ def expand_variables(val: T) -> T:
     return sublime.expand_variables(val, variables)  # type: ignore
 
 
-def vscode_python_settings() -> Dict[str, Any]:
+@memoize_per_window
+def vscode_python_settings(window: sublime.Window) -> Dict[str, Any]:
     settings = {
         "python": {
             "diagnostics": {"sourceMapsEnabled": False},
@@ -155,10 +181,11 @@ def vscode_python_settings() -> Dict[str, Any]:
         }
     }
 
-    return expand_variables(settings)
+    return expand_variables(settings, window)
 
 
-def vscode_env() -> Dict[str, str]:
+@memoize_per_window
+def vscode_env(window: sublime.Window) -> Dict[str, str]:
     env = {
         "ALLUSERSPROFILE": "C:\\ProgramData",
         "AMD_ENTRYPOINT": "vs/workbench/services/extensions/node/extensionHostProcess",
@@ -217,4 +244,4 @@ def vscode_env() -> Dict[str, str]:
         "windir": "C:\\Windows",
     }
 
-    return expand_variables(env)
+    return expand_variables(env, window)
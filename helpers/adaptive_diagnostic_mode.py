@@ -0,0 +1,159 @@
+from typing import Any, Dict, Optional
+import json
+import os
+import threading
+import time
+
+__all__ = ["AdaptiveDiagnosticMode"]
+
+DIAGNOSTIC_MODE_OPEN_FILES_ONLY = "openFilesOnly"
+DIAGNOSTIC_MODE_WORKSPACE = "workspace"
+
+# switching back to "workspace" requires the cost to be below this ratio of thresholds, so it doesn't flap
+HYSTERESIS_RATIO = 0.8
+
+# a measured cost of the "workspace" mode expires after this many seconds, so "workspace" is probed again
+WORKSPACE_ELAPSED_TTL_S = 24 * 60 * 60
+
+# updated decisions are written to the disk in the background at most once per this many seconds
+SAVE_DELAY_S = 5.0
+
+
+class AdaptiveDiagnosticMode:
+    """
+    Decides "python.analysis.diagnosticMode" per workspace from measured analysis costs.
+
+    A workspace uses "workspace" until its program has too many files or a full analysis takes too long,
+    then it uses "openFilesOnly". The analysis time can only be measured in "workspace", so it expires after
+    `WORKSPACE_ELAPSED_TTL_S` and "workspace" is tried again. Decisions are persisted as a JSON file so they
+    survive restarts. Updates are persisted in batches by a background timer, call `flush()` to persist them now.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._decisions = {}  # type: Dict[str, Dict[str, Any]]
+        self._loaded = False
+        self._dirty = False
+        self._save_timer = None  # type: Optional[threading.Timer]
+
+    def mode_for(self, workspace: str) -> Optional[str]:
+        """ Gets the decided diagnostic mode of the workspace, None if there is no decision yet. """
+
+        with self._lock:
+            self._ensure_loaded()
+            decision = self._decisions.get(workspace)
+            return decision["mode"] if decision else None
+
+    def decisions(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            return {workspace: dict(decision) for workspace, decision in self._decisions.items()}
+
+    def update(
+        self,
+        workspace: str,
+        current_mode: str,
+        measurements: Dict[str, Any],
+        max_files: int,
+        max_elapsed_ms: float,
+    ) -> Optional[str]:
+        """
+        Updates the decision of the workspace with an "analysis_complete" telemetry event.
+
+        :param      workspace:       The workspace (usually the first folder of the window)
+        :param      current_mode:    The diagnostic mode which the measurements are taken with
+        :param      measurements:    The "Measurements" of the telemetry event
+        :param      max_files:       Use "openFilesOnly" if the program has more files than this
+        :param      max_elapsed_ms:  Use "openFilesOnly" if a full analysis takes longer than this
+
+        :returns:   The new diagnostic mode if it should be switched, None otherwise
+        """
+
+        with self._lock:
+            self._ensure_loaded()
+            decision = self._decisions.setdefault(workspace, {"mode": current_mode, "workspaceElapsedMs": 0})
+
+            num_files = measurements.get("numFilesInProgram", 0)
+            decision["numFilesInProgram"] = num_files
+
+            # only a full analysis of the whole workspace tells how expensive the "workspace" mode is
+            if measurements.get("isFirstRun") and current_mode == DIAGNOSTIC_MODE_WORKSPACE:
+                decision["workspaceElapsedMs"] = measurements.get("elapsedMs", 0)
+                decision["workspaceMeasuredAt"] = time.time()
+            elif time.time() - decision.get("workspaceMeasuredAt", 0) > WORKSPACE_ELAPSED_TTL_S:
+                # the workspace may have become cheaper since then, measure it again
+                decision["workspaceElapsedMs"] = 0
+
+            elapsed_ms = decision["workspaceElapsedMs"]
+
+            if num_files > max_files or elapsed_ms > max_elapsed_ms:
+                mode = DIAGNOSTIC_MODE_OPEN_FILES_ONLY
+            elif num_files <= max_files * HYSTERESIS_RATIO and elapsed_ms <= max_elapsed_ms * HYSTERESIS_RATIO:
+                mode = DIAGNOSTIC_MODE_WORKSPACE
+            else:
+                mode = decision["mode"]
+
+            changed = mode != decision["mode"] or mode != current_mode
+            decision["mode"] = mode
+            decision["time"] = time.time()
+            self._dirty = True
+
+            if not self._save_timer:
+                self._save_timer = threading.Timer(SAVE_DELAY_S, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+        return mode if changed else None
+
+    def forget(self, workspace: Optional[str] = None) -> None:
+        """ Forgets the decision of the workspace, or decisions of all workspaces if `workspace` is None. """
+
+        with self._lock:
+            self._ensure_loaded()
+            if workspace is None:
+                self._decisions.clear()
+            else:
+                self._decisions.pop(workspace, None)
+
+        self.save()
+
+    def flush(self) -> None:
+        """ Persists decisions which are updated since the last save, if any. """
+
+        with self._lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+                self._save_timer = None
+            dirty = self._dirty
+
+        if dirty:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._dirty = False
+            data = dict(self._decisions)
+
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                with open(self._path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(self._path + ".tmp", self._path)
+            except OSError:
+                pass
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+
+        self._loaded = True
+
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict):
+            self._decisions.update(data)
@@ -0,0 +1,219 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+__all__ = ["AnalysisCache"]
+
+# the metadata file in a cache folder, its mtime is the last time the folder is used
+META_FILE = ".cache-meta.json"
+
+
+class AnalysisCache:
+    """
+    Persistent analysis cache folders ("python.analysis.cacheFolderPath") per workspace and server version.
+
+    The total size of cache folders is kept within a budget by evicting the least recently used ones.
+    Folders which are used since the plugin is loaded are never evicted.
+    """
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+        self._lock = threading.Lock()
+        self._in_use = set()  # type: set[str]
+        self._evicting = False
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def folder_for(self, workspace: str, version: str) -> Tuple[str, bool]:
+        """
+        Gets the cache folder of the workspace and marks it as in use.
+
+        :param      workspace:  The workspace (usually the first folder of the window)
+        :param      version:    The server version, caches are not shared between versions
+
+        :returns:   The path of the cache folder, which is created if it doesn't exist, and whether it's not
+                    in use before. Only then is the folder marked as recently used.
+        """
+
+        digest = hashlib.sha256(workspace.encode("utf-8")).hexdigest()[:16]
+        folder = os.path.join(self._root, "{}-{}".format(digest, version))
+
+        with self._lock:
+            if folder in self._in_use:
+                return folder, False
+
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"workspace": workspace, "version": version}, f)
+
+        with self._lock:
+            self._in_use.add(folder)
+
+        return folder, True
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """ Gets cache folders, the least recently used one first. """
+
+        try:
+            names = os.listdir(self._root)
+        except OSError:
+            return []
+
+        with self._lock:
+            in_use = set(self._in_use)
+
+        entries = []
+        for name in names:
+            folder = os.path.join(self._root, name)
+            meta = _read_meta(folder)
+            if meta is None:
+                continue
+
+            try:
+                last_used = os.path.getmtime(os.path.join(folder, META_FILE))
+            except OSError:
+                last_used = 0.0
+
+            entries.append(
+                {
+                    "folder": folder,
+                    "workspace": meta.get("workspace", ""),
+                    "version": meta.get("version", ""),
+                    "size": _folder_size(folder),
+                    "lastUsed": last_used,
+                    "inUse": folder in in_use,
+                }
+            )
+
+        return sorted(entries, key=lambda entry: entry["lastUsed"])
+
+    def evict(self, budget_bytes: int) -> List[str]:
+        """
+        Deletes the least recently used cache folders until the total size fits the budget.
+
+        :param      budget_bytes:  The budget of the total size
+
+        :returns:   Deleted folders
+        """
+
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        deleted = []  # type: List[str]
+
+        for entry in entries:
+            if total <= budget_bytes:
+                break
+
+            if entry["inUse"]:
+                continue
+
+            shutil.rmtree(entry["folder"], ignore_errors=True)
+            total -= entry["size"]
+            deleted.append(entry["folder"])
+
+        return deleted
+
+    def evict_async(self, budget_bytes: int, on_done: Optional[Callable[[List[str]], None]] = None) -> None:
+        """ Same as `evict()` but runs in a background thread. `on_done` is called with deleted folders. """
+
+        with self._lock:
+            if self._evicting:
+                return
+            self._evicting = True
+
+        def run() -> None:
+            try:
+                deleted = self.evict(budget_bytes)
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+            if on_done:
+                on_done(deleted)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def purge(self, include_in_use: bool = False) -> List[str]:
+        """
+        Deletes cache folders.
+
+        :param      include_in_use:  Also delete folders used by running servers, which may recreate files
+
+        :returns:   Deleted folders
+        """
+
+        deleted = []  # type: List[str]
+
+        for entry in self.entries():
+            if entry["inUse"] and not include_in_use:
+                continue
+
+            shutil.rmtree(entry["folder"], ignore_errors=True)
+            deleted.append(entry["folder"])
+
+        return deleted
+
+    def report(self, budget_bytes: int) -> str:
+        entries = self.entries()
+        now = time.time()
+
+        lines = [
+            "# Analysis cache: {:.1f} MiB used, budget {}".format(
+                sum(entry["size"] for entry in entries) / 1024 / 1024,
+                "{:.0f} MiB".format(budget_bytes / 1024 / 1024) if budget_bytes else "none",
+            ),
+            "",
+            "{:>9} {:>12}  {:<20} {}".format("MiB", "last used", "version", "workspace"),
+        ]
+
+        # the most recently used one first
+        for entry in reversed(entries):
+            lines.append(
+                "{:>9.1f} {:>12}  {:<20} {}".format(
+                    entry["size"] / 1024 / 1024,
+                    "in use" if entry["inUse"] else _format_age(now - entry["lastUsed"]),
+                    entry["version"],
+                    entry["workspace"] or "(no folder)",
+                )
+            )
+
+        lines.extend(["", "Folder: {}".format(self._root)])
+
+        return "\n".join(lines) + "\n"
+
+
+def _read_meta(folder: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(folder, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return meta if isinstance(meta, dict) else None
+
+
+def _folder_size(folder: str) -> int:
+    size = 0
+
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+
+    return size
+
+
+def _format_age(seconds: float) -> str:
+    if seconds < 3600:
+        return "{:.0f} min ago".format(seconds / 60)
+    if seconds < 86400:
+        return "{:.0f} h ago".format(seconds / 3600)
+    return "{:.0f} d ago".format(seconds / 86400)
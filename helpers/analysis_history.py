@@ -0,0 +1,216 @@
+from .utils import percentile
+from collections import deque
+from typing import Any, Dict, List, Optional
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+# fields of a record, also the CSV columns
+RECORD_FIELDS = (
+    "time",
+    "workspace",
+    "serverVersion",
+    "typeCheckingMode",
+    "isFirstRun",
+    "numFilesAnalyzed",
+    "numFilesInProgram",
+    "elapsedMs",
+    "rssBytes",
+)
+
+# added records are written to the disk in the background at most once per this many seconds
+SAVE_DELAY_S = 5.0
+
+
+class AnalysisHistory:
+    """
+    Analysis performance records (from the "language_server/analysis_complete" telemetry event) per workspace.
+
+    Records of each workspace are kept in a bounded ring buffer and persisted as a JSON file.
+    Added records are persisted in batches by a background timer, call `flush()` to persist them now.
+    """
+
+    def __init__(self, path: str, max_records: int = 500) -> None:
+        self._path = path
+        self._max_records = max_records
+        self._lock = threading.Lock()
+        self._records = {}  # type: Dict[str, deque[Dict[str, Any]]]
+        self._loaded = False
+        self._dirty = False
+        self._save_timer = None  # type: Optional[threading.Timer]
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def add(self, workspace: str, measurements: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+        """
+        Adds a record for the workspace. The history is persisted in the background later.
+
+        :param      workspace:     The workspace (usually the first folder of the window)
+        :param      measurements:  The "Measurements" of the telemetry event
+        :param      extra:         Additional fields such as "serverVersion", "typeCheckingMode" and "rssBytes"
+
+        :returns:   The added record
+        """
+
+        record = {
+            "time": time.time(),
+            "workspace": workspace,
+            "isFirstRun": bool(measurements.get("isFirstRun")),
+            "numFilesAnalyzed": measurements.get("numFilesAnalyzed", 0),
+            "numFilesInProgram": measurements.get("numFilesInProgram", 0),
+            "elapsedMs": measurements.get("elapsedMs", 0),
+        }
+        record.update(extra)
+
+        with self._lock:
+            self._ensure_loaded()
+            self._records.setdefault(workspace, deque(maxlen=self._max_records)).append(record)
+            self._dirty = True
+
+            if not self._save_timer:
+                self._save_timer = threading.Timer(SAVE_DELAY_S, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+        return record
+
+    def workspaces(self) -> List[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return sorted(self._records.keys())
+
+    def records(self, workspace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ Gets records of the workspace, or records of all workspaces if `workspace` is None. """
+
+        with self._lock:
+            self._ensure_loaded()
+
+            if workspace is not None:
+                return list(self._records.get(workspace, ()))
+
+            return sorted((r for rs in self._records.values() for r in rs), key=lambda r: r["time"])
+
+    def summary(self, workspace: Optional[str] = None) -> Dict[str, Any]:
+        """ Summarizes records of the workspace (or all workspaces) into statistics. """
+
+        return summarize(self.records(workspace))
+
+    def report(self, workspace: Optional[str] = None) -> str:
+        """ Renders a human-readable report of the workspace (or all workspaces). """
+
+        lines = []  # type: List[str]
+
+        for ws in [workspace] if workspace is not None else self.workspaces():
+            records = self.records(ws)
+            lines.append("# {} ({} records)".format(ws or "(no folder)", len(records)))
+
+            groups = {}  # type: Dict[tuple[str, str], List[Dict[str, Any]]]
+            for record in records:
+                key = (str(record.get("serverVersion", "?")), str(record.get("typeCheckingMode", "?")))
+                groups.setdefault(key, []).append(record)
+
+            for (server_version, type_checking_mode), group in sorted(groups.items()):
+                summary = summarize(group)
+                lines.append("")
+                lines.append("## server {}, typeCheckingMode {}".format(server_version, type_checking_mode))
+                lines.append("- files/sec: {:.1f}".format(summary["filesPerSecond"]))
+                if summary["peakRssBytes"]:
+                    lines.append("- peak RSS: {:.0f} MiB".format(summary["peakRssBytes"] / 1024 / 1024))
+                for kind in ("firstRun", "incremental"):
+                    lines.append(
+                        "- {kind} (n={count}): mean {mean:.0f} ms, "
+                        "p50 {p50:.0f} ms, p90 {p90:.0f} ms, p99 {p99:.0f} ms".format(kind=kind, **summary[kind])
+                    )
+
+            lines.append("")
+
+        return "\n".join(lines)
+
+    def to_json(self, workspace: Optional[str] = None) -> str:
+        return json.dumps(self.records(workspace), indent=2)
+
+    def to_csv(self, workspace: Optional[str] = None) -> str:
+        with io.StringIO() as f:
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS, extrasaction="ignore", lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(self.records(workspace))
+            return f.getvalue()
+
+    def flush(self) -> None:
+        """ Persists records which are added since the last save, if any. """
+
+        with self._lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+                self._save_timer = None
+            dirty = self._dirty
+
+        if dirty:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._dirty = False
+            data = {workspace: list(records) for workspace, records in self._records.items()}
+
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                with open(self._path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(self._path + ".tmp", self._path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._loaded = True
+
+        self.save()
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+
+        self._loaded = True
+
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict):
+            for workspace, records in data.items():
+                self._records[workspace] = deque(records, maxlen=self._max_records)
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    first_runs = [r["elapsedMs"] for r in records if r["isFirstRun"]]
+    incrementals = [r["elapsedMs"] for r in records if not r["isFirstRun"]]
+    total_files = sum(r["numFilesAnalyzed"] for r in records)
+    total_ms = sum(r["elapsedMs"] for r in records)
+    rss = [r["rssBytes"] for r in records if r.get("rssBytes")]
+
+    return {
+        "count": len(records),
+        "filesPerSecond": total_files * 1000 / total_ms if total_ms else 0.0,
+        "firstRun": _stats(first_runs),
+        "incremental": _stats(incrementals),
+        "peakRssBytes": max(rss) if rss else 0,
+    }
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+    }
@@ -0,0 +1,264 @@
+from typing import Any, Dict, List, Optional
+import base64
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+__all__ = ["InterpreterDiscovery"]
+
+# directory names of in-project virtual environments, in the order of preference
+VENV_DIR_NAMES = (".venv", "venv", ".env", "env")
+
+# files whose changes may change the discovered interpreter of a workspace folder
+MARKER_FILES = ("pyproject.toml", "Pipfile", "environment.yml", "environment.yaml", ".python-version")
+
+
+class InterpreterDiscovery:
+    """
+    Finds the Python environment of a workspace folder without running any subprocess.
+
+    Supported environments, in the order of preference:
+    - a virtual environment (a directory with "pyvenv.cfg") in the folder
+    - the poetry environment of "pyproject.toml"
+    - the pipenv environment of "Pipfile"
+    - the conda environment named in "environment.yml"
+    - the pyenv version in ".python-version"
+
+    Results are cached with mtimes of marker files, so they are reused until a marker file changes.
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._cache = {}  # type: Dict[str, Dict[str, Any]]
+        self._loaded = False
+
+    def discover(self, folder: str) -> Optional[Dict[str, Any]]:
+        """
+        Discovers the Python environment of the workspace folder.
+
+        :param      folder:  The workspace folder
+
+        :returns:   {"pythonPath": ..., "sitePackages": [...], "kind": ...}, None if not found
+        """
+
+        markers = _marker_mtimes(folder)
+
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._cache.get(folder)
+
+        if entry and entry["markers"] == markers and _is_still_valid(entry["result"]):
+            return entry["result"]
+
+        result = _discover(folder)
+
+        with self._lock:
+            self._cache[folder] = {"markers": markers, "result": result}
+
+        self._save()
+
+        return result
+
+    def _save(self) -> None:
+        with self._lock:
+            data = dict(self._cache)
+
+            try:
+                os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+                with open(self._cache_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(self._cache_path + ".tmp", self._cache_path)
+            except OSError:
+                pass
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+
+        self._loaded = True
+
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict):
+            self._cache.update(data)
+
+
+def _marker_mtimes(folder: str) -> Dict[str, Optional[float]]:
+    paths = [folder] + [os.path.join(folder, name) for name in MARKER_FILES]
+    paths += [os.path.join(folder, name, "pyvenv.cfg") for name in VENV_DIR_NAMES]
+
+    mtimes = {}  # type: Dict[str, Optional[float]]
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            mtimes[path] = None
+
+    return mtimes
+
+
+def _is_still_valid(result: Optional[Dict[str, Any]]) -> bool:
+    return not result or os.path.isfile(result["pythonPath"])
+
+
+def _discover(folder: str) -> Optional[Dict[str, Any]]:
+    for kind, find_env in (
+        ("venv", _find_venv),
+        ("poetry", _find_poetry_env),
+        ("pipenv", _find_pipenv_env),
+        ("conda", _find_conda_env),
+        ("pyenv", _find_pyenv_env),
+    ):
+        env_dir = find_env(folder)
+        if not env_dir:
+            continue
+
+        python_path = _python_in(env_dir)
+        if python_path:
+            return {"pythonPath": python_path, "sitePackages": _site_packages_in(env_dir), "kind": kind}
+
+    return None
+
+
+def _find_venv(folder: str) -> Optional[str]:
+    for name in VENV_DIR_NAMES:
+        env_dir = os.path.join(folder, name)
+        if os.path.isfile(os.path.join(env_dir, "pyvenv.cfg")):
+            return env_dir
+
+    return None
+
+
+def _find_poetry_env(folder: str) -> Optional[str]:
+    content = _read_text(os.path.join(folder, "pyproject.toml"))
+    if not content or "[tool.poetry]" not in content:
+        return None
+
+    m = re.search(r'^\[tool\.poetry\][^\[]*?^name\s*=\s*["\']([^"\']+)["\']', content, re.MULTILINE | re.DOTALL)
+    if not m:
+        return None
+
+    # @see poetry.utils.env.EnvManager.generate_env_name()
+    name = re.sub(r'[ $`!*@"\\\r\n\t]', "_", m.group(1).lower())[:42]
+    normalized_folder = os.path.normcase(os.path.realpath(folder))
+    digest = base64.urlsafe_b64encode(hashlib.sha256(normalized_folder.encode("utf-8")).digest()).decode()[:8]
+
+    if os.environ.get("POETRY_VIRTUALENVS_PATH"):
+        venvs_dir = os.environ["POETRY_VIRTUALENVS_PATH"]
+    elif sys.platform == "win32":
+        venvs_dir = os.path.join(os.environ.get("LOCALAPPDATA", ""), "pypoetry", "Cache", "virtualenvs")
+    elif sys.platform == "darwin":
+        venvs_dir = os.path.expanduser("~/Library/Caches/pypoetry/virtualenvs")
+    else:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        venvs_dir = os.path.join(cache_home, "pypoetry", "virtualenvs")
+
+    # looks like "my-project-AbCd1234-py3.8", take the newest Python
+    env_dirs = glob.glob(os.path.join(glob.escape(venvs_dir), glob.escape("{}-{}".format(name, digest)) + "-py*"))
+
+    return max(env_dirs, key=_python_version_key) if env_dirs else None
+
+
+def _find_pipenv_env(folder: str) -> Optional[str]:
+    if not os.path.isfile(os.path.join(folder, "Pipfile")):
+        return None
+
+    # an in-project environment has been found by `_find_venv()` if it exists
+    # @see pipenv.project.Project.virtualenv_name
+    name = re.sub(r'[ &$`!*@"()\[\]\\\r\n\t]', "_", os.path.basename(folder))[:42]
+    digest = base64.urlsafe_b64encode(hashlib.sha256(os.path.join(folder, "Pipfile").encode("utf-8")).digest()[:6])
+
+    workon_home = os.environ.get("WORKON_HOME") or os.path.expanduser("~/.local/share/virtualenvs")
+    env_dir = os.path.join(workon_home, "{}-{}".format(name, digest.decode()))
+
+    return env_dir if os.path.isdir(env_dir) else None
+
+
+def _find_conda_env(folder: str) -> Optional[str]:
+    content = _read_text(os.path.join(folder, "environment.yml")) or _read_text(
+        os.path.join(folder, "environment.yaml")
+    )
+    m = re.search(r"^name:\s*[\"']?([^\s\"']+)", content or "", re.MULTILINE)
+    if not m:
+        return None
+
+    roots = [os.path.expanduser(os.path.join("~", name)) for name in ("miniconda3", "anaconda3", "miniforge3")]
+    roots.append(os.path.expanduser(os.path.join("~", ".conda")))
+    if os.environ.get("CONDA_PREFIX"):
+        # the base environment, or an environment within "<base>/envs/"
+        prefix = os.environ["CONDA_PREFIX"]
+        roots.insert(0, os.path.dirname(os.path.dirname(prefix)) if "envs" in prefix.split(os.sep) else prefix)
+
+    for root in roots:
+        env_dir = os.path.join(root, "envs", m.group(1))
+        if os.path.isdir(os.path.join(env_dir, "conda-meta")):
+            return env_dir
+
+    return None
+
+
+def _find_pyenv_env(folder: str) -> Optional[str]:
+    # may have multiple versions, the first one is the main one
+    versions = (_read_text(os.path.join(folder, ".python-version")) or "").split()
+    if not versions:
+        return None
+
+    pyenv_root = os.environ.get("PYENV_ROOT") or os.path.expanduser("~/.pyenv")
+    versions_dir = os.path.join(pyenv_root, "versions")
+    env_dir = os.path.join(versions_dir, versions[0])
+    if os.path.isdir(env_dir):
+        return env_dir
+
+    # a prefix such as "3.11" means the latest installed "3.11.x" (like `pyenv latest`)
+    if not re.match(r"^\d+(?:\.\d+)*$", versions[0]):
+        return None
+
+    try:
+        names = os.listdir(versions_dir)
+    except OSError:
+        return None
+
+    pattern = re.compile(r"^{}(?:\.\d+)+$".format(re.escape(versions[0])))
+    matched = [name for name in names if pattern.match(name) and os.path.isdir(os.path.join(versions_dir, name))]
+    if not matched:
+        return None
+
+    return os.path.join(versions_dir, max(matched, key=lambda name: [int(part) for part in name.split(".")]))
+
+
+def _python_in(env_dir: str) -> Optional[str]:
+    for relative_path in ("Scripts/python.exe", "python.exe", "bin/python3", "bin/python"):
+        path = os.path.join(env_dir, *relative_path.split("/"))
+        if os.path.isfile(path):
+            return path
+
+    return None
+
+
+def _site_packages_in(env_dir: str) -> List[str]:
+    paths = glob.glob(os.path.join(glob.escape(env_dir), "lib", "python*", "site-packages"))
+    paths.append(os.path.join(env_dir, "Lib", "site-packages"))
+
+    return sorted((path for path in paths if os.path.isdir(path)), key=_python_version_key, reverse=True)
+
+
+def _python_version_key(path: str) -> List[int]:
+    m = re.search(r"(?:py|python)(\d+)\.(\d+)", path)
+    return [int(m.group(1)), int(m.group(2))] if m else []
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,268 @@
+from .vs_marketplace_lsp_utils.process_info import rss_bytes
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+import json
+import os
+import threading
+import time
+
+__all__ = ["MemoryWatchdog"]
+
+MIB = 1024 * 1024
+
+# a session is warned once its server exceeds this ratio of the memory budget
+WARNING_RATIO = 0.8
+
+# stop watching a session if its server process can't be found within this many samples
+MAX_PID_ATTEMPTS = 5
+
+
+class _Watch:
+    def __init__(
+        self,
+        workspace: str,
+        find_pid: Callable[[], Optional[int]],
+        on_warning: Callable[[int], None],
+        on_exceeded: Callable[[int], None],
+    ) -> None:
+        self.workspace = workspace
+        self.find_pid = find_pid
+        self.on_warning = on_warning
+        self.on_exceeded = on_exceeded
+        self.pid = None  # type: Optional[int]
+        self.pid_attempts = 0
+        self.rss = 0
+        self.peak_rss = 0
+        self.warned = False
+        self.started = time.time()
+
+
+class MemoryWatchdog:
+    """
+    Samples the RSS of server processes on a background thread.
+
+    A session is warned once its server exceeds 80% of the memory budget and is restarted once
+    it exceeds the budget. Restarts and peak RSS per workspace are persisted as a JSON file.
+    """
+
+    def __init__(self, path: str, max_restarts: int = 200) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._watches = {}  # type: Dict[str, _Watch]
+        self._restarts = deque(maxlen=max_restarts)  # type: deque[Dict[str, Any]]
+        self._peaks = {}  # type: Dict[str, int]
+        self._loaded = False
+        self._budget_bytes = 0
+        self._interval = 30.0
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def budget_bytes(self) -> int:
+        return self._budget_bytes
+
+    def configure(self, budget_mib: float, interval_s: float) -> None:
+        """
+        :param      budget_mib:  The RSS budget of a server process, 0 means no budget
+        :param      interval_s:  Seconds between samples
+        """
+
+        self._budget_bytes = int(budget_mib * MIB)
+        self._interval = max(1.0, interval_s)
+
+    def watch(
+        self,
+        key: str,
+        workspace: str,
+        find_pid: Callable[[], Optional[int]],
+        on_warning: Callable[[int], None],
+        on_exceeded: Callable[[int], None],
+    ) -> None:
+        """
+        Starts watching the server process of a session. Callbacks are called on the watchdog thread.
+
+        :param      key:          The key of the session
+        :param      workspace:    The workspace of the session
+        :param      find_pid:     Finds the PID of the server process, None if it's not started yet or has ended
+        :param      on_warning:   Called with the RSS once it exceeds 80% of the budget
+        :param      on_exceeded:  Called with the RSS once it exceeds the budget, the session should be restarted
+        """
+
+        with self._lock:
+            self._watches[key] = _Watch(workspace, find_pid, on_warning, on_exceeded)
+
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def unwatch(self, key: str) -> None:
+        with self._lock:
+            watch = self._watches.pop(key, None)
+
+        if watch:
+            self._update_peak(watch)
+            self.save()
+
+    def latest_rss(self, key: str) -> Optional[int]:
+        with self._lock:
+            watch = self._watches.get(key)
+            return watch.rss if watch and watch.rss else None
+
+    def sample(self) -> None:
+        with self._lock:
+            watches = list(self._watches.items())
+
+        for key, watch in watches:
+            pid = watch.find_pid()
+
+            if pid is None:
+                watch.pid_attempts += 1
+                # the session has ended, or its server never showed up
+                if watch.pid is not None or watch.pid_attempts >= MAX_PID_ATTEMPTS:
+                    self.unwatch(key)
+                continue
+
+            watch.pid = pid
+            rss = rss_bytes(pid)
+
+            # the server has exited
+            if rss is None:
+                self.unwatch(key)
+                continue
+
+            watch.rss = rss
+            watch.peak_rss = max(watch.peak_rss, rss)
+
+            if not self._budget_bytes:
+                continue
+
+            if rss > self._budget_bytes:
+                self._record_restart(watch, rss)
+                self.unwatch(key)
+                watch.on_exceeded(rss)
+            elif rss > self._budget_bytes * WARNING_RATIO and not watch.warned:
+                watch.warned = True
+                watch.on_warning(rss)
+
+    def restarts(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._restarts)
+
+    def report(self) -> str:
+        now = time.time()
+
+        with self._lock:
+            self._ensure_loaded()
+            watches = list(self._watches.values())
+            restarts = list(self._restarts)
+            peaks = dict(self._peaks)
+
+        for watch in watches:
+            peaks[watch.workspace] = max(peaks.get(watch.workspace, 0), watch.peak_rss)
+
+        lines = [
+            "# Server memory (budget: {})".format(
+                "{:.0f} MiB".format(self._budget_bytes / MIB) if self._budget_bytes else "none"
+            ),
+            "",
+            "{:>8} {:>9} {:>9} {:>9}  {}".format("pid", "RSS MiB", "peak MiB", "uptime m", "workspace"),
+        ]
+        for watch in watches:
+            lines.append(
+                "{:>8} {:>9.0f} {:>9.0f} {:>9.0f}  {}".format(
+                    watch.pid or "?",
+                    watch.rss / MIB,
+                    watch.peak_rss / MIB,
+                    (now - watch.started) / 60,
+                    watch.workspace or "(no folder)",
+                )
+            )
+
+        lines.extend(["", "# Peak RSS per workspace", ""])
+        for workspace, peak in sorted(peaks.items(), key=lambda item: -item[1]):
+            lines.append("- {}: {:.0f} MiB".format(workspace or "(no folder)", peak / MIB))
+
+        lines.extend(
+            [
+                "",
+                "# Restarts",
+                "",
+                "- total: {}".format(len(restarts)),
+                "- last 24 hours: {}".format(sum(1 for r in restarts if now - r["time"] < 86400)),
+                "- last 7 days: {}".format(sum(1 for r in restarts if now - r["time"] < 7 * 86400)),
+            ]
+        )
+
+        by_workspace = {}  # type: Dict[str, List[Dict[str, Any]]]
+        for restart in restarts:
+            by_workspace.setdefault(restart["workspace"], []).append(restart)
+
+        for workspace, workspace_restarts in sorted(by_workspace.items()):
+            uptimes = [r["uptimeS"] for r in workspace_restarts]
+            lines.append(
+                "- {}: {} restarts, mean uptime before restart {:.0f} minutes".format(
+                    workspace or "(no folder)",
+                    len(workspace_restarts),
+                    sum(uptimes) / len(uptimes) / 60,
+                )
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def save(self) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            data = {"restarts": list(self._restarts), "peaks": self._peaks}
+
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                with open(self._path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(self._path + ".tmp", self._path)
+            except OSError:
+                pass
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self._interval)
+
+            with self._lock:
+                if not self._watches:
+                    self._thread = None
+                    return
+
+            self.sample()
+
+    def _record_restart(self, watch: _Watch, rss: int) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            self._restarts.append(
+                {
+                    "time": time.time(),
+                    "workspace": watch.workspace,
+                    "rssBytes": rss,
+                    "budgetBytes": self._budget_bytes,
+                    "uptimeS": time.time() - watch.started,
+                }
+            )
+
+    def _update_peak(self, watch: _Watch) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            self._peaks[watch.workspace] = max(self._peaks.get(watch.workspace, 0), watch.peak_rss)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+
+        self._loaded = True
+
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict):
+            self._restarts.extend(data.get("restarts", []))
+            self._peaks.update(data.get("peaks", {}))
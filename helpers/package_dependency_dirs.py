@@ -0,0 +1,77 @@
+from .utils import unique
+from typing import List, Optional
+import os
+import stat
+import sublime
+import sys
+
+PYTHON_MODULE_EXTENSIONS = (".py", ".pyi", ".pyd", ".so")
+
+
+class PackageDependencyDirsResolver:
+    """
+    Resolves directories where ST package dependencies live.
+
+    The result is memoized and only re-computed when `sys.path`, `sublime.packages_path()`
+    or mtimes of those directories change. Directories without Python modules are pruned
+    since every extra search root slows down the import resolution of the server.
+    """
+
+    def __init__(self) -> None:
+        self._key = None  # type: Optional[tuple[tuple[str, Optional[int]], ...]]
+        self._dirs = []  # type: List[str]
+
+    def resolve(self) -> List[str]:
+        key = tuple((path, _dir_mtime_ns(path)) for path in self._candidate_dirs())
+
+        if key != self._key:
+            self._dirs = [path for path, mtime_ns in key if mtime_ns is not None and _has_python_modules(path)]
+            self._key = key
+
+        return self._dirs.copy()
+
+    @staticmethod
+    def _candidate_dirs() -> List[str]:
+        dep_dirs = sys.path.copy()
+
+        # move the "Packages/" to the last
+        # @see https://github.com/sublimelsp/LSP-pyright/pull/26#discussion_r520747708
+        packages_path = sublime.packages_path()
+        if packages_path in dep_dirs:
+            dep_dirs.remove(packages_path)
+        dep_dirs.append(packages_path)
+
+        # just for laziness because sometimes I just decompress the package source there
+        dep_dirs.append(sublime.installed_packages_path())
+
+        return list(unique(dep_dirs, stable=True))
+
+
+def _dir_mtime_ns(path: str) -> Optional[int]:
+    """ Gets the mtime of the directory, None if it's not a directory. """
+
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+
+    return st.st_mtime_ns if stat.S_ISDIR(st.st_mode) else None
+
+
+def _has_python_modules(path: str, depth: int = 1) -> bool:
+    """ Checks whether there are Python modules (or packages) in the directory. """
+
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return False
+
+    if any(entry.name.endswith(PYTHON_MODULE_EXTENSIONS) and entry.is_file() for entry in entries):
+        return True
+
+    # packages, including namespace packages such as ST plugins which have no "__init__.py"
+    return depth > 0 and any(
+        entry.is_dir() and not entry.name.startswith(".") and _has_python_modules(entry.path, depth - 1)
+        for entry in entries
+    )
@@ -21,3 +21,15 @@ def info_box(msg: str, *args, **kwargs) -> None:
 
 def error_box(msg: str, *args, **kwargs) -> None:
     sublime.error_message(pluginfy_msg(msg, *args, **kwargs))
+
+
+def text_view(window: sublime.Window, title: str, text: str, syntax: str = "") -> sublime.View:
+    view = window.new_file()
+    view.set_name(pluginfy_msg(title))
+    view.set_scratch(True)
+    if syntax:
+        view.assign_syntax(syntax)
+    view.run_command("append", {"characters": text})
+    view.set_read_only(True)
+
+    return view
@@ -0,0 +1,220 @@
+from .utils import percentile
+from collections import deque
+from LSP.plugin.core import sessions
+from typing import Any, Callable, Dict, List, Optional
+import json
+import sublime
+import threading
+import time
+
+__all__ = [
+    "RequestLatencyStats",
+    "instrument_request_latency",
+]
+
+# which method of `Session` is wrapped
+_WRAPPED_METHOD = "send_request_async" if hasattr(sessions.Session, "send_request_async") else "send_request"
+
+# config name => stats, sessions of other configs are not instrumented
+_instrumented_configs = {}  # type: Dict[str, RequestLatencyStats]
+
+# payloads are serialized again to measure their sizes, which is not cheap for large responses,
+# so sizes are only measured for one of this many requests of each method
+PAYLOAD_SAMPLE_INTERVAL = 10
+
+# samples are appended into the log file in the background at most once per this many seconds
+LOG_FLUSH_DELAY_S = 2.0
+
+
+class RequestLatencyStats:
+    """
+    Latencies and payload sizes of LSP requests per method.
+
+    Each completed request is also appended into a log file as a JSON line. Lines are buffered
+    and written by a background timer, call `flush()` to write them now.
+    """
+
+    def __init__(self, log_path: str = "", max_samples: int = 1000) -> None:
+        self._log_path = log_path
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = {}  # type: Dict[str, deque[Dict[str, Any]]]
+        self._request_counts = {}  # type: Dict[str, int]
+        self._pending_lines = []  # type: List[str]
+        self._flush_timer = None  # type: Optional[threading.Timer]
+
+    @property
+    def log_path(self) -> str:
+        return self._log_path
+
+    def measures_payload(self, method: str) -> bool:
+        """ Whether payload sizes of this request should be measured, see `PAYLOAD_SAMPLE_INTERVAL`. """
+
+        with self._lock:
+            count = self._request_counts.get(method, 0)
+            self._request_counts[method] = count + 1
+
+        return count % PAYLOAD_SAMPLE_INTERVAL == 0
+
+    def record(
+        self,
+        method: str,
+        latency_ms: float,
+        request_bytes: Optional[int],
+        response_bytes: Optional[int],
+        error: bool,
+    ) -> None:
+        """ Records a completed request. Payload sizes are None if they are not measured. """
+
+        sample = {
+            "time": time.time(),
+            "method": method,
+            "latencyMs": latency_ms,
+            "requestBytes": request_bytes,
+            "responseBytes": response_bytes,
+            "error": error,
+        }
+
+        with self._lock:
+            self._samples.setdefault(method, deque(maxlen=self._max_samples)).append(sample)
+
+            if not self._log_path:
+                return
+
+            self._pending_lines.append(json.dumps(sample) + "\n")
+
+            if not self._flush_timer:
+                self._flush_timer = threading.Timer(LOG_FLUSH_DELAY_S, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> None:
+        """ Appends buffered samples into the log file. """
+
+        with self._lock:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            lines, self._pending_lines = self._pending_lines, []
+
+        if not lines:
+            return
+
+        try:
+            with open(self._log_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError:
+            pass
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples = {method: list(method_samples) for method, method_samples in self._samples.items()}
+
+        summary = {}  # type: Dict[str, Dict[str, float]]
+
+        for method, method_samples in samples.items():
+            latencies = [s["latencyMs"] for s in method_samples]
+            sized_samples = [s for s in method_samples if s["requestBytes"] is not None]
+            summary[method] = {
+                "count": len(method_samples),
+                "errors": sum(1 for s in method_samples if s["error"]),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "avgRequestBytes": _average([s["requestBytes"] for s in sized_samples]),
+                "avgResponseBytes": _average([s["responseBytes"] for s in sized_samples]),
+            }
+
+        return summary
+
+    def report(self) -> str:
+        summary = self.summary()
+        header = "{:<40} {:>7} {:>6} {:>9} {:>9} {:>9} {:>11} {:>11}".format(
+            "method", "count", "errors", "p50 ms", "p95 ms", "p99 ms", "avg req B", "avg resp B"
+        )
+        lines = [header, "-" * len(header)]
+
+        # slowest methods first
+        for method, stats in sorted(summary.items(), key=lambda item: -item[1]["p95"]):
+            lines.append(
+                "{:<40} {count:>7} {errors:>6} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} "
+                "{avgRequestBytes:>11.0f} {avgResponseBytes:>11.0f}".format(method, **stats)
+            )
+
+        if self._log_path:
+            lines.extend(["", "Log file: {}".format(self._log_path)])
+
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+def instrument_request_latency(config_name: str, stats: Optional[RequestLatencyStats]) -> None:
+    """
+    Starts (or stops if `stats` is None) measuring request latencies of sessions of the config.
+
+    Like `configure_lsp_like_vscode()`, this wraps a method of LSP's `Session` class once.
+    """
+
+    if stats:
+        _instrumented_configs[config_name] = stats
+    else:
+        _instrumented_configs.pop(config_name, None)
+
+    if getattr(sessions, "__instrument_request_latency", False):
+        return
+
+    send_request_original = getattr(sessions.Session, _WRAPPED_METHOD)
+
+    def send_request_modified(self: Any, request: Any, on_result: Callable, on_error: Optional[Callable] = None) -> Any:
+        stats = _instrumented_configs.get(self.config.name)
+        if not stats:
+            return send_request_original(self, request, on_result, on_error)
+
+        method = request.method
+        measures_payload = stats.measures_payload(method)
+        request_bytes = _json_size(request.params) if measures_payload else None
+        time_start = time.perf_counter()
+
+        def on_result_modified(result: Any) -> None:
+            response_bytes = _json_size(result) if measures_payload else None
+            stats.record(method, (time.perf_counter() - time_start) * 1000, request_bytes, response_bytes, False)
+            on_result(result)
+
+        def on_error_modified(error: Any) -> None:
+            response_bytes = _json_size(error) if measures_payload else None
+            stats.record(method, (time.perf_counter() - time_start) * 1000, request_bytes, response_bytes, True)
+
+            if on_error:
+                on_error(error)
+            else:
+                _print_to_status_bar(error)
+
+        return send_request_original(self, request, on_result_modified, on_error_modified)
+
+    setattr(sessions.Session, _WRAPPED_METHOD, send_request_modified)
+
+    setattr(sessions, "__instrument_request_latency", True)
+
+
+def _print_to_status_bar(error: Any) -> None:
+    """ What LSP does with an error response if the request has no error handler. """
+
+    print_to_status_bar = getattr(sessions, "print_to_status_bar", None)
+    if print_to_status_bar:
+        print_to_status_bar(error)
+    else:
+        sublime.status_message(error.get("message", "") if isinstance(error, dict) else str(error))
+
+
+def _average(values: List[int]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def _json_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return 0
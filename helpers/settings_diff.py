@@ -0,0 +1,90 @@
+from .plugin_message import console_msg
+from LSP.plugin.core import sessions
+from typing import Any, Dict, List
+import hashlib
+import json
+import weakref
+
+__all__ = [
+    "canonical_hash",
+    "diff_settings",
+    "flatten_settings",
+    "suppress_noop_configuration_pushes",
+]
+
+DID_CHANGE_CONFIGURATION = "workspace/didChangeConfiguration"
+
+# configs whose no-op configuration pushes are suppressed
+_filtered_configs = set()  # type: set[str]
+
+# session => (hash, flattened settings) of the last pushed settings
+_last_pushed = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary[Any, tuple[str, Dict[str, Any]]]
+
+
+def canonical_hash(value: Any) -> str:
+    """ Calculates a hash of a JSON-serializable value which doesn't depend on the order of dict keys. """
+
+    dumped = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+    return hashlib.sha1(dumped.encode("utf-8")).hexdigest()
+
+
+def flatten_settings(value: Any, prefix: str = "") -> Dict[str, Any]:
+    """ Flattens nested dicts into a dict with dotted keys, like `{"python.analysis.extraPaths": [...]}`. """
+
+    if not isinstance(value, dict) or not value:
+        return {prefix: value} if prefix else {}
+
+    flattened = {}  # type: Dict[str, Any]
+    for key, sub_value in value.items():
+        flattened.update(flatten_settings(sub_value, "{}.{}".format(prefix, key) if prefix else str(key)))
+
+    return flattened
+
+
+def diff_settings(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """ Finds dotted keys whose values are different in flattened `old` and `new`. """
+
+    return sorted(key for key in old.keys() | new.keys() if old.get(key, KeyError) != new.get(key, KeyError))
+
+
+def suppress_noop_configuration_pushes(config_name: str) -> None:
+    """
+    Stops sending "workspace/didChangeConfiguration" to sessions of the config if settings are not changed.
+
+    The server may re-analyze the whole program for any configuration change, even if nothing changes.
+    Like `configure_lsp_like_vscode()`, this wraps a method of LSP's `Session` class once.
+    """
+
+    _filtered_configs.add(config_name)
+
+    if getattr(sessions, "__suppress_noop_configuration_pushes", False):
+        return
+
+    send_notification_original = sessions.Session.send_notification
+
+    def send_notification_modified(self: Any, notification: Any) -> Any:
+        if notification.method != DID_CHANGE_CONFIGURATION or self.config.name not in _filtered_configs:
+            return send_notification_original(self, notification)
+
+        settings = (notification.params or {}).get("settings")
+        settings_hash = canonical_hash(settings)
+        flattened = flatten_settings(settings)
+
+        last_pushed = _last_pushed.get(self)
+        if last_pushed:
+            last_hash, last_flattened = last_pushed
+
+            if last_hash == settings_hash:
+                console_msg("{_}: Skipped a no-op configuration push.")
+                return None
+
+            console_msg("{_}: Configuration changed: {}", ", ".join(diff_settings(last_flattened, flattened)))
+
+        _last_pushed[self] = (settings_hash, flattened)
+
+        return send_notification_original(self, notification)
+
+    sessions.Session.send_notification = send_notification_modified
+
+    setattr(sessions, "__suppress_noop_configuration_pushes", True)
@@ -1,4 +1,4 @@
-from typing import Iterable, Iterator, TypeVar, Union
+from typing import Iterable, Iterator, Sequence, TypeVar, Union
 import re
 
 T = TypeVar("T")
@@ -30,3 +30,24 @@ def get_command_name(var: Union[type, str]) -> str:
     name = re.sub(r"_{2,}", "_", name)
 
     return name.strip("_").lower()
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """
+    Calculates the percentile of values with linear interpolation.
+
+    :param      values:  The values, which don't have to be sorted
+    :param      p:       The percentile in [0, 100]
+
+    :returns:   The percentile, 0 if there is no value.
+    """
+
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    rank = (len(values) - 1) * max(0.0, min(p, 100.0)) / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
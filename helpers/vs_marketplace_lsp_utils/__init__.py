@@ -1,7 +1,10 @@
 from .server_vs_marketplace_resource import DOWNLOAD_FROM_MARKETPLACE
 from .server_vs_marketplace_resource import DOWNLOAD_FROM_PVSC
+from .server_vs_marketplace_resource import EXTRACTION_MODE_ALL
+from .server_vs_marketplace_resource import EXTRACTION_MODE_SERVER
 from .server_vs_marketplace_resource import ServerVsMarketplaceResource
 from .typing import SemanticVersion
+from .versions import version_sort_key
 from .vs_marketplace_client_handler import VsMarketplaceClientHandler
 from .vscode_settings import configure_lsp_like_vscode
 from .vscode_settings import configure_server_settings_like_vscode
@@ -11,7 +14,10 @@ __all__ = [
     "configure_server_settings_like_vscode",
     "DOWNLOAD_FROM_MARKETPLACE",
     "DOWNLOAD_FROM_PVSC",
+    "EXTRACTION_MODE_ALL",
+    "EXTRACTION_MODE_SERVER",
     "SemanticVersion",
     "ServerVsMarketplaceResource",
+    "version_sort_key",
     "VsMarketplaceClientHandler",
 ]
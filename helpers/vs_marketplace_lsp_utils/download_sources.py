@@ -0,0 +1,109 @@
+from LSP.plugin.core.typing import Dict, List, Optional
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+__all__ = [
+    "DownloadSource",
+    "probe_sources",
+]
+
+# the file name in a mirror which doesn't specify one, the same as blobs of "pvsc"
+DEFAULT_MIRROR_FILE_NAME = "{name}-{version}.vsix"
+
+# how many bytes from the start of the file a probe requests, enough to measure the throughput
+PROBE_BYTES = 256 * 1024
+
+
+class DownloadSource:
+    """
+    A place where the VSIX file can be downloaded from.
+
+    The location is a URL (http, https or file) or a local directory/file path, which may contain
+    "{vendor}", "{name}" and "{version}" placeholders. A location without "{version}" is a directory
+    which has "{name}-{version}.vsix" files.
+    """
+
+    def __init__(self, name: str, location: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.name = name
+        self.location = location
+        self.headers = headers or {}
+        self.latency_s = None  # type: Optional[float]
+        """ The time to the first byte of the probe, None if not probed or failed. """
+        self.throughput = 0.0
+        """ The bytes per second of the probe after the first byte, 0 if not probed or failed. """
+        self.error = ""
+
+    def __repr__(self) -> str:
+        return "DownloadSource({!r}, {!r})".format(self.name, self.location)
+
+    @property
+    def is_local(self) -> bool:
+        scheme = urllib.parse.urlparse(self.location).scheme
+        # a Windows drive letter looks like a scheme
+        return len(scheme) <= 1 or scheme == "file"
+
+    def resolve(self, vendor: str, name: str, version: str) -> str:
+        """ Gets the URL (or the local path for local sources) of the VSIX file. """
+
+        location = self.location
+        if "{version}" not in location:
+            location = location.rstrip("/\\") + "/" + DEFAULT_MIRROR_FILE_NAME
+
+        location = location.format_map({"vendor": vendor, "name": name, "version": version})
+
+        if location.startswith("file:"):
+            return urllib.request.url2pathname(urllib.parse.urlparse(location).path)
+
+        return os.path.expanduser(location) if self.is_local else location
+
+
+def probe_sources(sources: List[DownloadSource], urls: List[str], timeout: float = 10) -> List[DownloadSource]:
+    """
+    Probes remote sources concurrently by requesting the first `PROBE_BYTES` of the file,
+    which measures both the latency and the throughput of each source.
+
+    :param      sources:  The remote sources
+    :param      urls:     The resolved URL of each source
+    :param      timeout:  The socket timeout in seconds
+
+    :returns:   Healthy sources, the one with the highest throughput goes first
+    """
+
+    def probe(source: DownloadSource, url: str) -> None:
+        headers = source.headers.copy()
+        headers["Range"] = "bytes=0-{}".format(PROBE_BYTES - 1)
+        time_start = time.perf_counter()
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url=url, headers=headers), timeout=timeout) as resp:
+                received = len(resp.read(1))
+                time_first_byte = time.perf_counter()
+                # a source which ignores the range sends the whole file, only read as much as requested
+                while received < PROBE_BYTES:
+                    chunk = resp.read(PROBE_BYTES - received)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+            elapsed_s = time.perf_counter() - time_first_byte
+            source.latency_s = time_first_byte - time_start
+            source.throughput = (received - 1) / elapsed_s if received > 1 and elapsed_s > 0 else 0.0
+        except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            source.latency_s = None
+            source.throughput = 0.0
+            source.error = str(getattr(e, "code", "") or getattr(e, "reason", "") or e)
+
+    threads = [threading.Thread(target=probe, args=(s, u), daemon=True) for s, u in zip(sources, urls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout + 1)
+
+    healthy = [source for source in sources if source.latency_s is not None]
+
+    # a tiny file can't tell the throughput, then the latency decides
+    return sorted(healthy, key=lambda source: (-source.throughput, source.latency_s or 0.0))
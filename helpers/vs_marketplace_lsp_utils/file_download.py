@@ -0,0 +1,170 @@
+from LSP.plugin.core.typing import Callable, Dict, Optional
+import http.client
+import os
+import socket
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+__all__ = [
+    "DownloadStats",
+    "download_file",
+]
+
+# the size of each chunk read from the response and written to the disk
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadStats:
+    """ The statistics of a (possibly resumed) download """
+
+    def __init__(self, url: str, path: str) -> None:
+        self.url = url
+        self.path = path
+        self.total_bytes = 0  # type: int
+        """ The expected size of the whole file, 0 if unknown. """
+        self.resumed_bytes = 0  # type: int
+        """ Bytes which were already on the disk before this download starts. """
+        self.received_bytes = 0  # type: int
+        """ Bytes of the file which have been received so far, including resumed ones. """
+        self.downloaded_bytes = 0  # type: int
+        """ Bytes which are transferred by this download, in all attempts. """
+        self.elapsed_s = 0.0  # type: float
+        self.attempts = 0  # type: int
+
+    @property
+    def throughput(self) -> float:
+        """ The transferred bytes per second. """
+
+        return self.downloaded_bytes / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+
+def download_file(
+    url: str,
+    dst: str,
+    headers: Optional[Dict[str, str]] = None,
+    max_attempts: int = 3,
+    timeout: float = 30,
+    on_progress: Optional[Callable[[DownloadStats], None]] = None,
+    progress_interval: float = 1,
+) -> DownloadStats:
+    """
+    Downloads the `url` into the `dst` file chunk by chunk.
+
+    The payload is streamed into `dst + ".part"` which is renamed to `dst` once completed.
+    If a previous transfer has been interrupted, the existing ".part" file is resumed with a HTTP Range request.
+
+    :param      url:                The URL
+    :param      dst:                The destination file path
+    :param      headers:            Additional request headers
+    :param      max_attempts:       How many times we try before giving up
+    :param      timeout:            The socket timeout in seconds
+    :param      on_progress:        The callback which is called periodically during the download
+    :param      progress_interval:  The minimum interval in seconds between two `on_progress` calls
+
+    :returns:   The download statistics
+    """
+
+    part_path = dst + ".part"
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+
+    stats = DownloadStats(url, dst)
+    time_start = time.perf_counter()
+    last_error = None  # type: Optional[Exception]
+
+    while stats.attempts < max_attempts:
+        stats.attempts += 1
+
+        try:
+            _download_file_attempt(url, part_path, headers or {}, timeout, stats, on_progress, progress_interval)
+        except urllib.error.HTTPError:
+            # the server refuses us, retrying doesn't help
+            raise
+        except (urllib.error.URLError, socket.timeout, ConnectionError, http.client.IncompleteRead) as e:
+            last_error = e
+            continue
+        finally:
+            stats.elapsed_s = time.perf_counter() - time_start
+
+        os.replace(part_path, dst)
+
+        if on_progress:
+            on_progress(stats)
+
+        return stats
+
+    raise RuntimeError('Failed to download "{}" after {} attempts: {}'.format(url, stats.attempts, last_error))
+
+
+def _download_file_attempt(
+    url: str,
+    part_path: str,
+    headers: Dict[str, str],
+    timeout: float,
+    stats: DownloadStats,
+    on_progress: Optional[Callable[[DownloadStats], None]],
+    progress_interval: float,
+) -> None:
+    headers = headers.copy()
+    # VSIX is already a zip file, compressing it again only prevents us from resuming
+    headers["Accept-Encoding"] = "identity"
+
+    part_size = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    if part_size:
+        headers["Range"] = "bytes={}-".format(part_size)
+
+    req = urllib.request.Request(url=url, headers=headers)
+
+    try:
+        resp = urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        # 416: the ".part" file is probably corrupted, start over
+        if e.code == 416 and part_size:
+            os.remove(part_path)
+            raise urllib.error.URLError("Range not satisfiable")
+        raise
+
+    with resp:
+        is_resumed = part_size > 0 and resp.status == 206
+        is_gzipped = resp.info().get("Content-Encoding") == "gzip"
+        content_length = int(resp.info().get("Content-Length") or 0)
+
+        if not is_resumed:
+            part_size = 0
+            stats.total_bytes = content_length
+        elif content_length:
+            stats.total_bytes = part_size + content_length
+
+        # bytes kept from our previous attempts are not resumed ones
+        if stats.attempts == 1:
+            stats.resumed_bytes = part_size
+        stats.received_bytes = part_size
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if is_gzipped else None
+        last_progress_time = time.perf_counter()
+
+        with open(part_path, "ab" if is_resumed else "wb") as f:
+            try:
+                while True:
+                    chunk = resp.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    stats.downloaded_bytes += len(chunk)
+                    stats.received_bytes += len(chunk)
+                    f.write(decompressor.decompress(chunk) if decompressor else chunk)
+
+                    if on_progress and time.perf_counter() - last_progress_time >= progress_interval:
+                        last_progress_time = time.perf_counter()
+                        on_progress(stats)
+
+                if decompressor:
+                    f.write(decompressor.flush())
+            except Exception:
+                # a partially decompressed stream can not be resumed
+                if decompressor:
+                    f.truncate(0)
+                raise
+
+    if stats.total_bytes and not is_gzipped and os.path.getsize(part_path) < stats.total_bytes:
+        raise urllib.error.ContentTooShortError("Extension was downloaded incompletely...", None)
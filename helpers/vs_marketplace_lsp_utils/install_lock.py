@@ -0,0 +1,190 @@
+from LSP.plugin.core.typing import Any, Callable, Dict, Optional
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+
+__all__ = [
+    "InstallLock",
+    "InstallLockTimeout",
+    "install_lock_path",
+]
+
+
+def install_lock_path(package_storage: str, extension_uid: str, extension_version: str) -> str:
+    """ The lock file of installing (or deleting) a server version, shared by all processes. """
+
+    return os.path.join(package_storage, ".locks", "{}~{}.lock".format(extension_uid, extension_version))
+
+
+class InstallLockTimeout(RuntimeError):
+    pass
+
+
+class InstallLock:
+    """
+    A cross-process lock file, which works on all platforms and doesn't need any OS-level file locking.
+
+    The lock file is created exclusively and records its owner. The owner keeps touching it while holding it,
+    so a lock file which isn't touched for `stale_after` seconds (or whose owner process has died) is
+    considered abandoned and is taken over.
+
+        with InstallLock(path):
+            ...
+    """
+
+    def __init__(
+        self,
+        path: str,
+        timeout: float = 600,
+        stale_after: float = 60,
+        poll_interval: float = 0.5,
+        on_wait: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> None:
+        """
+        :param      path:           The lock file path
+        :param      timeout:        Seconds to wait for the lock before raising `InstallLockTimeout`
+        :param      stale_after:    Seconds after which an untouched lock file is abandoned
+        :param      poll_interval:  Seconds between attempts
+        :param      on_wait:        Called once with the owner information if the lock has to be waited for
+        """
+
+        self._path = path
+        self._timeout = timeout
+        self._stale_after = stale_after
+        self._poll_interval = poll_interval
+        self._on_wait = on_wait
+        self._token = secrets.token_hex(8)
+        self._heartbeat = None  # type: Optional[threading.Thread]
+        self._released = threading.Event()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def acquire(self) -> None:
+        time_start = time.monotonic()
+        waited = False
+
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+
+        while True:
+            if self._try_create():
+                break
+
+            owner = self._read_owner()
+            if owner is not None and self._is_stale(owner):
+                self._break_stale(owner)
+                continue
+
+            if not waited:
+                waited = True
+                if self._on_wait:
+                    self._on_wait(owner or {})
+
+            if time.monotonic() - time_start > self._timeout:
+                raise InstallLockTimeout(
+                    'Timed out after {:g} seconds waiting for the lock "{}" held by {}'.format(
+                        self._timeout,
+                        self._path,
+                        owner,
+                    )
+                )
+
+            time.sleep(self._poll_interval)
+
+        self._released.clear()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    def release(self) -> None:
+        self._released.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+        owner = self._read_owner()
+        if owner and owner.get("token") == self._token:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def __enter__(self) -> "InstallLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.release()
+
+    def _try_create(self) -> bool:
+        try:
+            fd = os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+
+        owner = {"token": self._token, "pid": os.getpid(), "host": socket.gethostname(), "time": time.time()}
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(owner, f)
+
+        return True
+
+    def _read_owner(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                owner = json.load(f)
+            owner["mtime"] = os.path.getmtime(self._path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # being written by its owner, or corrupted, which is considered stale eventually
+            try:
+                return {"mtime": os.path.getmtime(self._path)}
+            except OSError:
+                return None
+
+        return owner if isinstance(owner, dict) else {}
+
+    def _is_stale(self, owner: Dict[str, Any]) -> bool:
+        if time.time() - owner.get("mtime", 0) > self._stale_after:
+            return True
+
+        # only a process on the same host can be checked, and `os.kill()` terminates the process on Windows
+        if os.name == "posix" and owner.get("host") == socket.gethostname() and owner.get("pid"):
+            try:
+                os.kill(owner["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                pass
+
+        return False
+
+    def _break_stale(self, owner: Dict[str, Any]) -> None:
+        # rename before checking so the lock which a competitor has just taken over is not removed
+        stale_path = "{}.stale-{}".format(self._path, self._token)
+
+        try:
+            os.replace(self._path, stale_path)
+        except OSError:
+            return
+
+        try:
+            with open(stale_path, "r", encoding="utf-8") as f:
+                token = json.load(f).get("token")
+        except (OSError, ValueError, AttributeError):
+            token = owner.get("token")
+
+        if token != owner.get("token") and not os.path.exists(self._path):
+            os.replace(stale_path, self._path)
+        else:
+            os.remove(stale_path)
+
+    def _beat(self) -> None:
+        while not self._released.wait(self._stale_after / 4):
+            try:
+                os.utime(self._path)
+            except OSError:
+                pass
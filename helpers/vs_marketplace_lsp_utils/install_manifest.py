@@ -0,0 +1,104 @@
+from .vsix_cache import file_sha256
+from LSP.plugin.core.typing import Any, Dict, Optional
+import json
+import os
+
+__all__ = [
+    "INSTALL_VERIFICATION_FAST",
+    "INSTALL_VERIFICATION_FULL",
+    "MANIFEST_FILE",
+    "read_manifest",
+    "verify_manifest",
+    "write_manifest",
+]
+
+# only compare the size and mtime of the key file (such as the server binary), which is O(1)
+INSTALL_VERIFICATION_FAST = "fast"
+# compare sizes, mtimes and SHA-256 hashes of all files
+INSTALL_VERIFICATION_FULL = "full"
+
+# the manifest file in the server directory
+MANIFEST_FILE = ".install-manifest.json"
+
+
+def write_manifest(root: str, file_hashes: Dict[str, str], **extra: Any) -> Dict[str, Any]:
+    """
+    Writes the manifest of installed files into `root`.
+
+    :param      root:         The installation root directory
+    :param      file_hashes:  The SHA-256 hex digests of installed files keyed by "/"-separated paths relative to `root`
+    :param      extra:        Additional information to be recorded in the manifest
+
+    :returns:   The manifest
+    """
+
+    files = {}  # type: Dict[str, Dict[str, Any]]
+
+    for name, sha256 in sorted(file_hashes.items()):
+        stat = os.stat(_file_path(root, name))
+        files[name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+    manifest = dict(extra, files=files)
+
+    # write it last and atomically, so having a manifest means the installation has been completed
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return manifest
+
+
+def read_manifest(root: str) -> Optional[Dict[str, Any]]:
+    """ Reads the manifest in `root`, None if there is no valid one. """
+
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return manifest if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict) else None
+
+
+def verify_manifest(root: str, key_file: str, mode: str = INSTALL_VERIFICATION_FAST) -> bool:
+    """
+    Verifies installed files in `root` against its manifest.
+
+    :param      root:      The installation root directory
+    :param      key_file:  The "/"-separated path (relative to `root`) of the file which must be installed
+    :param      mode:      "fast" only checks the size and mtime of `key_file` while "full" checks sizes, mtimes
+                           and SHA-256 hashes of all files
+
+    :returns:   True if files are intact, False otherwise.
+    """
+
+    manifest = read_manifest(root)
+    if not manifest or key_file not in manifest["files"]:
+        return False
+
+    if mode == INSTALL_VERIFICATION_FULL:
+        names = list(manifest["files"].keys())
+    else:
+        names = [key_file]
+
+    for name in names:
+        record = manifest["files"][name]
+        path = _file_path(root, name)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        if stat.st_size != record.get("size") or stat.st_mtime_ns != record.get("mtime_ns"):
+            return False
+
+        if mode == INSTALL_VERIFICATION_FULL and file_sha256(path) != record.get("sha256"):
+            return False
+
+    return True
+
+
+def _file_path(root: str, name: str) -> str:
+    return os.path.join(root, *name.split("/"))
@@ -0,0 +1,118 @@
+from LSP.plugin.core.typing import Any
+import os
+import subprocess
+import sublime
+
+__all__ = [
+    "COMPILE_CACHE_DIR",
+    "hidden_startupinfo",
+    "LAUNCH_JS",
+    "write_launcher",
+    "write_script",
+]
+
+# The server directory sub-directory for V8 code caches. Caches are further separated by node versions.
+COMPILE_CACHE_DIR = ".v8-cache"
+
+# Runs a server bundle with a persistent V8 code cache:
+#
+#     node [node arguments] launch.js <cache dir> <bundle> [server arguments]
+#
+# The cache is skipped if the cache dir is "". When required as a module, it exports
+# `compile()` and `run()` so the standby process of the warm pool can use it too.
+LAUNCH_JS = r"""
+"use strict";
+const fs = require("fs");
+const path = require("path");
+const vm = require("vm");
+const Module = require("module");
+
+// the cache is created once the server has run for a while so lazily compiled functions are included
+const CACHE_DELAY_MS = 10000;
+
+function compile(bundlePath, cacheDir) {
+    const source = Module.wrap(fs.readFileSync(bundlePath, "utf8"));
+    if (!cacheDir) {
+        return new vm.Script(source, { filename: bundlePath });
+    }
+
+    const cachePath = path.join(cacheDir, process.version + "-" + process.arch, path.basename(bundlePath) + ".cache");
+    let cachedData;
+    try {
+        cachedData = fs.readFileSync(cachePath);
+    } catch (e) {}
+
+    const script = new vm.Script(source, { filename: bundlePath, cachedData });
+    if (!cachedData || script.cachedDataRejected) {
+        let saved = false;
+        const save = () => {
+            if (saved) {
+                return;
+            }
+            saved = true;
+            try {
+                fs.mkdirSync(path.dirname(cachePath), { recursive: true });
+                fs.writeFileSync(cachePath + ".tmp" + process.pid, script.createCachedData());
+                fs.renameSync(cachePath + ".tmp" + process.pid, cachePath);
+            } catch (e) {}
+        };
+        setTimeout(save, CACHE_DELAY_MS).unref();
+        process.on("exit", save);
+    }
+    return script;
+}
+
+function run(script, bundlePath, args) {
+    process.argv = [process.argv[0], bundlePath, ...args];
+    const mod = new Module(bundlePath, null);
+    mod.filename = bundlePath;
+    mod.paths = Module._nodeModulePaths(path.dirname(bundlePath));
+    process.mainModule = mod;
+    script.runInThisContext().call(
+        mod.exports, mod.exports, Module.createRequire(bundlePath), mod, bundlePath, path.dirname(bundlePath)
+    );
+}
+
+module.exports = { compile, run };
+
+if (require.main === module) {
+    const [cacheDir, bundleArg, ...args] = process.argv.slice(2);
+    const bundlePath = path.resolve(bundleArg);
+    run(compile(bundlePath, cacheDir), bundlePath, args);
+}
+""".lstrip()
+
+
+def write_launcher(scripts_dir: str) -> str:
+    """ Writes `launch.js` into the directory and returns its path. """
+
+    launcher_path = os.path.join(scripts_dir, "launch.js")
+    write_script(launcher_path, LAUNCH_JS)
+
+    return launcher_path
+
+
+def write_script(path: str, content: str) -> None:
+    """ Writes a script file unless it already has the content. """
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def hidden_startupinfo() -> Any:
+    """ Gets the `startupinfo` for `subprocess.Popen()` which doesn't pop up a console window on Windows. """
+
+    if sublime.platform() != "windows":
+        return None
+
+    startupinfo = subprocess.STARTUPINFO()  # type: ignore
+    startupinfo.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW  # type: ignore
+    return startupinfo
@@ -0,0 +1,93 @@
+from LSP.plugin.core.typing import Optional
+import os
+import subprocess
+import sys
+
+__all__ = [
+    "can_find_pid_by_env",
+    "find_pid_by_env",
+    "rss_bytes",
+]
+
+PROC_DIR = "/proc"
+
+
+def can_find_pid_by_env() -> bool:
+    """ Whether `find_pid_by_env()` works on this platform, which is Linux (`/proc`) or macOS (`ps -E`). """
+
+    return os.path.isdir(PROC_DIR) or sys.platform == "darwin"
+
+
+def find_pid_by_env(name: str, value: str) -> Optional[int]:
+    """
+    Finds the process which has the environment variable. See `can_find_pid_by_env()` for supported platforms.
+
+    :param      name:   The environment variable name
+    :param      value:  The environment variable value
+
+    :returns:   The PID, None if not found
+    """
+
+    needle = "{}={}".format(name, value).encode("utf-8")
+
+    if sys.platform == "darwin":
+        return _find_pid_by_env_with_ps(needle)
+
+    try:
+        entries = os.listdir(PROC_DIR)
+    except OSError:
+        return None
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(os.path.join(PROC_DIR, entry, "environ"), "rb") as f:
+                if needle in f.read().split(b"\0"):
+                    return int(entry)
+        except OSError:
+            continue
+
+    return None
+
+
+def _find_pid_by_env_with_ps(needle: bytes) -> Optional[int]:
+    # environments are appended to commands, only for processes of the same user
+    try:
+        output = subprocess.check_output(
+            ["ps", "-E", "-ww", "-x", "-o", "pid=", "-o", "command="],
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    for line in output.splitlines():
+        pid, _, command = line.strip().partition(b" ")
+        if needle in command.split() and pid.isdigit():
+            return int(pid)
+
+    return None
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """ Gets the resident set size of the process, None if the process doesn't exist. """
+
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "statm"), "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        if os.path.isdir(PROC_DIR):
+            return None
+    except (IndexError, ValueError):
+        return None
+
+    # no "/proc", such as on macOS
+    if os.name != "posix":
+        return None
+
+    try:
+        output = subprocess.check_output(["ps", "-o", "rss=", "-p", str(pid)], stderr=subprocess.DEVNULL)
+        return int(output.strip()) * 1024
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
@@ -0,0 +1,85 @@
+from LSP.plugin.core.typing import Dict, List, Tuple
+import hashlib
+import json
+import os
+
+__all__ = [
+    "RESOURCES_MANIFEST_FILE",
+    "sync_files",
+]
+
+# the manifest of synced resource files in the server directory
+RESOURCES_MANIFEST_FILE = ".resources-manifest.json"
+
+
+def sync_files(root: str, files: Dict[str, bytes], managed_dirs: List[str]) -> Tuple[int, int]:
+    """
+    Makes files under `root` the same as `files` but only writes changed files,
+    so unchanged files keep their mtimes and don't have to be parsed again by the server.
+
+    :param      root:          The root directory
+    :param      files:         File contents keyed by "/"-separated paths relative to `root`
+    :param      managed_dirs:  Directories (relative to `root`) which are synced, previously synced files
+                               in them which are no longer in `files` are deleted
+
+    :returns:   The amount of (written, deleted) files
+    """
+
+    manifest_path = os.path.join(root, RESOURCES_MANIFEST_FILE)
+    manifest = _read_manifest(manifest_path)
+    new_manifest = {}  # type: Dict[str, Dict[str, object]]
+    written = deleted = 0
+
+    for name, content in sorted(files.items()):
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = os.path.join(root, *name.split("/"))
+        new_manifest[name] = {"size": len(content), "sha256": sha256}
+
+        # the size check catches most local modifications without hashing the file on the disk
+        if manifest.get(name) == new_manifest[name] and _file_size(path) == len(content):
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+        written += 1
+
+    prefixes = tuple(d.strip("/") + "/" for d in managed_dirs)
+    for name in manifest:
+        if name in new_manifest or not name.startswith(prefixes):
+            continue
+
+        try:
+            os.remove(os.path.join(root, *name.split("/")))
+            deleted += 1
+        except OSError:
+            pass
+
+    # keep records of files which are not managed this time
+    for name, record in manifest.items():
+        if not name.startswith(prefixes):
+            new_manifest[name] = record
+
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(new_manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return written, deleted
+
+
+def _read_manifest(path: str) -> Dict[str, Dict[str, object]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return -1
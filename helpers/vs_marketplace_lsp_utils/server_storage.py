@@ -0,0 +1,269 @@
+from .install_lock import install_lock_path
+from .install_lock import InstallLock
+from .install_lock import InstallLockTimeout
+from .install_manifest import MANIFEST_FILE
+from LSP.plugin.core.typing import Any, Callable, Dict, Iterable, List, Optional
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+__all__ = ["ServerStorage"]
+
+# the file in the package storage which records when each server version is used last time
+USAGE_FILE = ".server-usage.json"
+
+# leftover staging/trash directories older than this are from crashed installations
+LEFTOVER_MAX_AGE_S = 86400
+
+# versions used this recently may still be running in other processes (such as another Sublime Text instance)
+RECENT_USE_S = 3 * 86400
+
+
+class ServerStorage:
+    """
+    Manages installed server versions ("<uid>~<version>" directories) in the package storage.
+
+    Besides versions in use (by this process, or recently by any process), the most recently used versions
+    are kept for rollbacks. Other versions are deleted, the least recently used one first, until the total size
+    fits the budget (if there is one). A version is deleted while holding its install lock, and skipped if that
+    is taken.
+    """
+
+    def __init__(self, package_storage: str, extension_uid: str) -> None:
+        self._package_storage = package_storage
+        self._extension_uid = extension_uid
+        self._lock = threading.Lock()
+        self._collecting = False
+
+    @property
+    def usage_path(self) -> str:
+        return os.path.join(self._package_storage, USAGE_FILE)
+
+    def touch(self, version: str) -> None:
+        """ Records that the server version is used now. """
+
+        with self._lock:
+            usage = self._read_usage()
+            usage[version] = time.time()
+            self._write_usage(usage)
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """
+        Gets installed server versions with their disk usages.
+
+        :returns:   Versions, the least recently used one first
+        """
+
+        prefix = self._extension_uid + "~"
+
+        with self._lock:
+            usage = self._read_usage()
+
+        try:
+            dir_names = os.listdir(self._package_storage)
+        except OSError:
+            return []
+
+        versions = []
+        for dir_name in dir_names:
+            version = dir_name[len(prefix):]
+            server_dir = os.path.join(self._package_storage, dir_name)
+
+            # staging/trash directories are not versions
+            if not dir_name.startswith(prefix) or re.search(r"\.(staging|trash)-\d+$", version):
+                continue
+
+            manifest_path = os.path.join(server_dir, MANIFEST_FILE)
+            try:
+                installed_at = os.path.getmtime(manifest_path)
+            except OSError:
+                installed_at = 0.0
+
+            vsix_files = self._vsix_files(version)
+
+            versions.append(
+                {
+                    "version": version,
+                    "directory": server_dir,
+                    "size": _tree_size(server_dir),
+                    "vsixSize": sum(_file_size(path) for path in vsix_files),
+                    "lastUsed": usage.get(version) or installed_at,
+                    "complete": bool(installed_at),
+                }
+            )
+
+        return sorted(versions, key=lambda v: v["lastUsed"])
+
+    def collect(self, keep_versions: Iterable[str], keep_recent: int, budget_bytes: int) -> List[str]:
+        """
+        Deletes old server versions and leftovers of crashed installations.
+
+        :param      keep_versions:  Versions which are never deleted, such as the ones in use
+        :param      keep_recent:    The amount of most recently used versions which are kept besides `keep_versions`
+        :param      budget_bytes:   Other versions are deleted until the total size fits this, 0 means no limit
+
+        :returns:   Deleted versions
+        """
+
+        keep = set(keep_versions)
+        versions = self.versions()
+        keep.update(v["version"] for v in versions if time.time() - v["lastUsed"] < RECENT_USE_S)
+        rollbacks = [v["version"] for v in reversed(versions) if v["version"] not in keep][: max(0, keep_recent)]
+        keep.update(rollbacks)
+
+        total = sum(v["size"] + v["vsixSize"] for v in versions)
+        deleted = []  # type: List[str]
+
+        for version in versions:
+            if budget_bytes <= 0 or total <= budget_bytes:
+                break
+
+            if version["version"] in keep:
+                continue
+
+            lock = InstallLock(
+                install_lock_path(self._package_storage, self._extension_uid, version["version"]),
+                timeout=0,
+                poll_interval=0,
+            )
+            try:
+                lock.acquire()
+            except InstallLockTimeout:
+                # being installed by another process
+                continue
+
+            try:
+                shutil.rmtree(version["directory"], ignore_errors=True)
+                for path in self._vsix_files(version["version"]):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            finally:
+                lock.release()
+
+            total -= version["size"] + version["vsixSize"]
+            deleted.append(version["version"])
+
+        with self._lock:
+            usage = self._read_usage()
+            for version_name in deleted:
+                usage.pop(version_name, None)
+            self._write_usage(usage)
+
+        self._delete_leftovers()
+
+        return deleted
+
+    def collect_async(
+        self,
+        keep_versions: Iterable[str],
+        keep_recent: int,
+        budget_bytes: int,
+        on_done: Optional[Callable[[List[str]], None]] = None,
+    ) -> None:
+        """ Same as `collect()` but runs in a background thread. `on_done` is called with deleted versions. """
+
+        with self._lock:
+            if self._collecting:
+                return
+            self._collecting = True
+
+        keep_versions = list(keep_versions)
+
+        def run() -> None:
+            try:
+                deleted = self.collect(keep_versions, keep_recent, budget_bytes)
+            finally:
+                with self._lock:
+                    self._collecting = False
+
+            if on_done:
+                on_done(deleted)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def report(self, keep_versions: Iterable[str]) -> str:
+        keep = set(keep_versions)
+        versions = self.versions()
+        now = time.time()
+
+        lines = [
+            "# Installed servers: {:.1f} MiB".format(sum(v["size"] + v["vsixSize"] for v in versions) / 1024 / 1024),
+            "",
+            "{:>9} {:>9} {:>14}  {}".format("MiB", "VSIX MiB", "last used", "version"),
+        ]
+
+        # the most recently used one first
+        for version in reversed(versions):
+            last_used = "{:.1f} days ago".format((now - version["lastUsed"]) / 86400)
+            lines.append(
+                "{:>9.1f} {:>9.1f} {:>14}  {}{}".format(
+                    version["size"] / 1024 / 1024,
+                    version["vsixSize"] / 1024 / 1024,
+                    "in use" if version["version"] in keep else last_used,
+                    version["version"],
+                    "" if version["complete"] else " (incomplete)",
+                )
+            )
+
+        lines.extend(["", "Folder: {}".format(self._package_storage)])
+
+        return "\n".join(lines) + "\n"
+
+    def _vsix_files(self, version: str) -> List[str]:
+        pattern = "{}~{}~*.vsix".format(glob.escape(self._extension_uid), glob.escape(version))
+
+        return glob.glob(os.path.join(glob.escape(self._package_storage), ".vsix-cache", pattern))
+
+    def _delete_leftovers(self) -> None:
+        pattern = glob.escape(self._extension_uid) + "~*.*-*"
+
+        for path in glob.glob(os.path.join(glob.escape(self._package_storage), pattern)):
+            if not re.search(r"\.(staging|trash)-\d+$", path):
+                continue
+
+            try:
+                if time.time() - os.path.getmtime(path) > LEFTOVER_MAX_AGE_S:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def _read_usage(self) -> Dict[str, float]:
+        try:
+            with open(self.usage_path, "r", encoding="utf-8") as f:
+                usage = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        return usage if isinstance(usage, dict) else {}
+
+    def _write_usage(self, usage: Dict[str, float]) -> None:
+        try:
+            os.makedirs(self._package_storage, exist_ok=True)
+            with open(self.usage_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(usage, f)
+            os.replace(self.usage_path + ".tmp", self.usage_path)
+        except OSError:
+            pass
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            size += _file_size(os.path.join(dirpath, filename))
+
+    return size
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -1,6 +1,14 @@
+from .install_manifest import INSTALL_VERIFICATION_FAST
+from .install_manifest import INSTALL_VERIFICATION_FULL
+from .install_manifest import MANIFEST_FILE
+from .install_manifest import read_manifest
+from .install_manifest import verify_manifest
+from .install_manifest import write_manifest
 from .typing import SemanticVersion
 from .vscode_settings import VSCODE_CLIENTINFO
-from LSP.plugin.core.typing import Dict, List, Optional
+from .vsix_cache import VsixCache
+from LSP.plugin.core.typing import Any, Callable, Dict, List, Optional
+from typing import TYPE_CHECKING
 from lsp_utils import ServerResourceInterface
 from lsp_utils import ServerStatus
 from lsp_utils.helpers import log_and_show_message
@@ -9,19 +17,22 @@ from lsp_utils.helpers import run_command_sync
 from lsp_utils.helpers import version_to_string
 from lsp_utils.server_npm_resource import NodeVersionResolver
 from sublime_lib import ResourcePath
-import gzip
-import io
+import json
 import os
 import re
 import shutil
 import sublime
-import urllib.error
-import urllib.request
-import zipfile
+import threading
+import time
+
+if TYPE_CHECKING:
+    from .download_sources import DownloadSource
 
 __all__ = [
     "DOWNLOAD_FROM_MARKETPLACE",
     "DOWNLOAD_FROM_PVSC",
+    "EXTRACTION_MODE_ALL",
+    "EXTRACTION_MODE_SERVER",
     "ServerVsMarketplaceResource",
 ]
 
@@ -29,25 +40,93 @@ __all__ = [
 DOWNLOAD_FROM_MARKETPLACE = "marketplace"
 DOWNLOAD_FROM_PVSC = "pvsc"
 
+EXTRACTION_MODE_ALL = "all"
+EXTRACTION_MODE_SERVER = "server"
+
+MIB = 1024 * 1024
+
+# the file in the package storage which caches the resolved node version
+NODE_VERSION_CACHE_FILE = ".node-version-cache.json"
+
+# the file in the package storage which caches discovered extension versions
+VERSION_DISCOVERY_CACHE_FILE = ".version-discovery-cache.json"
+
 
 class NodeVersionResolver:
     """
     A singleton for resolving Node version once per session.
+
+    The resolved version is also persisted with the identity (realpath, size and mtime) of the node binary,
+    so later sessions skip the `node --version` subprocess unless the node binary changes.
     """
 
     def __init__(self) -> None:
         self._version = None  # type: Optional[SemanticVersion]
 
-    def resolve(self) -> Optional[SemanticVersion]:
+    def resolve(self, node_path: Optional[str] = None, cache_path: Optional[str] = None) -> Optional[SemanticVersion]:
         if self._version:
             return self._version
-        version, error = run_command_sync(["node", "--version"])
-        if error is not None:
-            log_and_show_message("lsp_utils(NodeVersionResolver): Error resolving node version: {}!".format(error))
-        else:
-            self._version = parse_version(version)
+
+        time_start = time.perf_counter()
+        identity = self._binary_identity(node_path or shutil.which("node"))
+        resolved_by = "cache"
+
+        version = self._load_cache(cache_path, identity) if cache_path and identity else None
+        if not version:
+            resolved_by = "subprocess"
+            output, error = run_command_sync(["node", "--version"])
+            if error is not None:
+                log_and_show_message("lsp_utils(NodeVersionResolver): Error resolving node version: {}!".format(error))
+                return None
+            version = parse_version(output)
+            if cache_path and identity:
+                self._save_cache(cache_path, identity, version)
+
+        self._version = version
+        log_and_show_message(
+            "lsp_utils(NodeVersionResolver): Resolved node {} in {:.1f} ms (by {})".format(
+                version_to_string(version),
+                (time.perf_counter() - time_start) * 1000,
+                resolved_by,
+            ),
+            show_in_status=False,
+        )
         return self._version
 
+    @staticmethod
+    def _binary_identity(node_path: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not node_path:
+            return None
+
+        try:
+            real_path = os.path.realpath(node_path)
+            stat = os.stat(real_path)
+        except OSError:
+            return None
+
+        return {"path": real_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @staticmethod
+    def _load_cache(cache_path: str, identity: Dict[str, Any]) -> Optional[SemanticVersion]:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache["identity"] == identity:
+                return tuple(cache["version"])  # type: ignore
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return None
+
+    @staticmethod
+    def _save_cache(cache_path: str, identity: Dict[str, Any], version: SemanticVersion) -> None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"identity": identity, "version": list(version)}, f)
+        except OSError:
+            pass
+
 
 node_version_resolver = NodeVersionResolver()
 
@@ -73,6 +152,8 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
         # come from Pylance's obfuscated extension.bundle.js
         "pvsc": {
             "download": "https://pvsc.blob.core.windows.net/{vendor}/{name}-{version}.vsix",
+            "listing": "https://pvsc.blob.core.windows.net/{vendor}?restype=container&comp=list",
+            "listing_prefix": "{name}-",
             "referer": "",
             "user_agent": "VSCode " + VSCODE_CLIENTINFO["version"],
         },
@@ -92,6 +173,10 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
         node_version: Optional[str],
         download_from: str = DOWNLOAD_FROM_MARKETPLACE,
         resource_dirs: List[str] = [],
+        extraction_mode: str = EXTRACTION_MODE_ALL,
+        extraction_prefixes: List[str] = [],
+        install_verification: str = INSTALL_VERIFICATION_FAST,
+        download_mirrors: List[str] = [],
     ) -> None:
         if not (package_name and extension_uid and extension_version and server_binary_path and package_storage):
             raise Exception("ServerVsMarketplaceResource could not initialize due to wrong input")
@@ -104,9 +189,18 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
         self._node_version = node_version
         self._download_place = download_from
         self._resource_dirs = resource_dirs.copy()
+        self._extraction_mode = extraction_mode
+        self._extraction_prefixes = extraction_prefixes.copy()
+        self._install_verification = install_verification
+        self._download_mirrors = download_mirrors.copy()
 
         # internal
         self._status = ServerStatus.UNINITIALIZED
+        self._vsix_cache = VsixCache(self.vsix_cache_directory_path)
+
+    @property
+    def extension_version(self) -> str:
+        return self._extension_version
 
     @property
     def server_directory_path(self) -> str:
@@ -114,67 +208,474 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
 
         return os.path.join(self._package_storage, "{}~{}".format(self._extension_uid, self._extension_version))
 
-    def _install_or_update(self) -> None:
-        os.makedirs(self.server_directory_path, exist_ok=True)
+    @property
+    def staging_directory_path(self) -> str:
+        """ Looks like ".../Package Storage/LSP-pylance/ms-python.vscode-pylance~2020.11.1.staging-1234" """
+
+        return "{}.staging-{}".format(self.server_directory_path, os.getpid())
+
+    @property
+    def install_lock_path(self) -> str:
+        """ Looks like ".../Package Storage/LSP-pylance/.locks/ms-python.vscode-pylance~2020.11.1.lock" """
+
+        from .install_lock import install_lock_path
+
+        return install_lock_path(self._package_storage, self._extension_uid, self._extension_version)
+
+    @property
+    def downloads_directory_path(self) -> str:
+        """ Looks like ".../Package Storage/LSP-pylance/.downloads", where (partially) downloaded VSIX files live """
+
+        return os.path.join(self._package_storage, ".downloads")
+
+    @property
+    def vsix_cache_directory_path(self) -> str:
+        """ Looks like ".../Package Storage/LSP-pylance/.vsix-cache", which is shared by all versions """
+
+        return os.path.join(self._package_storage, ".vsix-cache")
+
+    def installed_versions(self) -> List[str]:
+        """
+        Finds versions of this extension which have been completely installed in the package storage.
+
+        :returns:   The versions, the most recently installed one goes first.
+        """
+
+        prefix = self._extension_uid + "~"
+        versions = []  # type: List[Tuple[float, str]]
 
         try:
-            # copy resources before downloading the server so it may use those resources
-            self._copy_resource_dirs()
-            self._download_extension()
+            dir_names = os.listdir(self._package_storage)
+        except OSError:
+            return []
+
+        for dir_name in dir_names:
+            if not dir_name.startswith(prefix):
+                continue
+
+            version = dir_name[len(prefix):]
+            server_dir = os.path.join(self._package_storage, dir_name)
+
+            # staging/trash directories have no manifest for the version
+            manifest = read_manifest(server_dir)
+            if not manifest or manifest.get("extension_version") != version:
+                continue
+
+            versions.append((os.path.getmtime(os.path.join(server_dir, MANIFEST_FILE)), version))
+
+        return [version for _, version in sorted(versions, reverse=True)]
+
+    def discover_latest_version(self, channel: str, ttl: float = 3600) -> Optional[str]:
+        """
+        Finds the latest available version of this extension. This does network I/O unless it's cached.
+
+        :param      channel:  The "pylance.insidersChannel", "daily" includes pre-releases
+        :param      ttl:      Seconds within which the cached result is used without asking the server
+
+        :returns:   The version, None if the download place can't be listed or there is no version
+        """
+
+        from .version_discovery import VersionDiscovery
+
+        listing_url = self._expaned_templates(self._download_place + ".listing")
+        blob_prefix = self._expaned_templates(self._download_place + ".listing_prefix")
+        if not (listing_url and blob_prefix):
+            return None
+
+        discovery = VersionDiscovery(
+            listing_url,
+            os.path.join(self._package_storage, VERSION_DISCOVERY_CACHE_FILE),
+            ttl,
+            self._expaned_templates(self._download_place + ".user_agent") or "",
+        )
+        version = discovery.latest(blob_prefix, channel)
+
+        log_and_show_message(
+            "{}: Latest server version ({} channel): {} ({})".format(
+                self._package_name,
+                channel,
+                version,
+                discovery.last_result,
+            ),
+            show_in_status=False,
+        )
+
+        return version
+
+    def prefetch(self, on_done: Optional[Callable[[bool], None]] = None) -> None:
+        """
+        Installs the server in a background thread while another version of the server may be running.
+
+        The installation is fully verified before it's considered as READY.
+
+        :param      on_done:  The callback which is called with whether the prefetch succeeded
+        """
+
+        def run() -> None:
+            try:
+                # a pending server is switched to once it's READY, so it must not be READY before verified
+                self._install_or_update(INSTALL_VERIFICATION_FULL)
+                ok = True
+            except Exception as e:
+                log_and_show_message(
+                    "{}: Failed to prefetch server {}: {}".format(self._package_name, self._extension_version, e),
+                    show_in_status=False,
+                )
+                ok = False
+
+            if on_done:
+                on_done(ok)
+
+        log_and_show_message(
+            "{}: Prefetching server {} in the background".format(self._package_name, self._extension_version),
+            show_in_status=False,
+        )
+
+        # downloading may take a long time so don't block the async thread shared with other plugins
+        threading.Thread(target=run, name="{}-prefetch".format(self._package_name), daemon=True).start()
+
+    def _install_or_update(self, verification: Optional[str] = None) -> None:
+        """
+        Installs the server and sets the status to READY, or ERROR if it fails.
+
+        :param      verification:  If given, the installation is also verified this way ("fast" or "full")
+                                   before it's considered as READY
+        """
+
+        def on_wait(owner: Dict[str, Any]) -> None:
+            log_and_show_message(
+                "{}: Waiting for another process (pid {}) to install server {}".format(
+                    self._package_name,
+                    owner.get("pid", "?"),
+                    self._extension_version,
+                ),
+                show_in_status=False,
+            )
+
+        # lazy import since it's not needed at all once the server is installed
+        from .install_lock import InstallLock
+
+        # other Sublime Text instances (or the other plugin host) may install the same version at the same time
+        try:
+            with InstallLock(self.install_lock_path, on_wait=on_wait):
+                # the installation may have been completed by the process we were waiting for
+                if self._is_installed():
+                    log_and_show_message(
+                        "{}: Reusing server installed by another process: {}".format(
+                            self._package_name,
+                            self.server_directory_path,
+                        ),
+                        show_in_status=False,
+                    )
+                else:
+                    self._install_or_update_locked()
+
+            if verification and not verify_manifest(self.server_directory_path, self._binary_key, verification):
+                raise RuntimeError("The installed server failed the {} verification.".format(verification))
         except Exception as e:
             self._status = ServerStatus.ERROR
             raise e
 
         self._status = ServerStatus.READY
 
-    def _copy_resource_dirs(self) -> None:
+    def _install_or_update_locked(self) -> None:
+        staging_dir = self.staging_directory_path
+
         try:
-            for folder in self._resource_dirs:
-                folder = re.sub(r"[\\/]+", "/", folder).strip("\\/")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            os.makedirs(staging_dir)
+
+            # copy resources before downloading the server so it may use those resources
+            self.sync_resource_dirs(staging_dir)
 
-                if not folder:
-                    continue
+            vsix_path = self._vsix_cache.lookup(self._extension_uid, self._extension_version)
+            if vsix_path:
+                log_and_show_message(
+                    "{}: Using the cached extension: {}".format(self._package_name, vsix_path),
+                    show_in_status=False,
+                )
+            else:
+                vsix_path = self._download_extension()
+
+            try:
+                self._extract_extension(vsix_path, staging_dir)
+            except Exception:
+                # otherwise the broken VSIX would be used by every later installation
+                self._vsix_cache.remove(vsix_path)
+                raise
+
+            self._publish_staging_directory(staging_dir)
+        except Exception as e:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise e
 
-                dir_src = "Packages/{}/{}/".format(self._package_name, folder)
-                dir_dst = "{}/{}/".format(self.server_directory_path, folder)
+    def _publish_staging_directory(self, staging_dir: str) -> None:
+        """ Replaces the server directory with the completely prepared `staging_dir` by renaming. """
 
-                shutil.rmtree(dir_dst, ignore_errors=True)
-                ResourcePath(dir_src).copytree(dir_dst, exist_ok=True)  # type: ignore
+        server_dir = self.server_directory_path
+        trash_dir = "{}.trash-{}".format(server_dir, os.getpid())
+
+        # a directory can't be renamed over an existing one on Windows, so move the old one away first
+        if os.path.isdir(server_dir):
+            shutil.rmtree(trash_dir, ignore_errors=True)
+            os.replace(server_dir, trash_dir)
+
+        os.replace(staging_dir, server_dir)
+        shutil.rmtree(trash_dir, ignore_errors=True)
+
+    def sync_resource_dirs(self, root_dir: Optional[str] = None) -> None:
+        """
+        Syncs resource directories of the package into the server directory (or `root_dir`).
+
+        Only changed files are written so the server doesn't have to parse unchanged files again.
+        This can be used to update resources after the package is upgraded without reinstalling the server.
+        """
+
+        from .resource_sync import sync_files
+
+        root_dir = root_dir or self.server_directory_path
+        folders = [re.sub(r"[\\/]+", "/", folder).strip("\\/") for folder in self._resource_dirs]
+        folders = [folder for folder in folders if folder]
+        files = {}  # type: Dict[str, bytes]
+
+        try:
+            for folder in folders:
+                dir_src = ResourcePath("Packages/{}/{}".format(self._package_name, folder))
+
+                for path in dir_src.rglob("*"):
+                    files["/".join((folder,) + path.relative_to(dir_src))] = path.read_bytes()
+
+            written, deleted = sync_files(root_dir, files, folders)
         except IOError:
             raise RuntimeError("Failed to copy resource files...")
 
-    def _download_extension(self, save_vsix: bool = True) -> None:
-        url = self._expaned_templates(self._download_place + ".download") or ""
+        if written or deleted:
+            log_and_show_message(
+                "{}: Synced resource files: {} written, {} deleted, {} unchanged".format(
+                    self._package_name,
+                    written,
+                    deleted,
+                    len(files) - written,
+                ),
+                show_in_status=False,
+            )
 
-        try:
-            req = urllib.request.Request(
-                url=url,
-                headers={
-                    "Accept-Encoding": "gzip, deflate",
-                    "Referer": self._expaned_templates(self._download_place + ".referer") or "",
-                    "User-Agent": self._expaned_templates(self._download_place + ".user_agent") or "",
-                },
+    def _download_sources(self, fallbacks: bool = False) -> List["DownloadSource"]:
+        """
+        Download sources in the order of preference.
+
+        :param      fallbacks:  Get other built-in sources than the `download_from` one rather than
+                                mirrors and the `download_from` one
+
+        :returns:   The download sources
+        """
+
+        from .download_sources import DownloadSource
+
+        if fallbacks:
+            sources = []  # type: List[DownloadSource]
+            places = sorted(set(self.templates.keys()) - {self._download_place})
+        else:
+            sources = [DownloadSource("mirror {}".format(i + 1), m) for i, m in enumerate(self._download_mirrors)]
+            places = [self._download_place]
+
+        for place in places:
+            url = self._expaned_templates(place + ".download")
+            if not url:
+                continue
+
+            headers = {
+                "Referer": self._expaned_templates(place + ".referer") or "",
+                "User-Agent": self._expaned_templates(place + ".user_agent") or "",
+            }
+            sources.append(DownloadSource(place, url, {k: v for k, v in headers.items() if v}))
+
+        user_agent = self._expaned_templates(DOWNLOAD_FROM_PVSC + ".user_agent") or ""
+        for source in sources:
+            if not source.headers:
+                source.headers = {"User-Agent": user_agent}
+
+        return sources
+
+    def _download_extension(self) -> str:
+        """
+        Downloads the extension into the VSIX cache.
+
+        Local mirrors are used if they have the file. Otherwise, remote mirrors and the `download_from` source
+        are probed concurrently and the fastest healthy one is used. If it fails, the next fastest one is used
+        and so on. Other built-in sources are only probed once they all fail.
+
+        :returns:   The path of the cached VSIX file.
+        """
+
+        extension_vendor, extension_name = self._extension_uid.split(".")[:2]
+        vsix_name = "{}~{}.vsix".format(self._extension_uid, self._extension_version)
+        vsix_path = os.path.join(self.downloads_directory_path, vsix_name)
+        sources = self._download_sources()
+
+        for source in (s for s in sources if s.is_local):
+            local_path = source.resolve(extension_vendor, extension_name, self._extension_version)
+            if not os.path.isfile(local_path):
+                continue
+
+            time_start = time.perf_counter()
+            os.makedirs(self.downloads_directory_path, exist_ok=True)
+            shutil.copyfile(local_path, vsix_path + ".part")
+            os.replace(vsix_path + ".part", vsix_path)
+
+            try:
+                cached_path = self._vsix_cache.add(self._extension_uid, self._extension_version, vsix_path)
+            except RuntimeError as e:
+                log_and_show_message(
+                    "{}: Skipped {}: {}".format(self._package_name, source.name, e),
+                    show_in_status=False,
+                )
+                continue
+
+            log_and_show_message(
+                "{}: Copied the extension from {} ({}) in {:.2f} seconds".format(
+                    self._package_name,
+                    source.name,
+                    local_path,
+                    time.perf_counter() - time_start,
+                ),
+                show_in_status=False,
+            )
+
+            return cached_path
+
+        errors = []  # type: List[str]
+
+        # other built-in sources are only tried if preferred ones fail, since some of them are rate-limited
+        for remote_sources in ([s for s in sources if not s.is_local], self._download_sources(fallbacks=True)):
+            cached_path = self._download_from_remote_sources(remote_sources, vsix_path, errors)
+            if cached_path:
+                return cached_path
+
+        raise RuntimeError("Unable to download the extension from any source: {}".format(", ".join(errors)))
+
+    def _download_from_remote_sources(
+        self,
+        sources: List["DownloadSource"],
+        vsix_path: str,
+        errors: List[str],
+    ) -> Optional[str]:
+        """
+        Probes remote sources and downloads the extension from the fastest healthy one.
+        If it fails, the next fastest one is used and so on.
+
+        :param      errors:  Errors of failed sources are appended into it
+
+        :returns:   The path of the cached VSIX file, None if all sources fail
+        """
+
+        # lazy import since they are not needed at all once the server is installed
+        from .download_sources import probe_sources
+        from .file_download import download_file
+        from .file_download import DownloadStats
+        import urllib.error
+
+        def report_progress(stats: DownloadStats) -> None:
+            log_and_show_message(
+                "{}: Downloading server: {:.2f}{} MiB ({:.2f} MiB/s)".format(
+                    self._package_name,
+                    stats.received_bytes / MIB,
+                    " / {:.2f}".format(stats.total_bytes / MIB) if stats.total_bytes else "",
+                    stats.throughput / MIB,
+                )
+            )
+
+        extension_vendor, extension_name = self._extension_uid.split(".")[:2]
+        urls = {s.name: s.resolve(extension_vendor, extension_name, self._extension_version) for s in sources}
+        healthy_sources = probe_sources(sources, [urls[s.name] for s in sources])
+
+        for source in sources:
+            log_and_show_message(
+                "{}: Download source {}: {}".format(
+                    self._package_name,
+                    source.name,
+                    "{:.0f} ms latency, {:.2f} MiB/s".format(source.latency_s * 1000, source.throughput / MIB)
+                    if source.latency_s is not None
+                    else source.error,
+                ),
+                show_in_status=False,
             )
+            if source.latency_s is None:
+                errors.append('"{}" ({})'.format(urls[source.name], source.error))
+
+        for source in healthy_sources:
+            url = urls[source.name]
+
+            try:
+                stats = download_file(url, vsix_path, headers=source.headers, on_progress=report_progress)
+                # such as an HTML page with a 200 status, or a ".part" file resumed from a different file
+                cached_path = self._vsix_cache.add(self._extension_uid, self._extension_version, vsix_path)
+            except (urllib.error.HTTPError, RuntimeError) as e:
+                errors.append('"{}" ({})'.format(url, getattr(e, "code", None) or e))
+                # don't resume a partial file of another source, which may not be the same file
+                if os.path.isfile(vsix_path + ".part"):
+                    os.remove(vsix_path + ".part")
+                log_and_show_message(
+                    "{}: Failed to download from {}, trying the next source: {}".format(
+                        self._package_name,
+                        source.name,
+                        errors[-1],
+                    ),
+                    show_in_status=False,
+                )
+                continue
+
+            log_and_show_message(
+                "{}: Downloaded {:.2f} MiB from {} in {:.2f} seconds "
+                "({:.0f} ms latency, {:.2f} MiB/s, {} attempt(s), {:.2f} MiB resumed)".format(
+                    self._package_name,
+                    stats.received_bytes / MIB,
+                    source.name,
+                    stats.elapsed_s,
+                    (source.latency_s or 0) * 1000,
+                    stats.throughput / MIB,
+                    stats.attempts,
+                    stats.resumed_bytes / MIB,
+                ),
+                show_in_status=False,
+            )
+
+            return cached_path
 
-            with urllib.request.urlopen(req) as resp:
-                resp_data = resp.read()
-                if resp.info().get("Content-Encoding") == "gzip":
-                    resp_data = gzip.decompress(resp_data)
-        except urllib.error.HTTPError as e:
-            raise RuntimeError('Unable to download the extension from "{}" (HTTP code: {})'.format(url, e.code))
-        except urllib.error.ContentTooShortError:
-            raise RuntimeError("Extension was downloaded imcompletely...")
+        return None
 
-        if save_vsix:
-            with io.open(os.path.join(self.server_directory_path, "extension.vsix"), "wb") as f:
-                f.write(resp_data)
+    def _extract_extension(self, vsix_path: str, root_dir: str) -> None:
+        from .vsix_extraction import derive_server_prefixes
+        from .vsix_extraction import extract_vsix
 
-        with zipfile.ZipFile(io.BytesIO(resp_data), "r") as f:
-            f.extractall(self.server_directory_path)
+        prefixes = None  # type: Optional[List[str]]
+        if self._extraction_mode == EXTRACTION_MODE_SERVER:
+            prefixes = derive_server_prefixes(self._binary_path) + self._extraction_prefixes
 
-        if not os.path.isfile(self.binary_path):
+        time_start = time.perf_counter()
+        file_hashes = extract_vsix(vsix_path, root_dir, prefixes)
+
+        log_and_show_message(
+            "{}: Extracted {} files in {:.2f} seconds".format(
+                self._package_name,
+                len(file_hashes),
+                time.perf_counter() - time_start,
+            ),
+            show_in_status=False,
+        )
+
+        if not os.path.isfile(os.path.join(root_dir, self._binary_path)):
             raise RuntimeError("Preparation done but somehow the server binary path is not a file.")
 
+        write_manifest(
+            root_dir,
+            file_hashes,
+            extension_uid=self._extension_uid,
+            extension_version=self._extension_version,
+            vsix=os.path.basename(vsix_path),
+            prefixes=prefixes,
+        )
+
     def _expaned_templates(self, dotted: str, default: Optional[str] = None) -> Optional[str]:
         extension_vendor, extension_name = self._extension_uid.split(".")[:2]
 
@@ -212,16 +713,24 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
         minimum_node_version = options["minimum_node_version"]  # type: Optional[SemanticVersion]
         download_from = options["download_from"] or DOWNLOAD_FROM_MARKETPLACE  # type: str
         resource_dirs = options["resource_dirs"] or []  # type: List[str]
+        extraction_mode = options["extraction_mode"] or EXTRACTION_MODE_ALL  # type: str
+        extraction_prefixes = options["extraction_prefixes"] or []  # type: List[str]
+        install_verification = options["install_verification"] or INSTALL_VERIFICATION_FAST  # type: str
+        download_mirrors = options.get("download_mirrors") or []  # type: List[str]
 
         if minimum_node_version:
-            if shutil.which("node") is None:
+            node_path = shutil.which("node")
+            if node_path is None:
                 log_and_show_message(
                     "{}: Error: Node binary not found on the PATH."
                     "Check the LSP Troubleshooting section for information on how to fix that: "
                     "https://lsp.readthedocs.io/en/latest/troubleshooting/".format(package_name)
                 )
                 return None
-            installed_node_version = node_version_resolver.resolve()
+            installed_node_version = node_version_resolver.resolve(
+                node_path,
+                os.path.join(package_storage, NODE_VERSION_CACHE_FILE),
+            )
             if not installed_node_version:
                 return None
             if installed_node_version < minimum_node_version:
@@ -243,6 +752,10 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
             version_to_string(installed_node_version) if installed_node_version else None,
             download_from,
             resource_dirs,
+            extraction_mode,
+            extraction_prefixes,
+            install_verification,
+            download_mirrors,
         )
 
     @property
@@ -255,17 +768,22 @@ class ServerVsMarketplaceResource(ServerResourceInterface):
         return self._status
 
     def needs_installation(self) -> bool:
-        is_installed = os.path.isfile(self.binary_path)
-
-        if is_installed:
+        if self._is_installed():
             self._status = ServerStatus.READY
             return False
 
         return True
 
-    def install_or_update(self, async_io: bool = False) -> None:
-        shutil.rmtree(self.server_directory_path, ignore_errors=True)
+    @property
+    def _binary_key(self) -> str:
+        """ The server binary path in the manifest, like "extension/dist/server.bundle.js" """
+
+        return re.sub(r"[\\/]+", "/", self._binary_path).strip("/")
 
+    def _is_installed(self) -> bool:
+        return verify_manifest(self.server_directory_path, self._binary_key, self._install_verification)
+
+    def install_or_update(self, async_io: bool = False) -> None:
         install_message = "{}: Installing server in path: {}".format(self._package_name, self.server_directory_path)
         log_and_show_message(install_message, show_in_status=False)
 
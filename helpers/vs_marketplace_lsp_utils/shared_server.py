@@ -0,0 +1,873 @@
+from .node_launcher import hidden_startupinfo
+from .node_launcher import write_launcher
+from .node_launcher import write_script
+from .warm_pool import ATTACH_JS
+from .warm_pool import WARM_POOL_TOKEN_ENV
+from LSP.plugin.core.typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from lsp_utils.helpers import log_and_show_message
+import json
+import os
+import queue
+import secrets
+import socket
+import subprocess
+import threading
+import time
+
+__all__ = ["SharedServer"]
+
+# seconds the server is kept after the last client leaves, so a restarted session can reuse it
+IDLE_SHUTDOWN_DELAY = 10
+
+# seconds an attach command is expected to connect within
+ATTACH_TIMEOUT = 30
+
+# the handshake line of an attach command carries its env, which can be large
+MAX_HANDSHAKE_BYTES = 1024 * 1024
+
+# server-to-client requests which are sent to every client, the first response is used
+BROADCAST_REQUESTS = {"client/registerCapability", "client/unregisterCapability"}
+
+
+class _Client:
+    def __init__(self, client_id: int, sock: socket.socket) -> None:
+        self.id = client_id
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self.folders = []  # type: List[Dict[str, str]]
+        self.open_uris = set()  # type: set[str]
+        # document URI => {"languageId", "version", "text"} as this client sees it, for documents whose changes
+        # are sent by another client, so the server can be synced with this client once it owns the document
+        self.documents = {}  # type: Dict[str, Dict[str, Any]]
+        self.joined = False
+        # messages are written by a dedicated thread so routing never blocks on I/O
+        self._queue = queue.Queue()  # type: queue.Queue[Optional[Dict[str, Any]]]
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self._queue.put(message)
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+    def _write_loop(self) -> None:
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+
+            try:
+                self.sock.sendall(_encode_message(message))
+            except OSError:
+                break
+
+        try:
+            # the socket is not really closed by close() while `rfile` is still referenced
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+        except OSError:
+            pass
+
+    def owns(self, uri: str) -> bool:
+        return any(uri == f["uri"] or uri.startswith(f["uri"].rstrip("/") + "/") for f in self.folders)
+
+
+class _ServerRequest:
+    """ A server-to-client request, which may be sent to multiple clients. """
+
+    def __init__(self, message: Dict[str, Any]) -> None:
+        self.message = message
+        self.answered = False
+        # for "workspace/configuration" whose items are answered by different clients
+        self.items = []  # type: List[Any]
+        self.waiting = 0
+
+
+class SharedServer:
+    """
+    A server process shared by sessions of all windows.
+
+    Each session runs `attach.js` which connects to the broker in this class. The broker makes the server
+    see a single multi-root client: later sessions are answered with the cached "initialize" result and
+    their folders are added via "workspace/didChangeWorkspaceFolders". Request IDs are remapped per session,
+    documents opened in multiple sessions are reference-counted and diagnostics are routed back to sessions
+    which have the document open (or own the folder of it).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        node_command: List[str],
+        launcher_args: List[str],
+        env: Dict[str, str],
+        scripts_dir: str,
+    ) -> None:
+        self._name = name
+        self._node_command = node_command
+        self._launcher_args = launcher_args
+        self._env = env
+        self._scripts_dir = scripts_dir
+        self._token = secrets.token_hex(16)
+        self._lock = threading.RLock()
+        self._server_queue = queue.Queue()  # type: queue.Queue[Optional[Dict[str, Any]]]
+        self._process = None  # type: Optional[subprocess.Popen]
+        self._listener = None  # type: Optional[socket.socket]
+        self._stopped = False
+        self._clients = {}  # type: Dict[int, _Client]
+        self._next_client_id = 1
+        self._next_request_id = 1
+        self._expected_clients = 0
+        self._last_attach_time = 0.0
+        self._stop_timer = None  # type: Optional[threading.Timer]
+        # the "initialize" result (or error) of the server, and clients waiting for it
+        self._initialize_result = None  # type: Optional[Dict[str, Any]]
+        self._initialize_error = None  # type: Optional[Dict[str, Any]]
+        self._initialize_waiters = []  # type: List[Tuple[_Client, Any]]
+        self._initializing = False
+        # server request ID => (client, client request ID)
+        self._pending_requests = {}  # type: Dict[int, Tuple[_Client, Any]]
+        # (client ID, dumped client request ID) => server request ID, for "$/cancelRequest"
+        self._pending_request_ids = {}  # type: Dict[Tuple[int, str], int]
+        # client request ID => (server request, client, indexes of configuration items or None for all)
+        self._server_requests = {}  # type: Dict[str, Tuple[_ServerRequest, _Client, Optional[List[int]]]]
+        self._registrations = {}  # type: Dict[str, Dict[str, Any]]
+        # dumped progress token => the client which created it or whose request it reports
+        self._progress_owners = {}  # type: Dict[str, _Client]
+        # document URI => clients which opened it, the first one owns document changes
+        self._openers = {}  # type: Dict[str, List[_Client]]
+        # folder URI => count of clients which have the folder
+        self._folder_refs = {}  # type: Dict[str, int]
+        self._last_requester = None  # type: Optional[_Client]
+        # the client whose document changes are sent last, which most likely triggers the next analysis
+        self._last_editor = None  # type: Optional[_Client]
+
+    def matches(self, node_command: List[str], launcher_args: List[str], env: Dict[str, str]) -> bool:
+        return self._node_command == node_command and self._launcher_args == launcher_args and self._env == env
+
+    def is_alive(self) -> bool:
+        with self._lock:
+            return not self._stopped
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def attach_command(self) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Gets the (command, additional env) for a session to attach to the shared server.
+        The server is started if it's not started yet.
+        """
+
+        with self._lock:
+            if not self._listener:
+                self._start()
+
+            if self._stop_timer:
+                self._stop_timer.cancel()
+                self._stop_timer = None
+
+            self._expected_clients += 1
+            self._last_attach_time = time.time()
+
+            assert self._listener
+            port = self._listener.getsockname()[1]
+
+        attach_script_path = os.path.join(self._scripts_dir, "attach.js")
+        write_script(attach_script_path, ATTACH_JS)
+
+        return [self._node_command[0], attach_script_path, str(port)], {WARM_POOL_TOKEN_ENV: self._token}
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._stopped:
+                return
+
+            self._stopped = True
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+            if self._listener:
+                try:
+                    # wakes up the blocking accept() on Linux
+                    self._listener.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self._listener.close()
+
+        for client in clients:
+            client.close()
+
+        process = self._process
+        if process and process.poll() is None:
+            self._send_to_server({"jsonrpc": "2.0", "id": 0, "method": "shutdown", "params": None})
+            self._send_to_server({"jsonrpc": "2.0", "method": "exit", "params": None})
+
+        self._server_queue.put(None)
+
+        if process:
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        log_and_show_message("{}: Stopped the shared server".format(self._name), show_in_status=False)
+
+    # ---------- #
+    # life cycle #
+    # ---------- #
+
+    def _start(self) -> None:
+        process_env = os.environ.copy()
+        process_env.update(self._env)
+
+        self._process = subprocess.Popen(
+            self._node_command + [write_launcher(self._scripts_dir)] + self._launcher_args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=process_env,
+            cwd=os.path.dirname(self._launcher_args[1]),
+            startupinfo=hidden_startupinfo(),
+        )
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen()
+
+        threading.Thread(target=self._server_loop, daemon=True).start()
+        threading.Thread(target=self._server_write_loop, daemon=True).start()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+        log_and_show_message(
+            "{}: Started the shared server (pid {})".format(self._name, self._process.pid),
+            show_in_status=False,
+        )
+
+    def _schedule_stop(self) -> None:
+        """ Stops the server later if there is no client then. """
+
+        with self._lock:
+            if self._stop_timer or self._stopped:
+                return
+
+            self._stop_timer = threading.Timer(IDLE_SHUTDOWN_DELAY, self._stop_if_idle)
+            self._stop_timer.daemon = True
+            self._stop_timer.start()
+
+    def _stop_if_idle(self) -> None:
+        with self._lock:
+            self._stop_timer = None
+
+            expecting = self._expected_clients > 0 and time.time() - self._last_attach_time < ATTACH_TIMEOUT
+            if self._clients or expecting:
+                if expecting:
+                    self._schedule_stop()
+                return
+
+        self.stop()
+
+    def _accept_loop(self) -> None:
+        listener = self._listener
+        assert listener
+
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+
+            threading.Thread(target=self._client_loop, args=(sock,), daemon=True).start()
+
+    def _client_loop(self, sock: socket.socket) -> None:
+        with self._lock:
+            client = _Client(self._next_client_id, sock)
+            self._next_client_id += 1
+
+        # the first line of `attach.js` is a JSON object of the token, and the env and the cwd of the session
+        try:
+            token = json.loads(client.rfile.readline(MAX_HANDSHAKE_BYTES).decode("utf-8", "replace")).get("token")
+        except (OSError, ValueError, AttributeError):
+            token = ""
+
+        if token != self._token:
+            client.close()
+            return
+
+        with self._lock:
+            if self._stopped:
+                client.close()
+                return
+
+            self._clients[client.id] = client
+            self._expected_clients = max(0, self._expected_clients - 1)
+
+        while True:
+            message = _read_message(client.rfile)
+            if message is None:
+                break
+
+            with self._lock:
+                if client.id not in self._clients:
+                    break
+                self._on_client_message(client, message)
+
+        with self._lock:
+            self._detach(client)
+
+    def _server_loop(self) -> None:
+        process = self._process
+        assert process and process.stdout
+
+        while True:
+            message = _read_message(process.stdout)
+            if message is None:
+                break
+
+            with self._lock:
+                self._on_server_message(message)
+
+        if not self._stopped:
+            log_and_show_message("{}: The shared server exited".format(self._name))
+
+        self.stop()
+
+    # ---------------- #
+    # client-to-server #
+    # ---------------- #
+
+    def _on_client_message(self, client: _Client, message: Dict[str, Any]) -> None:
+        method = message.get("method")
+
+        if method is None:
+            self._on_client_response(client, message)
+        elif "id" in message:
+            self._on_client_request(client, message)
+        else:
+            self._on_client_notification(client, message)
+
+    def _on_client_request(self, client: _Client, message: Dict[str, Any]) -> None:
+        method = message["method"]
+
+        if method == "initialize":
+            client.folders = _initialize_folders(message.get("params") or {})
+            if self._initialize_result is not None:
+                client.send({"jsonrpc": "2.0", "id": message["id"], "result": self._initialize_result})
+            elif self._initialize_error is not None:
+                client.send({"jsonrpc": "2.0", "id": message["id"], "error": self._initialize_error})
+            else:
+                self._initialize_waiters.append((client, message["id"]))
+                if not self._initializing:
+                    self._initializing = True
+                    for folder in client.folders:
+                        self._folder_refs[folder["uri"]] = self._folder_refs.get(folder["uri"], 0) + 1
+                    client.joined = True
+                    self._forward_request(client, message)
+            return
+
+        if method == "shutdown":
+            # the server is shut down when no client uses it anymore
+            client.send({"jsonrpc": "2.0", "id": message["id"], "result": None})
+            return
+
+        self._last_requester = client
+        params = message.get("params")
+        if isinstance(params, dict):
+            for key in ("workDoneToken", "partialResultToken"):
+                if key in params:
+                    self._progress_owners[json.dumps(params[key])] = client
+        self._forward_request(client, message)
+
+    def _forward_request(self, client: _Client, message: Dict[str, Any]) -> None:
+        request_id = self._next_request_id
+        self._next_request_id += 1
+
+        self._pending_requests[request_id] = (client, message["id"])
+        self._pending_request_ids[(client.id, json.dumps(message["id"]))] = request_id
+        self._send_to_server(dict(message, id=request_id))
+
+    def _on_client_notification(self, client: _Client, message: Dict[str, Any]) -> None:
+        method = message["method"]
+        params = message.get("params") or {}
+
+        if method == "initialized":
+            if client.joined:
+                self._send_to_server(message)
+            else:
+                self._join(client)
+            return
+
+        if method == "exit":
+            self._detach(client)
+            return
+
+        if method == "$/cancelRequest":
+            request_id = self._pending_request_ids.get((client.id, json.dumps(params.get("id"))))
+            if request_id is not None:
+                self._send_to_server(dict(message, params={"id": request_id}))
+            return
+
+        if method.startswith("textDocument/"):
+            uri = (params.get("textDocument") or {}).get("uri", "")
+            openers = self._openers.get(uri, [])
+
+            if method == "textDocument/didOpen":
+                self._openers[uri] = openers
+                client.open_uris.add(uri)
+                openers.append(client)
+                if len(openers) > 1:
+                    client.documents[uri] = dict(params["textDocument"])
+                    return
+            elif method == "textDocument/didClose":
+                client.open_uris.discard(uri)
+                if self._remove_opener(client, uri):
+                    return
+            elif openers and openers[0] is not client:
+                # the same document in another window, changes are sent by the owner
+                if method == "textDocument/didChange" and uri in client.documents:
+                    document = client.documents[uri]
+                    document["version"] = params["textDocument"].get("version", document["version"])
+                    document["text"] = _apply_content_changes(document["text"], params.get("contentChanges", []))
+                return
+
+            self._last_editor = client
+
+        if method == "workspace/didChangeWorkspaceFolders":
+            event = params.get("event") or {}
+            removed = [f for f in event.get("removed", []) if f in client.folders]
+            client.folders = [f for f in client.folders if f not in removed] + event.get("added", [])
+            self._change_folders(event.get("added", []), removed)
+            return
+
+        self._send_to_server(message)
+
+    def _on_client_response(self, client: _Client, message: Dict[str, Any]) -> None:
+        entry = self._server_requests.pop(json.dumps(message.get("id")), None)
+        if not entry:
+            return
+
+        request, _, indexes = entry
+        self._answer_server_request(request, indexes, message)
+
+    def _answer_server_request(
+        self,
+        request: _ServerRequest,
+        indexes: Optional[List[int]],
+        message: Dict[str, Any],
+    ) -> None:
+        """ Sends the response of a client back to the server, once all clients asked for items have answered. """
+
+        if request.answered:
+            return
+
+        if indexes is not None:
+            result = message.get("result")
+            if isinstance(result, list):
+                for index, item in zip(indexes, result):
+                    request.items[index] = item
+            request.waiting -= 1
+            if request.waiting > 0:
+                return
+            message = {"jsonrpc": "2.0", "result": request.items}
+
+        request.answered = True
+        if "id" in request.message:
+            self._send_to_server(dict(message, id=request.message["id"]))
+
+    def _join(self, client: _Client) -> None:
+        """ Adds folders of a later client into the server. """
+
+        client.joined = True
+        self._change_folders(client.folders, [])
+
+        # replay capability registrations which the client has missed
+        if self._registrations:
+            params = {"registrations": list(self._registrations.values())}
+            self._send_to_clients([client], {"method": "client/registerCapability", "params": params})
+
+        log_and_show_message(
+            "{}: A session has joined the shared server ({} sessions)".format(self._name, len(self._clients)),
+            show_in_status=False,
+        )
+
+    def _detach(self, client: _Client) -> None:
+        """ Removes everything of the client from the server. """
+
+        if self._clients.pop(client.id, None) is None:
+            return
+
+        client.close()
+
+        for uri in client.open_uris:
+            if not self._remove_opener(client, uri):
+                self._send_to_server(
+                    {"jsonrpc": "2.0", "method": "textDocument/didClose", "params": {"textDocument": {"uri": uri}}}
+                )
+
+        if client.joined:
+            self._change_folders([], client.folders)
+
+        # requests of the server which the client will never answer
+        for key, (request, request_client, indexes) in list(self._server_requests.items()):
+            if request_client is not client:
+                continue
+
+            del self._server_requests[key]
+            if request.answered or "id" not in request.message:
+                continue
+
+            if indexes is not None:
+                # other clients answer other items, leave these ones unset
+                self._answer_server_request(request, indexes, {"jsonrpc": "2.0", "result": []})
+            elif not any(entry[0] is request for entry in self._server_requests.values()):
+                # nobody else has been asked, ask the remaining clients
+                self._on_server_request(request.message)
+
+        self._pending_request_ids = {k: v for k, v in self._pending_request_ids.items() if k[0] != client.id}
+        self._progress_owners = {k: v for k, v in self._progress_owners.items() if v is not client}
+        if self._last_requester is client:
+            self._last_requester = None
+        if self._last_editor is client:
+            self._last_editor = None
+
+        if not self._clients:
+            self._schedule_stop()
+
+    def _remove_opener(self, client: _Client, uri: str) -> bool:
+        """
+        Removes the client from openers of the document. If the client owned the document, the next opener
+        becomes the owner and the server is synced with its content.
+
+        :returns:   Whether the document is still opened by other clients
+        """
+
+        openers = self._openers.get(uri, [])
+        was_owner = bool(openers) and openers[0] is client
+        client.documents.pop(uri, None)
+
+        if client in openers:
+            openers.remove(client)
+
+        if not openers:
+            self._openers.pop(uri, None)
+            return False
+
+        new_owner = openers[0]
+        document = new_owner.documents.pop(uri, None)
+        if was_owner and document:
+            # the server has the content of the old owner, which may differ from the new owner's one
+            self._send_to_server(
+                {"jsonrpc": "2.0", "method": "textDocument/didClose", "params": {"textDocument": {"uri": uri}}}
+            )
+            self._send_to_server(
+                {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": document}}
+            )
+
+        return True
+
+    def _change_folders(self, added: List[Dict[str, str]], removed: List[Dict[str, str]]) -> None:
+        """ Sends "workspace/didChangeWorkspaceFolders" for folders which are (not) used by any client now. """
+
+        really_added = []  # type: List[Dict[str, str]]
+        really_removed = []  # type: List[Dict[str, str]]
+
+        for folder in added:
+            self._folder_refs[folder["uri"]] = self._folder_refs.get(folder["uri"], 0) + 1
+            if self._folder_refs[folder["uri"]] == 1:
+                really_added.append(folder)
+
+        for folder in removed:
+            self._folder_refs[folder["uri"]] = self._folder_refs.get(folder["uri"], 1) - 1
+            if self._folder_refs[folder["uri"]] <= 0:
+                del self._folder_refs[folder["uri"]]
+                really_removed.append(folder)
+
+        if really_added or really_removed:
+            self._send_to_server(
+                {
+                    "jsonrpc": "2.0",
+                    "method": "workspace/didChangeWorkspaceFolders",
+                    "params": {"event": {"added": really_added, "removed": really_removed}},
+                }
+            )
+
+    def _send_to_server(self, message: Dict[str, Any]) -> None:
+        self._server_queue.put(message)
+
+    def _server_write_loop(self) -> None:
+        process = self._process
+        assert process and process.stdin
+
+        while True:
+            message = self._server_queue.get()
+            if message is None:
+                break
+
+            try:
+                process.stdin.write(_encode_message(message))
+                process.stdin.flush()
+            except (OSError, ValueError):
+                break
+
+    # ---------------- #
+    # server-to-client #
+    # ---------------- #
+
+    def _on_server_message(self, message: Dict[str, Any]) -> None:
+        method = message.get("method")
+
+        if method is None:
+            self._on_server_response(message)
+        elif "id" in message:
+            self._on_server_request(message)
+        else:
+            self._on_server_notification(message)
+
+    def _on_server_response(self, message: Dict[str, Any]) -> None:
+        pending = self._pending_requests.pop(message.get("id"), None)  # type: ignore
+        if not pending:
+            return
+
+        client, client_request_id = pending
+        self._pending_request_ids.pop((client.id, json.dumps(client_request_id)), None)
+
+        if self._initializing and self._initialize_result is None and self._initialize_error is None:
+            if "result" in message:
+                self._initialize_result = message["result"]
+                reply = {"result": self._initialize_result}
+            else:
+                self._initialize_error = message.get("error") or {"code": -32603, "message": "initialize failed"}
+                reply = {"error": self._initialize_error}
+
+            for waiter, waiter_request_id in self._initialize_waiters:
+                if waiter.id in self._clients:
+                    waiter.send(dict(reply, jsonrpc="2.0", id=waiter_request_id))
+            self._initialize_waiters.clear()
+
+            if self._initialize_error is not None:
+                log_and_show_message(
+                    "{}: The shared server failed to initialize: {}".format(
+                        self._name,
+                        self._initialize_error.get("message"),
+                    )
+                )
+                # new sessions start a new shared server instead, stop() waits so don't block this thread
+                threading.Thread(target=self.stop, daemon=True).start()
+            return
+
+        if client.id in self._clients:
+            client.send(dict(message, id=client_request_id))
+
+    def _on_server_request(self, message: Dict[str, Any]) -> None:
+        method = message["method"]
+        params = message.get("params") or {}
+
+        if method in BROADCAST_REQUESTS:
+            for registration in params.get("registrations", []):
+                self._registrations[registration["id"]] = registration
+            for unregistration in params.get("unregisterations", params.get("unregistrations", [])):
+                self._registrations.pop(unregistration["id"], None)
+            # clients which join later get registrations when they join
+            targets = [c for c in self._clients.values() if c.joined]
+        elif method == "workspace/configuration":
+            self._send_configuration_request(message)
+            return
+        elif method == "window/workDoneProgress/create":
+            targets = self._editing_clients()
+        else:
+            targets = self._primary_clients()
+
+        if method == "window/workDoneProgress/create" and targets:
+            self._progress_owners[json.dumps(params.get("token"))] = targets[0]
+
+        if not targets:
+            self._send_to_server({"jsonrpc": "2.0", "id": message["id"], "result": None})
+            return
+
+        self._send_to_clients(targets, message)
+
+    def _send_configuration_request(self, message: Dict[str, Any]) -> None:
+        """ Sends each item of "workspace/configuration" to the client of its scope and merges their results. """
+
+        items = (message.get("params") or {}).get("items") or []
+        request = _ServerRequest(message)
+        request.items = [None] * len(items)
+
+        # client ID => (client, indexes of items)
+        targets = {}  # type: Dict[int, Tuple[_Client, List[int]]]
+        for index, item in enumerate(items):
+            for client in self._clients_for_uri(item.get("scopeUri") or "")[:1]:
+                targets.setdefault(client.id, (client, []))[1].append(index)
+
+        if not targets:
+            self._send_to_server({"jsonrpc": "2.0", "id": message["id"], "result": request.items})
+            return
+
+        request.waiting = len(targets)
+        for client, indexes in targets.values():
+            params = dict(message["params"], items=[items[index] for index in indexes])
+            self._send_to_client(client, dict(message, params=params), request, indexes)
+
+    def _send_to_clients(self, clients: List[_Client], message: Dict[str, Any]) -> None:
+        """ Sends a request to clients with remapped IDs. The first response is sent back to the server. """
+
+        request = _ServerRequest(message)
+        for client in clients:
+            self._send_to_client(client, message, request, None)
+
+    def _send_to_client(
+        self,
+        client: _Client,
+        message: Dict[str, Any],
+        request: _ServerRequest,
+        indexes: Optional[List[int]],
+    ) -> None:
+        client_request_id = "shared-{}".format(self._next_request_id)
+        self._next_request_id += 1
+        self._server_requests[json.dumps(client_request_id)] = (request, client, indexes)
+        client.send(dict(message, jsonrpc="2.0", id=client_request_id))
+
+    def _on_server_notification(self, message: Dict[str, Any]) -> None:
+        method = message["method"]
+        params = message.get("params") or {}
+
+        if method == "textDocument/publishDiagnostics":
+            targets = self._clients_for_uri(params.get("uri", ""))
+        elif method == "$/progress":
+            owner = self._progress_owners.get(json.dumps(params.get("token")))
+            targets = [owner] if owner else []
+        elif method == "telemetry/event":
+            scope_uri = _telemetry_scope_uri(params)
+            targets = self._clients_for_uri(scope_uri)[:1] if scope_uri else self._editing_clients()
+        else:
+            targets = self._primary_clients()
+
+        for client in targets:
+            client.send(message)
+
+    def _clients_for_uri(self, uri: str) -> List[_Client]:
+        """ Clients which have the document open, or own a folder of the document, or the primary client. """
+
+        openers = [c for c in self._openers.get(uri, []) if c.id in self._clients]
+        if openers:
+            return openers
+
+        owners = [c for c in self._clients.values() if c.joined and c.owns(uri)]
+        if owners:
+            return owners
+
+        return self._primary_clients()
+
+    def _editing_clients(self) -> List[_Client]:
+        """ The client whose document changes are sent last, or the primary client. """
+
+        if self._last_editor and self._last_editor.id in self._clients:
+            return [self._last_editor]
+
+        return self._primary_clients()
+
+    def _primary_clients(self) -> List[_Client]:
+        """ The client which sent the last request, or the earliest joined client. """
+
+        if self._last_requester and self._last_requester.id in self._clients:
+            return [self._last_requester]
+
+        return [c for c in self._clients.values() if c.joined][:1]
+
+
+def _initialize_folders(params: Dict[str, Any]) -> List[Dict[str, str]]:
+    folders = params.get("workspaceFolders")
+    if folders:
+        return folders
+
+    root_uri = params.get("rootUri")
+    return [{"uri": root_uri, "name": os.path.basename(root_uri.rstrip("/"))}] if root_uri else []
+
+
+def _telemetry_scope_uri(params: Dict[str, Any]) -> str:
+    """ The URI of the workspace or the document which a "telemetry/event" is about, if there is one. """
+
+    properties = params.get("Properties")
+    for source in (params, properties if isinstance(properties, dict) else {}):
+        for key in ("scopeUri", "workspaceUri", "rootUri", "uri"):
+            value = source.get(key)
+            if isinstance(value, str) and value:
+                return value
+
+    return ""
+
+
+def _apply_content_changes(text: str, changes: List[Dict[str, Any]]) -> str:
+    """ Applies "contentChanges" of "textDocument/didChange" to the text. """
+
+    for change in changes:
+        change_range = change.get("range")
+        if change_range is None:
+            text = change["text"]
+        else:
+            start = _offset_at(text, change_range["start"])
+            end = _offset_at(text, change_range["end"])
+            text = text[:start] + change["text"] + text[end:]
+
+    return text
+
+
+def _offset_at(text: str, position: Dict[str, int]) -> int:
+    """ Converts a LSP position, whose character is in UTF-16 code units, into an offset of the text. """
+
+    offset = 0
+    for _ in range(position["line"]):
+        newline = text.find("\n", offset)
+        if newline < 0:
+            return len(text)
+        offset = newline + 1
+
+    line_end = text.find("\n", offset)
+    if line_end < 0:
+        line_end = len(text)
+
+    units = position["character"]
+    while units > 0 and offset < line_end:
+        units -= 2 if ord(text[offset]) > 0xFFFF else 1
+        offset += 1
+
+    return offset
+
+
+def _read_message(stream: BinaryIO) -> Optional[Dict[str, Any]]:
+    """ Reads a JSON-RPC message with the base protocol headers. Returns None at EOF. """
+
+    content_length = None
+
+    while True:
+        try:
+            line = stream.readline()
+        except (OSError, ValueError):
+            return None
+
+        if not line:
+            return None
+
+        line = line.strip()
+        if not line:
+            if content_length is None:
+                continue
+            break
+
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            content_length = int(value.strip())
+
+    body = stream.read(content_length)
+    if len(body) < content_length:
+        return None
+
+    return json.loads(body.decode("utf-8"))
+
+
+def _encode_message(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii") + body
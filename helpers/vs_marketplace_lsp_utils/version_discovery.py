@@ -0,0 +1,165 @@
+from .versions import is_prerelease
+from .versions import version_sort_key
+from LSP.plugin.core.typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+
+__all__ = [
+    "CHANNEL_DAILY",
+    "CHANNEL_STABLE",
+    "VersionDiscovery",
+    "parse_container_listing",
+]
+
+# "pylance.insidersChannel" values
+CHANNEL_DAILY = "daily"
+CHANNEL_STABLE = "off"
+
+
+def parse_container_listing(xml: bytes) -> Tuple[List[str], str]:
+    """
+    Parses a page of an Azure blob container listing.
+
+    :param      xml:  The response of "<container>?restype=container&comp=list"
+
+    :returns:   The (blob names, next marker), the next marker is "" for the last page
+    """
+
+    root = ET.fromstring(xml)
+    names = [(name.text or "") for name in root.iterfind("./Blobs/Blob/Name")]
+
+    return names, root.findtext("./NextMarker") or ""
+
+
+class VersionDiscovery:
+    """
+    Discovers available extension versions from an Azure blob container listing like
+    "https://pvsc.blob.core.windows.net/pylance-insiders?restype=container&comp=list".
+
+    Discovered versions are cached with the ETag of the listing. The listing is not requested
+    again within the TTL, and is requested conditionally (If-None-Match) after that.
+    """
+
+    def __init__(self, listing_url: str, cache_path: str, ttl: float = 3600, user_agent: str = "") -> None:
+        self._listing_url = listing_url
+        self._cache_path = cache_path
+        self._ttl = ttl
+        self._user_agent = user_agent
+        self.last_result = ""
+        """ How the last `versions()` call was served: "cache", "not-modified" or "downloaded". """
+
+    def versions(self, blob_prefix: str, blob_suffix: str = ".vsix", timeout: float = 15) -> List[str]:
+        """
+        Gets available versions from blobs like "<blob_prefix><version><blob_suffix>".
+
+        :param      blob_prefix:  The blob name prefix, such as "vscode-pylance-"
+        :param      blob_suffix:  The blob name suffix
+        :param      timeout:      The socket timeout in seconds
+
+        :returns:   Versions, sorted from the oldest to the newest
+        """
+
+        url = _with_query(self._listing_url, prefix=blob_prefix)
+        entry = self._load_cache().get(url) or {}
+
+        if entry and time.time() - entry.get("fetched_at", 0) < self._ttl:
+            self.last_result = "cache"
+            return entry.get("versions", [])
+
+        try:
+            names, etag = self._fetch_listing(url, entry.get("etag", "") if entry else "", timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            self.last_result = "not-modified"
+            entry["fetched_at"] = time.time()
+        else:
+            self.last_result = "downloaded"
+            versions = []  # type: List[str]
+            for name in names:
+                if name.startswith(blob_prefix) and name.endswith(blob_suffix):
+                    version = name[len(blob_prefix):len(name) - len(blob_suffix)]
+                    if version_sort_key(version):
+                        versions.append(version)
+
+            entry = {
+                "etag": etag,
+                "fetched_at": time.time(),
+                "versions": sorted(set(versions), key=version_sort_key),  # type: ignore
+            }
+
+        self._save_cache(url, entry)
+
+        return entry.get("versions", [])
+
+    def latest(self, blob_prefix: str, channel: str = CHANNEL_STABLE, **kwargs: Any) -> Optional[str]:
+        """
+        Gets the latest version of the channel.
+
+        :param      blob_prefix:  The blob name prefix, such as "vscode-pylance-"
+        :param      channel:      "daily" includes pre-releases, otherwise only releases are considered
+
+        :returns:   The version, None if there is none
+        """
+
+        versions = self.versions(blob_prefix, **kwargs)
+
+        if channel != CHANNEL_DAILY:
+            versions = [v for v in versions if not is_prerelease(v)]
+
+        return versions[-1] if versions else None
+
+    def _fetch_listing(self, url: str, etag: str, timeout: float) -> Tuple[List[str], str]:
+        """ Fetches all pages of the listing. Raises HTTPError(304) if the first page is not modified. """
+
+        names = []  # type: List[str]
+        first_etag = ""
+        marker = ""
+
+        while True:
+            headers = {"User-Agent": self._user_agent} if self._user_agent else {}
+            if etag and not marker:
+                headers["If-None-Match"] = etag
+
+            page_url = _with_query(url, marker=marker) if marker else url
+            req = urllib.request.Request(url=page_url, headers=headers)
+
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                if not marker:
+                    first_etag = resp.info().get("ETag") or ""
+                page_names, marker = parse_container_listing(resp.read())
+
+            names.extend(page_names)
+
+            if not marker:
+                return names, first_etag
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        return data if isinstance(data, dict) else {}
+
+    def _save_cache(self, url: str, entry: Dict[str, Any]) -> None:
+        data = self._load_cache()
+        data[url] = entry
+
+        try:
+            os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+            with open(self._cache_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(self._cache_path + ".tmp", self._cache_path)
+        except OSError:
+            pass
+
+
+def _with_query(url: str, **params: str) -> str:
+    return url + ("&" if "?" in url else "?") + urllib.parse.urlencode(params)
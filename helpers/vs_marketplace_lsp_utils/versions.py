@@ -0,0 +1,38 @@
+from LSP.plugin.core.typing import Optional, Tuple
+import re
+
+__all__ = [
+    "is_prerelease",
+    "version_sort_key",
+]
+
+# looks like "2021.1.4-pre.1" or "2021.1.3"
+VERSION_PATTERN = re.compile(r"^(\d+)\.(\d+)\.(\d+)(?:-pre\.(\d+))?$")
+
+# since VSCode supports pre-release extensions, a pre-release has a patch number like "2024.8.103"
+# while the release of the same month is like "2024.8.1"
+PRERELEASE_MIN_PATCH = 100
+
+
+def version_sort_key(version: str) -> Optional[Tuple[int, ...]]:
+    """ Gets the sort key of an extension version, None if it's not a version. A pre-release goes first. """
+
+    m = VERSION_PATTERN.match(version)
+    if not m:
+        return None
+
+    major, minor, patch, pre = m.groups()
+
+    return (int(major), int(minor), int(patch), 0 if pre else 1, int(pre or 0))
+
+
+def is_prerelease(version: str) -> bool:
+    """ Checks whether an extension version is a pre-release, either "2021.1.4-pre.1" or "2024.8.103". """
+
+    m = VERSION_PATTERN.match(version)
+    if not m:
+        return False
+
+    _, _, patch, pre = m.groups()
+
+    return bool(pre) or int(patch) >= PRERELEASE_MIN_PATCH
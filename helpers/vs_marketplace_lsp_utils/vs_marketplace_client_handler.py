@@ -1,14 +1,34 @@
+from .install_manifest import INSTALL_VERIFICATION_FAST
+from .install_manifest import MANIFEST_FILE
 from .server_vs_marketplace_resource import DOWNLOAD_FROM_MARKETPLACE
+from .server_vs_marketplace_resource import EXTRACTION_MODE_ALL
 from .server_vs_marketplace_resource import ServerVsMarketplaceResource
 from .typing import SemanticVersion
 from .vscode_settings import configure_server_settings_like_vscode
 from LSP.plugin import ClientConfig
-from LSP.plugin.core.typing import Dict, List, Optional
+from LSP.plugin import unregister_plugin
+from LSP.plugin import WorkspaceFolder
+from LSP.plugin.core.typing import Any, Dict, List, Optional, Set
 from lsp_utils import GenericClientHandler
 from lsp_utils import ServerResourceInterface
+from lsp_utils import ServerStatus
+from lsp_utils.helpers import log_and_show_message
+from typing import TYPE_CHECKING
+import os
+import sublime
+import threading
+
+# modules of opt-in features are imported lazily, so they cost nothing at plugin load unless used
+if TYPE_CHECKING:
+    from .server_storage import ServerStorage
+    from .shared_server import SharedServer
+    from .warm_pool import WarmPool
 
 __all__ = ["VsMarketplaceClientHandler"]
 
+# the environment variable which identifies the server process of a session
+SERVER_MARKER_ENV = "LSP_SERVER_MARKER"
+
 
 class VsMarketplaceClientHandler(GenericClientHandler):
     package_name = ""
@@ -18,10 +38,49 @@ class VsMarketplaceClientHandler(GenericClientHandler):
     execute_with_node = False
     pretend_vscode = False
     download_from = DOWNLOAD_FROM_MARKETPLACE  # "marketplace" or "pvsc"
+    # mirrors (local directories, "file://" or HTTP URLs) tried before built-in download sources,
+    # "download_mirrors" plugin settings are appended
+    download_mirrors = []  # type: List[str]
     resource_dirs = []  # type: List[str]
+    extraction_mode = EXTRACTION_MODE_ALL  # "all" or "server"
+    # additional VSIX path prefixes to be extracted in the "server" extraction mode
+    extraction_prefixes = []  # type: List[str]
+    # "fast" or "full", can be overridden by the "install_verification" plugin setting
+    install_verification = INSTALL_VERIFICATION_FAST
+    # keep using the latest installed version while a new version is being installed in the background,
+    # can be overridden by the "prefetch_server_updates" plugin setting
+    prefetch_server_updates = True
+    # the amount of pre-spawned server processes for new sessions (0 disables it) and how many seconds
+    # they are kept if not used, can be overridden by "warm_pool_size" and "warm_pool_idle_timeout" plugin settings
+    warm_pool_size = 0
+    warm_pool_idle_timeout = 600
+    # let sessions of all windows share a single server process as a multi-root workspace,
+    # can be overridden by the "shared_server" plugin setting
+    shared_server = False
+    # node arguments for the server, "node_max_old_space_size" and "node_arguments" plugin settings are appended
+    node_arguments = []  # type: List[str]
+    # run the server via a launcher which keeps V8 code caches of the server bundle in the server directory,
+    # can be overridden by the "node_compile_cache" plugin setting. Off by default since the server sees
+    # the launcher rather than its bundle as `require.main` and `process.mainModule` is replaced.
+    node_compile_cache = False
+    # besides versions in use, how many recently used server versions are kept for rollbacks, and the size budget
+    # of all installed versions (0 means no limit), can be overridden by "server_storage_keep_versions" and
+    # "server_storage_budget_mb"
+    server_storage_keep_versions = 1
+    server_storage_budget_mb = 1024
 
     # internal
     __server = None  # type: Optional[ServerVsMarketplaceResource]
+    __pending_server = None  # type: Optional[ServerVsMarketplaceResource]
+    __warm_pool = None  # type: Optional[WarmPool]
+    __shared_server = None  # type: Optional[SharedServer]
+    # server marker => PID, for server processes which are not spawned by LSP
+    __server_pids = {}  # type: Dict[str, int]
+    __server_storage = None  # type: Optional[ServerStorage]
+    # the launcher is written once it's needed
+    __node_launcher_path = ""
+    # server versions which have been used by sessions since the plugin is loaded
+    __used_versions = set()  # type: Set[str]
 
     # -------------------------- #
     # VsMarketplaceClientHandler #
@@ -36,6 +95,13 @@ class VsMarketplaceClientHandler(GenericClientHandler):
 
     @classmethod
     def additional_variables(cls) -> Optional[Dict[str, str]]:
+        # this is called whenever a session is about to start
+        cls._promote_pending_server()
+
+        if cls.__server and cls.server_version() not in cls.__used_versions:
+            cls.__used_versions.add(cls.server_version())
+            cls.server_storage().touch(cls.server_version())
+
         variables = super().get_additional_variables()
         variables.update(
             {
@@ -44,12 +110,189 @@ class VsMarketplaceClientHandler(GenericClientHandler):
                 "server_path": cls.binary_path(),
             }
         )
+
+        if cls.execute_with_node and cls.get_plugin_setting("node_compile_cache", cls.node_compile_cache):
+            if not cls.__node_launcher_path:
+                from .node_launcher import write_launcher
+
+                cls.__node_launcher_path = write_launcher(cls._node_scripts_dir())
+            variables["node_launcher_path"] = cls.__node_launcher_path
+            variables["node_compile_cache_path"] = cls.node_compile_cache_path()
+
         return variables
 
+    @classmethod
+    def cleanup(cls) -> None:
+        """
+        Unregisters the plugin. Unlike lsp_utils', this keeps the package storage since the plugin is also
+        unloaded when the package is upgraded or reloaded, and installed servers and caches are still needed then.
+        """
+
+        unregister_plugin(cls)
+
     @classmethod
     def server_directory_path(cls) -> str:
         return cls.__server.server_directory_path if cls.__server else ""
 
+    @classmethod
+    def server_version(cls) -> str:
+        """ The version of the server which is used by new sessions, which may differ from `extension_version`. """
+
+        return cls.__server.extension_version if cls.__server else ""
+
+    @classmethod
+    def node_compile_cache_path(cls) -> str:
+        """ The directory of V8 code caches of the server, "" if it's disabled. """
+
+        server_directory_path = cls.server_directory_path()
+        if not (server_directory_path and cls.get_plugin_setting("node_compile_cache", cls.node_compile_cache)):
+            return ""
+
+        from .node_launcher import COMPILE_CACHE_DIR
+
+        return os.path.join(server_directory_path, COMPILE_CACHE_DIR)
+
+    @classmethod
+    def get_node_arguments(cls) -> List[str]:
+        """ Arguments passed to node (rather than the server) when `execute_with_node` is True. """
+
+        arguments = list(cls.node_arguments)
+
+        max_old_space_size = cls.get_plugin_setting("node_max_old_space_size", 0)
+        if max_old_space_size:
+            arguments.append("--max-old-space-size={}".format(int(max_old_space_size)))
+
+        arguments.extend(cls.get_plugin_setting("node_arguments", []))
+
+        return arguments
+
+    @classmethod
+    def server_storage(cls) -> "ServerStorage":
+        if not cls.__server_storage:
+            from .server_storage import ServerStorage
+
+            cls.__server_storage = ServerStorage(cls.package_storage(), cls.extension_uid)
+        return cls.__server_storage
+
+    @classmethod
+    def server_versions_in_use(cls) -> Set[str]:
+        """ Server versions which must not be deleted: used by sessions, to be used, or being installed. """
+
+        versions = set(cls.__used_versions)
+        versions.add(cls.extension_version)
+        for server in (cls.__server, cls.__pending_server):
+            if server:
+                versions.add(server.extension_version)
+
+        return versions
+
+    @classmethod
+    def collect_server_versions(cls) -> None:
+        """ Deletes old server versions in the background, see `server_storage_keep_versions`. """
+
+        def on_done(deleted: List[str]) -> None:
+            if deleted:
+                log_and_show_message(
+                    "{}: Deleted old servers: {}".format(cls.package_name, ", ".join(deleted)),
+                    show_in_status=False,
+                )
+
+        cls.server_storage().collect_async(
+            cls.server_versions_in_use(),
+            cls.get_plugin_setting("server_storage_keep_versions", cls.server_storage_keep_versions),
+            int(cls.get_plugin_setting("server_storage_budget_mb", cls.server_storage_budget_mb) * 1024 * 1024),
+            on_done,
+        )
+
+    @classmethod
+    def sync_resource_dirs(cls) -> None:
+        """
+        Updates `resource_dirs` of the installed server in the background, such as after the package upgrades.
+        This is done by `get_server()` once the server is chosen.
+        """
+
+        server = cls.__server
+        if not (server and cls.resource_dirs):
+            return
+
+        # not installed yet, resources are synced during the installation
+        if not os.path.isfile(os.path.join(server.server_directory_path, MANIFEST_FILE)):
+            return
+
+        def run() -> None:
+            try:
+                server.sync_resource_dirs()
+            except RuntimeError as e:
+                log_and_show_message("{}: {}".format(cls.package_name, e), show_in_status=False)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    @classmethod
+    def discover_latest_version(cls) -> Optional[str]:
+        """ Finds the latest available server version of the "pylance.insidersChannel". This may do network I/O. """
+
+        server = cls.__server or cls._create_server(cls.extension_version)
+        if not server:
+            return None
+
+        settings = cls.get_plugin_setting("settings", {})  # type: Dict[str, Any]
+        channel = settings.get("pylance.insidersChannel") or "off"
+
+        return server.discover_latest_version(channel, cls.get_plugin_setting("version_discovery_ttl", 3600))
+
+    @classmethod
+    def shutdown_warm_pool(cls) -> None:
+        """ Terminates standby server processes. Sessions which are already running are not affected. """
+
+        if cls.__warm_pool:
+            cls.__warm_pool.shutdown()
+
+    @classmethod
+    def stop_shared_server(cls) -> None:
+        """ Stops the shared server process. Sessions attached to it are ended as well. """
+
+        if cls.__shared_server:
+            cls.__shared_server.stop()
+            cls.__shared_server = None
+
+    @classmethod
+    def retire_shared_server(cls) -> None:
+        """ Makes new sessions start a new shared server. The current one stops once its sessions end. """
+
+        cls.__shared_server = None
+
+    @classmethod
+    def find_server_pid(cls, configuration: ClientConfig) -> Optional[int]:
+        """
+        Finds the PID of the server process of a session.
+
+        :param      configuration:  The configuration of the session
+
+        :returns:   The PID, None if it's not found (yet)
+        """
+
+        marker = getattr(configuration, "env", {}).get(SERVER_MARKER_ENV)
+        if not marker:
+            return None
+
+        pid = cls.__server_pids.get(marker)
+        if not pid:
+            from .process_info import find_pid_by_env
+
+            pid = find_pid_by_env(SERVER_MARKER_ENV, marker)
+        if pid:
+            cls.__server_pids[marker] = pid
+
+        return pid
+
+    @classmethod
+    def is_shared_server_pid(cls, pid: int) -> bool:
+        return bool(cls.__shared_server and cls.__shared_server.pid == pid)
+
+    @classmethod
+    def get_plugin_setting(cls, key: str, default: Optional[Any] = None) -> Any:
+        return sublime.load_settings(cls.package_name + ".sublime-settings").get(key, default)
+
     # -------------------- #
     # GenericClientHandler #
     # -------------------- #
@@ -69,8 +312,13 @@ class VsMarketplaceClientHandler(GenericClientHandler):
 
         if cls.execute_with_node:
             command.append("node")
+            command.extend(cls.get_node_arguments())
+            # the launcher runs the server with a V8 code cache
+            if cls.get_plugin_setting("node_compile_cache", cls.node_compile_cache):
+                command.extend(["${node_launcher_path}", "${node_compile_cache_path}"])
 
-        command.append(cls.binary_path())
+        # resolved when a session starts so a prefetched server can be used without restarting ST
+        command.append("${server_path}")
         command.extend(cls.get_binary_arguments())
 
         return command
@@ -79,6 +327,42 @@ class VsMarketplaceClientHandler(GenericClientHandler):
     def get_binary_arguments(cls) -> List[str]:
         return ["--stdio"] if cls.execute_with_node else []
 
+    @classmethod
+    def on_pre_start(
+        cls,
+        window: sublime.Window,
+        initiating_view: sublime.View,
+        workspace_folders: List[WorkspaceFolder],
+        configuration: ClientConfig,
+    ) -> Optional[str]:
+        result = super().on_pre_start(window, initiating_view, workspace_folders, configuration)
+
+        # the configuration may be reused when the session restarts, undo what the last start did
+        env = getattr(configuration, "env")  # type: Dict[str, str]
+        cls.__server_pids.pop(env.pop(SERVER_MARKER_ENV, ""), None)
+        if cls.__warm_pool or cls.__shared_server:
+            from .warm_pool import WARM_POOL_TOKEN_ENV
+
+            env.pop(WARM_POOL_TOKEN_ENV, None)
+        original_command = getattr(configuration, "__original_command", None)
+        if original_command:
+            configuration.command = original_command
+
+        pid = None
+        if cls.execute_with_node:
+            if cls.get_plugin_setting("shared_server", cls.shared_server):
+                pid = cls._attach_to_shared_server(configuration)
+            else:
+                pid = cls._attach_to_warm_pool(configuration)
+
+        # set after attaching since standby processes must not depend on it
+        marker = os.urandom(8).hex()
+        env[SERVER_MARKER_ENV] = marker
+        if pid:
+            cls.__server_pids[marker] = pid
+
+        return result
+
     @classmethod
     def manages_server(cls) -> bool:
         return True
@@ -86,16 +370,163 @@ class VsMarketplaceClientHandler(GenericClientHandler):
     @classmethod
     def get_server(cls) -> Optional[ServerResourceInterface]:
         if not cls.__server:
-            cls.__server = ServerVsMarketplaceResource.create(
-                {
-                    "package_name": cls.package_name,
-                    "extension_uid": cls.extension_uid,
-                    "extension_version": cls.extension_version,
-                    "server_binary_path": cls.server_binary_path,
-                    "package_storage": cls.package_storage(),
-                    "minimum_node_version": cls.minimum_node_version(),
-                    "download_from": cls.download_from,
-                    "resource_dirs": cls.resource_dirs,
-                }
-            )
+            server = cls._create_server(cls.extension_version)
+
+            if (
+                server
+                and cls.get_plugin_setting("prefetch_server_updates", cls.prefetch_server_updates)
+                and server.needs_installation()
+            ):
+                fallback_server = cls._create_fallback_server(server)
+
+                if fallback_server:
+                    cls.__pending_server = server
+                    server.prefetch()
+                    server = fallback_server
+
+            cls.__server = server
+            cls.sync_resource_dirs()
+            # only now are versions to be used (including the fallback and the pending ones) known
+            cls.collect_server_versions()
         return cls.__server
+
+    @classmethod
+    def _create_server(cls, extension_version: str) -> Optional[ServerVsMarketplaceResource]:
+        return ServerVsMarketplaceResource.create(
+            {
+                "package_name": cls.package_name,
+                "extension_uid": cls.extension_uid,
+                "extension_version": extension_version,
+                "server_binary_path": cls.server_binary_path,
+                "package_storage": cls.package_storage(),
+                "minimum_node_version": cls.minimum_node_version(),
+                "download_from": cls.download_from,
+                "resource_dirs": cls.resource_dirs,
+                "extraction_mode": cls.extraction_mode,
+                "extraction_prefixes": cls.extraction_prefixes,
+                "install_verification": cls.get_plugin_setting("install_verification", cls.install_verification),
+                "download_mirrors": cls.download_mirrors + cls.get_plugin_setting("download_mirrors", []),
+            }
+        )
+
+    @classmethod
+    def _create_fallback_server(cls, server: ServerVsMarketplaceResource) -> Optional[ServerVsMarketplaceResource]:
+        """ Creates the server of the latest installed version which can be used while `server` is being installed. """
+
+        for version in server.installed_versions():
+            if version == cls.extension_version:
+                continue
+
+            fallback_server = cls._create_server(version)
+            if fallback_server and not fallback_server.needs_installation():
+                log_and_show_message(
+                    "{}: Using server {} until {} is prefetched".format(
+                        cls.package_name,
+                        version,
+                        cls.extension_version,
+                    ),
+                    show_in_status=False,
+                )
+                return fallback_server
+
+        return None
+
+    @classmethod
+    def _node_scripts_dir(cls) -> str:
+        return os.path.join(cls.package_storage(), ".node-scripts")
+
+    @classmethod
+    def _launcher_arguments(cls) -> List[str]:
+        """ The resolved arguments of `launch.js` like `get_command()` has. """
+
+        return [cls.node_compile_cache_path(), cls.binary_path()] + cls.get_binary_arguments()
+
+    @classmethod
+    def _attach_to_warm_pool(cls, configuration: ClientConfig) -> Optional[int]:
+        """ Makes the session use a standby server process if there is a ready one. Returns its PID. """
+
+        cls._promote_pending_server()
+
+        size = cls.get_plugin_setting("warm_pool_size", cls.warm_pool_size)
+        if size <= 0 and not cls.__warm_pool:
+            return None
+
+        attached = cls._warm_pool().acquire(
+            ["node"] + cls.get_node_arguments(),
+            cls._launcher_arguments(),
+            size,
+            cls.get_plugin_setting("warm_pool_idle_timeout", cls.warm_pool_idle_timeout),
+        )
+
+        if not attached:
+            return None
+
+        setattr(configuration, "__original_command", configuration.command)
+        configuration.command, attach_env, pid = attached
+        getattr(configuration, "env").update(attach_env)
+
+        return pid
+
+    @classmethod
+    def _warm_pool(cls) -> "WarmPool":
+        if not cls.__warm_pool:
+            from .warm_pool import WarmPool
+
+            cls.__warm_pool = WarmPool(cls.package_name, cls._node_scripts_dir())
+        return cls.__warm_pool
+
+    @classmethod
+    def _attach_to_shared_server(cls, configuration: ClientConfig) -> Optional[int]:
+        """ Makes the session use the shared server process. Returns its PID. """
+
+        cls._promote_pending_server()
+
+        env = getattr(configuration, "env")  # type: Dict[str, str]
+        shared_server = cls._shared_server(["node"] + cls.get_node_arguments(), cls._launcher_arguments(), env)
+
+        setattr(configuration, "__original_command", configuration.command)
+        configuration.command, attach_env = shared_server.attach_command()
+        env.update(attach_env)
+
+        return shared_server.pid
+
+    @classmethod
+    def _shared_server(cls, node_command: List[str], launcher_args: List[str], env: Dict[str, str]) -> "SharedServer":
+        """ Gets the shared server which runs the command, a new one if the current one doesn't. """
+
+        # sessions which are using an old shared server keep using it until they end
+        shared_server = cls.__shared_server
+        if shared_server and shared_server.is_alive() and shared_server.matches(node_command, launcher_args, env):
+            return shared_server
+
+        from .shared_server import SharedServer
+
+        cls.__shared_server = SharedServer(
+            cls.package_name,
+            node_command,
+            launcher_args,
+            env.copy(),
+            cls._node_scripts_dir(),
+        )
+        return cls.__shared_server
+
+    @classmethod
+    def _promote_pending_server(cls) -> None:
+        """ Switches to the prefetched server once it's ready. Running sessions are not affected. """
+
+        pending_server = cls.__pending_server
+        if not pending_server:
+            return
+
+        status = pending_server.get_status()
+
+        if status == ServerStatus.READY:
+            cls.__server = pending_server
+            log_and_show_message(
+                "{}: Switched to the prefetched server {}".format(cls.package_name, cls.extension_version),
+                show_in_status=False,
+            )
+            cls.collect_server_versions()
+
+        if status in (ServerStatus.READY, ServerStatus.ERROR):
+            cls.__pending_server = None
@@ -0,0 +1,97 @@
+from LSP.plugin.core.typing import List, Optional
+import glob
+import hashlib
+import os
+
+__all__ = [
+    "VsixCache",
+    "file_sha256",
+]
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """ Calculates the SHA-256 hex digest of a file without loading the whole file into memory. """
+
+    sha256 = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+class VsixCache:
+    """
+    A content-addressed cache of downloaded VSIX files.
+
+    A cached file looks like "<cache_dir>/<extension_uid>~<extension_version>~<sha256>.vsix".
+    The file name is verified against its content on lookup so a corrupted file is never used.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    def lookup(self, extension_uid: str, extension_version: str) -> Optional[str]:
+        """
+        Finds the cached VSIX file of the extension.
+
+        :returns:   The path of the cached VSIX file, None if not cached.
+        """
+
+        for path in self._find_entries(extension_uid, extension_version):
+            sha256 = os.path.splitext(os.path.basename(path))[0].rpartition("~")[2]
+
+            if file_sha256(path) == sha256:
+                return path
+
+            # corrupted, don't let it be found next time
+            os.remove(path)
+
+        return None
+
+    def add(self, extension_uid: str, extension_version: str, vsix_path: str) -> str:
+        """
+        Moves the `vsix_path` file into the cache.
+
+        A file which is not a zip file, such as an HTML page from a captive portal, is deleted rather than cached.
+
+        :returns:   The path of the cached VSIX file.
+        """
+
+        # lazy import since it's only needed when a VSIX is downloaded
+        import zipfile
+
+        if not zipfile.is_zipfile(vsix_path):
+            os.remove(vsix_path)
+            raise RuntimeError('"{}" is not a valid VSIX file'.format(vsix_path))
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+        sha256 = file_sha256(vsix_path)
+        cached_path = os.path.join(self._cache_dir, "{}~{}~{}.vsix".format(extension_uid, extension_version, sha256))
+
+        for path in self._find_entries(extension_uid, extension_version):
+            if path != cached_path:
+                os.remove(path)
+
+        os.replace(vsix_path, cached_path)
+
+        return cached_path
+
+    def remove(self, cached_path: str) -> None:
+        """ Removes a cached VSIX file, such as the one which can't be extracted. """
+
+        try:
+            os.remove(cached_path)
+        except OSError:
+            pass
+
+    def _find_entries(self, extension_uid: str, extension_version: str) -> List[str]:
+        pattern = "{}~{}~*.vsix".format(glob.escape(extension_uid), glob.escape(extension_version))
+
+        return glob.glob(os.path.join(glob.escape(self._cache_dir), pattern))
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from LSP.plugin.core.typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import os
+import posixpath
+import threading
+import zipfile
+
+__all__ = [
+    "derive_server_prefixes",
+    "extract_vsix",
+]
+
+
+def derive_server_prefixes(server_binary_path: str) -> List[str]:
+    """
+    Derives the path prefixes (in the VSIX) which the server needs from the server binary path.
+
+    For example, "extension/dist/server.bundle.js" results in `["extension/dist/"]`.
+    """
+
+    binary_dir = posixpath.dirname(server_binary_path.replace("\\", "/").strip("/"))
+
+    return [binary_dir + "/"] if binary_dir else []
+
+
+def extract_vsix(
+    vsix_path: str,
+    dst_dir: str,
+    prefixes: Optional[Iterable[str]] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    Extracts members of the VSIX file into `dst_dir` with a thread pool.
+
+    :param      vsix_path:    The VSIX file path
+    :param      dst_dir:      The destination directory
+    :param      prefixes:     Only members whose names start with one of these prefixes are extracted.
+                              If it's None, all members are extracted.
+    :param      max_workers:  The max amount of threads, None to let `ThreadPoolExecutor` decide
+
+    :returns:   The SHA-256 hex digests of extracted members, keyed by the member names
+    """
+
+    allowed = None if prefixes is None else tuple(prefix.replace("\\", "/").lstrip("/") for prefix in prefixes)
+    dst_dir_real = os.path.realpath(dst_dir)
+
+    with zipfile.ZipFile(vsix_path, "r") as zf:
+        members = [
+            info
+            for info in zf.infolist()
+            if not info.filename.endswith("/") and (allowed is None or info.filename.startswith(allowed))
+        ]
+
+    # create directories beforehand so workers never race for them
+    for dir_path in {os.path.dirname(_member_path(dst_dir_real, info.filename)) for info in members}:
+        os.makedirs(dir_path, exist_ok=True)
+
+    local = threading.local()
+    opened = []  # type: List[zipfile.ZipFile]
+    opened_lock = threading.Lock()
+
+    def extract(info: zipfile.ZipInfo) -> Tuple[str, str]:
+        # ZipFile objects are not safe to be shared among threads, so each thread opens its own
+        zf = getattr(local, "zf", None)
+        if zf is None:
+            zf = local.zf = zipfile.ZipFile(vsix_path, "r")
+            with opened_lock:
+                opened.append(zf)
+
+        sha256 = hashlib.sha256()
+
+        with zf.open(info, "r") as src, open(_member_path(dst_dir_real, info.filename), "wb") as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                sha256.update(chunk)
+                dst.write(chunk)
+
+        return (info.filename, sha256.hexdigest())
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            extracted = dict(executor.map(extract, members))
+    finally:
+        for zf in opened:
+            zf.close()
+
+    return extracted
+
+
+def _member_path(dst_dir: str, member_name: str) -> str:
+    path = os.path.realpath(os.path.join(dst_dir, *member_name.split("/")))
+
+    # prevent from "zip slip"
+    if os.path.commonpath([dst_dir, path]) != dst_dir:
+        raise RuntimeError('Refuse to extract "{}" outside of "{}"'.format(member_name, dst_dir))
+
+    return path
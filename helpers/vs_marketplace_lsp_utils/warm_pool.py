@@ -0,0 +1,291 @@
+from .node_launcher import hidden_startupinfo
+from .node_launcher import write_launcher
+from .node_launcher import write_script
+from LSP.plugin.core.typing import Dict, List, Optional, Tuple
+from lsp_utils.helpers import log_and_show_message
+import os
+import secrets
+import subprocess
+import threading
+import time
+
+__all__ = ["WarmPool"]
+
+# the environment variable which passes the attach token to standby/attach processes
+WARM_POOL_TOKEN_ENV = "LSP_WARM_POOL_TOKEN"
+
+# (node command, launcher arguments) which standby processes are spawned with
+_Spec = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+# The standby process loads and compiles the server bundle ahead of time (with `launch.js`) but doesn't run it.
+# Once a client attaches via a TCP connection, the bundle runs with that connection as its stdio.
+# The first line the client sends is a JSON object of the token, and the env and the cwd of the session.
+#
+#     node [node arguments] standby.js <idle timeout> <cache dir> <bundle> [server arguments]
+STANDBY_JS = r"""
+"use strict";
+const net = require("net");
+const path = require("path");
+const { compile, run } = require("./launch.js");
+
+const [idleTimeoutS, cacheDir, bundleArg, ...serverArgs] = process.argv.slice(2);
+const bundlePath = path.resolve(bundleArg);
+const token = process.env.LSP_WARM_POOL_TOKEN;
+// the env and the cwd are sent by the client, there is no need to hold more than them before the token is checked
+const MAX_HANDSHAKE_BYTES = 1024 * 1024;
+const script = compile(bundlePath, cacheDir);
+let attached = false;
+
+// the parent closes our stdin when it goes away, don't leave an orphan
+process.stdin.on("end", () => attached || process.exit(0));
+process.stdin.resume();
+
+const idleTimer = Number(idleTimeoutS) > 0 ? setTimeout(() => process.exit(0), Number(idleTimeoutS) * 1000) : null;
+
+const server = net.createServer((socket) => {
+    let buffered = Buffer.alloc(0);
+    // reads the token line in the paused mode so no data is lost before the server starts reading
+    const onReadable = () => {
+        let chunk;
+        while ((chunk = socket.read()) !== null) {
+            buffered = Buffer.concat([buffered, chunk]);
+            const eol = buffered.indexOf(10);
+            if (eol < 0) {
+                if (buffered.length > MAX_HANDSHAKE_BYTES) {
+                    return socket.destroy();
+                }
+                continue;
+            }
+            socket.removeListener("readable", onReadable);
+            let session;
+            try {
+                session = JSON.parse(buffered.slice(0, eol).toString());
+            } catch (e) {
+                return socket.destroy();
+            }
+            if (attached || !session || session.token !== token) {
+                return socket.destroy();
+            }
+            const rest = buffered.slice(eol + 1);
+            if (rest.length) {
+                socket.unshift(rest);
+            }
+            return start(socket, session);
+        }
+    };
+    socket.on("readable", onReadable);
+    socket.on("error", () => attached || socket.destroy());
+});
+
+function start(socket, session) {
+    attached = true;
+    server.close();
+    if (idleTimer) {
+        clearTimeout(idleTimer);
+    }
+    // the server runs as if it was spawned for the session
+    for (const key of Object.keys(process.env)) {
+        if (!(key in session.env)) {
+            delete process.env[key];
+        }
+    }
+    Object.assign(process.env, session.env);
+    try {
+        process.chdir(session.cwd);
+    } catch (e) {}
+    process.stdin.pause();
+    // the real stdout is not the LSP channel anymore
+    global.console = new (require("console").Console)(process.stderr, process.stderr);
+    Object.defineProperty(process, "stdin", { value: socket, configurable: true });
+    Object.defineProperty(process, "stdout", { value: socket, configurable: true });
+    socket.on("close", () => process.exit(0));
+    run(script, bundlePath, serverArgs);
+}
+
+server.listen(0, "127.0.0.1", () => process.stdout.write(server.address().port + "\n"));
+""".lstrip()
+
+# The attach process is what LSP spawns. It connects its stdio to a standby process
+# and hands over the env and the cwd which LSP has spawned it with.
+ATTACH_JS = r"""
+"use strict";
+const net = require("net");
+
+const socket = net.connect(Number(process.argv[2]), "127.0.0.1", () => {
+    const session = { token: process.env.LSP_WARM_POOL_TOKEN, env: process.env, cwd: process.cwd() };
+    socket.write(JSON.stringify(session) + "\n");
+    process.stdin.pipe(socket);
+    socket.pipe(process.stdout);
+});
+socket.on("close", () => process.exit(0));
+socket.on("error", (error) => {
+    process.stderr.write("Failed to attach to the standby server: " + error.message + "\n");
+    process.exit(1);
+});
+""".lstrip()
+
+
+class _Standby:
+    def __init__(self, process: subprocess.Popen, port: int, token: str) -> None:
+        self.process = process
+        self.port = port
+        self.token = token
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def terminate(self) -> None:
+        if self.is_alive():
+            self.process.terminate()
+
+
+class WarmPool:
+    """
+    A pool of pre-spawned but not-yet-initialized server processes.
+
+    A session takes a standby process by running `attach.js`, which is much cheaper than
+    starting node and loading the server bundle. The pool then refills itself in the background.
+    Standby processes exit by themselves if they are not taken within the idle timeout.
+    """
+
+    def __init__(self, name: str, scripts_dir: str) -> None:
+        self._name = name
+        self._scripts_dir = scripts_dir
+        self._lock = threading.Lock()
+        self._standbys = []  # type: List[_Standby]
+        self._spec = None  # type: Optional[_Spec]
+        self._refilling = False
+
+    @property
+    def attach_script_path(self) -> str:
+        return os.path.join(self._scripts_dir, "attach.js")
+
+    @property
+    def standby_script_path(self) -> str:
+        return os.path.join(self._scripts_dir, "standby.js")
+
+    def acquire(
+        self,
+        node_command: List[str],
+        launcher_args: List[str],
+        size: int,
+        idle_timeout: float,
+    ) -> Optional[Tuple[List[str], Dict[str, str], int]]:
+        """
+        Takes a ready standby process for a session.
+
+        Standby processes don't depend on sessions. The env and the cwd of the session are
+        handed over by the attach process, which LSP spawns with them.
+
+        :param      node_command:   The node executable with node arguments
+        :param      launcher_args:  The arguments of `launch.js`: [cache dir, bundle path, server arguments...]
+        :param      size:           The amount of standby processes to be kept, 0 disables the pool
+        :param      idle_timeout:   Standby processes exit if they are not taken within this seconds
+
+        :returns:   The (command, additional env, PID) to attach to a standby process, None if there is no ready one
+        """
+
+        spec = (tuple(node_command), tuple(launcher_args))
+        standby = None
+
+        with self._lock:
+            if size <= 0 or spec != self._spec:
+                self._terminate_standbys()
+                self._spec = spec if size > 0 else None
+
+            self._standbys = [s for s in self._standbys if s.is_alive()]
+
+            if self._standbys:
+                standby = self._standbys.pop(0)
+
+            if size > 0 and not self._refilling:
+                self._refilling = True
+                threading.Thread(target=self._refill, args=(spec, size, idle_timeout), daemon=True).start()
+
+        if not standby:
+            return None
+
+        return (
+            [node_command[0], self.attach_script_path, str(standby.port)],
+            {WARM_POOL_TOKEN_ENV: standby.token},
+            standby.process.pid,
+        )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._terminate_standbys()
+            self._spec = None
+
+    def _terminate_standbys(self) -> None:
+        for standby in self._standbys:
+            standby.terminate()
+        self._standbys.clear()
+
+    def _refill(self, spec: _Spec, size: int, idle_timeout: float) -> None:
+        try:
+            self._write_scripts()
+
+            while True:
+                with self._lock:
+                    if spec != self._spec or len(self._standbys) >= size:
+                        return
+
+                standby = self._spawn(list(spec[0]), list(spec[1]), idle_timeout)
+                if not standby:
+                    return
+
+                with self._lock:
+                    if spec != self._spec:
+                        standby.terminate()
+                        return
+                    self._standbys.append(standby)
+        except OSError as e:
+            log_and_show_message("{}: Failed to refill the warm pool: {}".format(self._name, e))
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _spawn(
+        self,
+        node_command: List[str],
+        launcher_args: List[str],
+        idle_timeout: float,
+    ) -> Optional[_Standby]:
+        time_start = time.perf_counter()
+        token = secrets.token_hex(16)
+
+        process_env = os.environ.copy()
+        process_env[WARM_POOL_TOKEN_ENV] = token
+
+        process = subprocess.Popen(
+            node_command + [self.standby_script_path, str(idle_timeout)] + launcher_args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=process_env,
+            # until the session's one is handed over
+            cwd=os.path.dirname(launcher_args[1]),
+            startupinfo=hidden_startupinfo(),
+        )
+
+        # the port is printed once the server bundle is compiled
+        line = process.stdout.readline() if process.stdout else b""
+        if process.stdout:
+            process.stdout.close()
+
+        if not line.strip().isdigit():
+            log_and_show_message("{}: Failed to start a standby server".format(self._name))
+            process.kill()
+            return None
+
+        log_and_show_message(
+            "{}: Standby server ready in {:.0f} ms".format(self._name, (time.perf_counter() - time_start) * 1000),
+            show_in_status=False,
+        )
+
+        return _Standby(process, int(line), token)
+
+    def _write_scripts(self) -> None:
+        write_launcher(self._scripts_dir)
+        write_script(self.standby_script_path, STANDBY_JS)
+        write_script(self.attach_script_path, ATTACH_JS)
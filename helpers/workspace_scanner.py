@@ -0,0 +1,244 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import os
+import threading
+
+__all__ = [
+    "DEFAULT_EXCLUDE",
+    "WorkspaceScanner",
+]
+
+# Pylance's default "python.analysis.exclude", which is replaced once the setting is set
+DEFAULT_EXCLUDE = ["**/node_modules", "**/__pycache__", "**/.*"]
+
+# directories which are never descended into, the ones with `True` are also excluded from analysis
+SKIPPED_DIR_NAMES = {
+    ".git": False,
+    ".hg": False,
+    ".svn": False,
+    "__pycache__": False,
+    ".mypy_cache": False,
+    ".pytest_cache": False,
+    ".tox": True,
+    ".nox": True,
+    ".eggs": True,
+    "node_modules": True,
+    "bower_components": True,
+}
+
+# build outputs and vendored trees, which are excluded if they have Python files
+EXCLUDED_DIR_NAMES = {"build", "dist", "site-packages", "vendor", "vendored", "_vendor", "third_party"}
+
+# a subtree without Python files but at least this many files is excluded (such as data or assets)
+NON_PYTHON_MIN_FILES = 500
+
+# a directory node: (mtime, Python files, other files, sub-directory names, is a virtual environment)
+_Node = Tuple[float, int, int, List[str], bool]
+
+
+class WorkspaceScanner:
+    """
+    Scans workspace folders for directories which should be excluded from analysis and
+    site-packages of virtual environments which should be import search paths.
+
+    Directory listings are cached with their mtimes so a rescan only lists changed directories.
+    """
+
+    def __init__(self, cache_path: str, max_dirs: int = 50000) -> None:
+        self._cache_path = cache_path
+        self._max_dirs = max_dirs
+        self._lock = threading.Lock()
+        self._cache = {}  # type: Dict[str, Dict[str, dict]]
+        self._loaded = False
+        self._scanning = set()  # type: set[str]
+
+    def cached_result(self, folder: str) -> Optional[Dict[str, List[str]]]:
+        """ Gets the last scan result of the folder: {"exclude": [...], "extraPaths": [...]}. """
+
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._cache.get(folder)
+            return entry["result"] if entry else None
+
+    def scan(self, folder: str) -> Dict[str, List[str]]:
+        """
+        Scans the folder. This may take a while for a large folder without a cache.
+
+        :param      folder:  The workspace folder
+
+        :returns:   The scan result: {"exclude": [...], "extraPaths": [...]}
+        """
+
+        with self._lock:
+            self._ensure_loaded()
+            old_nodes = self._cache.get(folder, {}).get("nodes", {})  # type: Dict[str, _Node]
+
+        nodes = self._walk(folder, old_nodes)
+        result = _analyze(folder, nodes)
+
+        with self._lock:
+            self._cache[folder] = {"nodes": nodes, "result": result}
+
+        self._save()
+
+        return result
+
+    def scan_async(self, folder: str, on_done: Callable[[str, Dict[str, List[str]]], None]) -> None:
+        """ Same as `scan()` but runs in a background thread. `on_done` is called with (folder, result). """
+
+        with self._lock:
+            if folder in self._scanning:
+                return
+            self._scanning.add(folder)
+
+        def run() -> None:
+            try:
+                result = self.scan(folder)
+            finally:
+                with self._lock:
+                    self._scanning.discard(folder)
+
+            on_done(folder, result)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _walk(self, folder: str, old_nodes: Dict[str, "_Node"]) -> Dict[str, "_Node"]:
+        nodes = {}  # type: Dict[str, _Node]
+        stack = [""]
+
+        while stack and len(nodes) < self._max_dirs:
+            rel_path = stack.pop()
+            path = os.path.join(folder, rel_path) if rel_path else folder
+
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+
+            # the listing of a directory only changes if its mtime changes
+            node = old_nodes.get(rel_path)
+            if not node or node[0] != mtime:
+                node = _list_directory(path, mtime)
+                if not node:
+                    continue
+
+            nodes[rel_path] = node
+
+            # hidden directories are excluded by default, they are only listed to find virtual environments
+            if node[4] or os.path.basename(rel_path).startswith("."):
+                continue
+
+            for name in node[3]:
+                if name not in SKIPPED_DIR_NAMES:
+                    stack.append(os.path.join(rel_path, name) if rel_path else name)
+
+        return nodes
+
+    def _save(self) -> None:
+        with self._lock:
+            data = dict(self._cache)
+
+            try:
+                os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+                with open(self._cache_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(self._cache_path + ".tmp", self._cache_path)
+            except OSError:
+                pass
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+
+        self._loaded = True
+
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict):
+            for folder, entry in data.items():
+                entry["nodes"] = {rel_path: tuple(node) for rel_path, node in entry.get("nodes", {}).items()}
+                self._cache[folder] = entry
+
+
+def _list_directory(path: str, mtime: float) -> Optional["_Node"]:
+    py_files = other_files = 0
+    dir_names = []  # type: List[str]
+    is_venv = False
+
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dir_names.append(entry.name)
+                    elif entry.name.endswith((".py", ".pyi")):
+                        py_files += 1
+                    else:
+                        other_files += 1
+                        is_venv = is_venv or entry.name == "pyvenv.cfg"
+                except OSError:
+                    continue
+    except OSError:
+        return None
+
+    return (mtime, py_files, other_files, sorted(dir_names), is_venv)
+
+
+def _analyze(folder: str, nodes: Dict[str, "_Node"]) -> Dict[str, List[str]]:
+    # Python files and all files per subtree, children are visited before parents
+    totals = {}  # type: Dict[str, Tuple[int, int]]
+    for rel_path in sorted(nodes, key=lambda p: -p.count(os.sep) if p else 1):
+        _, py_files, other_files, dir_names, _ = nodes[rel_path]
+        all_files = py_files + other_files
+        for name in dir_names:
+            child_py_files, child_all_files = totals.get(os.path.join(rel_path, name) if rel_path else name, (0, 0))
+            py_files += child_py_files
+            all_files += child_all_files
+        totals[rel_path] = (py_files, all_files)
+
+    exclude = []  # type: List[str]
+    extra_paths = []  # type: List[str]
+
+    # parents go before their children
+    for rel_path, node in sorted(nodes.items()):
+        path = os.path.join(folder, rel_path) if rel_path else folder
+
+        # only the top-most excluded directory is needed
+        if any(path.startswith(excluded + os.sep) for excluded in exclude):
+            continue
+
+        if rel_path:
+            py_files, all_files = totals[rel_path]
+            parent_py_files = totals[os.path.dirname(rel_path)][0]
+
+            if node[4]:
+                extra_paths.extend(_site_packages_dirs(path))
+                exclude.append(path)
+                continue
+
+            if (os.path.basename(rel_path) in EXCLUDED_DIR_NAMES and py_files) or (
+                not py_files and all_files >= NON_PYTHON_MIN_FILES and parent_py_files
+            ):
+                exclude.append(path)
+                continue
+
+        exclude.extend(os.path.join(path, name) for name in node[3] if SKIPPED_DIR_NAMES.get(name))
+
+    return {"exclude": sorted(exclude), "extraPaths": sorted(extra_paths)}
+
+
+def _site_packages_dirs(venv_dir: str) -> List[str]:
+    # "Lib/site-packages" on Windows, "lib/python3.X/site-packages" otherwise
+    candidates = [os.path.join(venv_dir, "Lib", "site-packages")]
+
+    try:
+        with os.scandir(os.path.join(venv_dir, "lib")) as it:
+            candidates.extend(os.path.join(entry.path, "site-packages") for entry in it if entry.name.startswith("py"))
+    except OSError:
+        pass
+
+    return [path for path in candidates if os.path.isdir(path)]
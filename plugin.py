@@ -1,33 +1,53 @@
 from .consts import EXTENSION_UID
 from .consts import EXTENSION_VERSION
 from .consts import SERVER_BINARY_PATH
-from .dev import vscode_env
-from .dev import vscode_python_settings
+from .helpers.adaptive_diagnostic_mode import AdaptiveDiagnosticMode
+from .helpers.analysis_cache import AnalysisCache
+from .helpers.analysis_history import AnalysisHistory
+from .helpers.interpreter_discovery import InterpreterDiscovery
+from .helpers.memory_watchdog import MemoryWatchdog
+from .helpers.package_dependency_dirs import PackageDependencyDirsResolver
+from .helpers.plugin_message import console_msg
 from .helpers.plugin_message import status_msg
+from .helpers.plugin_message import text_view
+from .helpers.request_latency import instrument_request_latency
+from .helpers.request_latency import RequestLatencyStats
+from .helpers.settings_diff import suppress_noop_configuration_pushes
 from .helpers.utils import unique
+from .helpers.workspace_scanner import DEFAULT_EXCLUDE
+from .helpers.workspace_scanner import WorkspaceScanner
 from .helpers.vs_marketplace_lsp_utils import configure_lsp_like_vscode
 from .helpers.vs_marketplace_lsp_utils import DOWNLOAD_FROM_PVSC
+from .helpers.vs_marketplace_lsp_utils import EXTRACTION_MODE_SERVER
+from .helpers.vs_marketplace_lsp_utils import version_sort_key
 from .helpers.vs_marketplace_lsp_utils import VsMarketplaceClientHandler
 from LSP.plugin import ClientConfig
 from LSP.plugin import DottedDict
+from LSP.plugin import Notification
 from LSP.plugin import WorkspaceFolder
-from LSP.plugin.core.typing import Any, Dict, List, Optional
+from LSP.plugin.core.typing import Any, Dict, List, Optional, Tuple
 from lsp_utils import notification_handler
 import os
 import sublime
-import sys
+import sublime_plugin
+import threading
 
 
 def plugin_loaded() -> None:
     configure_lsp_like_vscode()
+    suppress_noop_configuration_pushes(LspPylancePlugin.package_name)
     LspPylancePlugin.setup()
+    LspPylancePlugin.setup_request_latency_instrumentation()
 
 
 def plugin_unloaded() -> None:
-    # the cleanup() will delete the downloaded server
-    # we don't want this during developing this plugin...
-    if not LspPylancePlugin.get_plugin_setting("developing"):
-        LspPylancePlugin.cleanup()
+    LspPylancePlugin.teardown_request_latency_instrumentation()
+    LspPylancePlugin.analysis_history().flush()
+    if LspPylancePlugin._adaptive_diagnostic_mode:
+        LspPylancePlugin._adaptive_diagnostic_mode.flush()
+    LspPylancePlugin.shutdown_warm_pool()
+    LspPylancePlugin.stop_shared_server()
+    LspPylancePlugin.cleanup()
 
 
 class LspPylancePlugin(VsMarketplaceClientHandler):
@@ -39,10 +59,32 @@ class LspPylancePlugin(VsMarketplaceClientHandler):
     execute_with_node = True
     pretend_vscode = True
     download_from = DOWNLOAD_FROM_PVSC
+    # only extract the server (i.e., "extension/dist/") from the VSIX
+    extraction_mode = EXTRACTION_MODE_SERVER
+    extraction_prefixes = ["extension/package.json"]
 
     # resources directories will be copied into the server directory during server installation
     resource_dirs = ["_resources"]
 
+    # internal
+    _dependency_dirs_resolver = PackageDependencyDirsResolver()
+    _adaptive_diagnostic_mode = None  # type: Optional[AdaptiveDiagnosticMode]
+    _analysis_cache = None  # type: Optional[AnalysisCache]
+    _analysis_history = None  # type: Optional[AnalysisHistory]
+    _interpreter_discovery = None  # type: Optional[InterpreterDiscovery]
+    _memory_watchdog = None  # type: Optional[MemoryWatchdog]
+    _memory_watchdog_unsupported_logged = False
+    _request_latency_stats = None  # type: Optional[RequestLatencyStats]
+    _workspace_scanner = None  # type: Optional[WorkspaceScanner]
+
+    def __init__(self, *args, **kwargs) -> None:
+        # settings values which are added from workspace scan results, per setting key
+        self._scanned_settings = {}  # type: Dict[str, List[str]]
+
+        super().__init__(*args, **kwargs)
+
+        self._watch_server_memory()
+
     def on_settings_changed(self, settings: DottedDict) -> None:
         super().on_settings_changed(settings)
 
@@ -54,10 +96,28 @@ class LspPylancePlugin(VsMarketplaceClientHandler):
             settings.set("python.analysis.extraPaths", list(unique(extraPaths, stable=True)))
 
         if self.get_plugin_setting("developing"):
+            # lazy import since it's only for developing this plugin
+            from .dev import vscode_python_settings
+
             vscpy_settings = DottedDict(vscode_python_settings())
             vscpy_settings.update(settings.get())
             settings.assign(vscpy_settings.get())
 
+        if self.get_plugin_setting("interpreter_discovery") and settings.get("python.pythonPath") in ("", "python"):
+            self._apply_discovered_interpreter(settings)
+
+        if self.get_plugin_setting("adaptive_diagnostic_mode"):
+            mode = self.adaptive_diagnostic_mode().mode_for(self._workspace())
+            if mode:
+                settings.set("python.analysis.diagnosticMode", mode)
+
+        # let the server reuse its analysis results across restarts unless users have their own cache folder
+        if not settings.get("python.analysis.cacheFolderPath") and self.analysis_cache_budget():
+            settings.set("python.analysis.cacheFolderPath", self._assign_analysis_cache_folder())
+
+        if self.get_plugin_setting("workspace_scanner"):
+            self._apply_workspace_scan(settings)
+
     @classmethod
     def on_pre_start(
         cls,
@@ -66,11 +126,14 @@ class LspPylancePlugin(VsMarketplaceClientHandler):
         workspace_folders: List[WorkspaceFolder],
         configuration: ClientConfig,
     ) -> Optional[str]:
-        super().on_pre_start(window, initiating_view, workspace_folders, configuration)
-
+        # the env has to be ready before calling super() since it's used by standby server processes
         if cls.get_plugin_setting("developing"):
+            from .dev import vscode_env
+
             env = getattr(configuration, "env")  # type: Dict[str, str]
-            env.update(vscode_env())
+            env.update(vscode_env(window))
+
+        return super().on_pre_start(window, initiating_view, workspace_folders, configuration)
 
     # ---------------- #
     # message handlers #
@@ -84,6 +147,22 @@ class LspPylancePlugin(VsMarketplaceClientHandler):
         measurements = params.get("Measurements", {})
 
         if event_name == "language_server/analysis_complete" and measurements.get("numFilesAnalyzed", -1) >= 0:
+            session = self.weaksession() if hasattr(self, "weaksession") else None
+            window = session.window if session else sublime.active_window()
+
+            workspace = (window.folders() or [""])[0]
+
+            self.analysis_history().add(
+                workspace,
+                measurements,
+                serverVersion=self.server_version(),
+                typeCheckingMode=session.config.settings.get("python.analysis.typeCheckingMode") if session else None,
+                rssBytes=self.memory_watchdog().latest_rss(str(id(self))),
+            )
+
+            if session and self.get_plugin_setting("adaptive_diagnostic_mode"):
+                self._adapt_diagnostic_mode(session, workspace, measurements)
+
             return status_msg(
                 "{_}: Analysis {file_counts} files completed in {time_s:.3f} seconds.{first_run}",
                 file_counts="{numFilesAnalyzed}/{numFilesInProgram}".format_map(measurements),
@@ -100,20 +179,352 @@ class LspPylancePlugin(VsMarketplaceClientHandler):
     # -------------- #
 
     @classmethod
-    def get_plugin_setting(cls, key: str, default: Optional[Any] = None) -> Any:
-        return sublime.load_settings(cls.package_name + ".sublime-settings").get(key, default)
+    def find_package_dependency_dirs(cls) -> List[str]:
+        return cls._dependency_dirs_resolver.resolve()
+
+    @classmethod
+    def analysis_history(cls) -> AnalysisHistory:
+        if not cls._analysis_history:
+            history_path = os.path.join(cls.package_storage(), "analysis_history.json")
+            cls._analysis_history = AnalysisHistory(history_path, cls.get_plugin_setting("analysis_history_size", 500))
+        return cls._analysis_history
+
+    @classmethod
+    def interpreter_discovery(cls) -> InterpreterDiscovery:
+        if not cls._interpreter_discovery:
+            cache_path = os.path.join(cls.package_storage(), "interpreter_discovery_cache.json")
+            cls._interpreter_discovery = InterpreterDiscovery(cache_path)
+        return cls._interpreter_discovery
+
+    def _apply_discovered_interpreter(self, settings: DottedDict) -> None:
+        session = self.weaksession() if hasattr(self, "weaksession") else None
+        window = session.window if session else sublime.active_window()
+
+        # the first folder which has an environment wins since there is only one "python.pythonPath"
+        for folder in window.folders():
+            interpreter = self.interpreter_discovery().discover(folder)
+            if not interpreter:
+                continue
+
+            settings.set("python.pythonPath", interpreter["pythonPath"])
+            extraPaths = settings.get("python.analysis.extraPaths") or []  # type: List[str]
+            extraPaths.extend(interpreter["sitePackages"])
+            settings.set("python.analysis.extraPaths", list(unique(extraPaths, stable=True)))
+            console_msg('{_}: Using the {kind} interpreter "{pythonPath}".', **interpreter)
+            return
+
+    @classmethod
+    def adaptive_diagnostic_mode(cls) -> AdaptiveDiagnosticMode:
+        if not cls._adaptive_diagnostic_mode:
+            decisions_path = os.path.join(cls.package_storage(), "adaptive_diagnostic_mode.json")
+            cls._adaptive_diagnostic_mode = AdaptiveDiagnosticMode(decisions_path)
+        return cls._adaptive_diagnostic_mode
+
+    def _adapt_diagnostic_mode(self, session: Any, workspace: str, measurements: Dict[str, Any]) -> None:
+        settings = session.config.settings  # type: DottedDict
+        current_mode = settings.get("python.analysis.diagnosticMode") or "openFilesOnly"
+
+        mode = self.adaptive_diagnostic_mode().update(
+            workspace,
+            current_mode,
+            measurements,
+            self.get_plugin_setting("adaptive_diagnostic_mode_max_files", 3000),
+            self.get_plugin_setting("adaptive_diagnostic_mode_max_elapsed_ms", 30000),
+        )
+        if not mode:
+            return
+
+        settings.set("python.analysis.diagnosticMode", mode)
+        self._push_settings(session)
+        console_msg(
+            '{_}: Switched "python.analysis.diagnosticMode" to "{mode}" ({files} files in the program).',
+            mode=mode,
+            files=measurements.get("numFilesInProgram", 0),
+        )
+
+    def _push_settings(self, session: Any) -> None:
+        """ Sends settings of the session with `${...}` variables expanded, the same as LSP does when it starts. """
+
+        template_variables = getattr(session, "_template_variables", None)
+        variables = template_variables() if template_variables else session.window.extract_variables()
+        settings = sublime.expand_variables(session.config.settings.get(), variables)
+
+        session.send_notification(Notification("workspace/didChangeConfiguration", {"settings": settings}))
+
+    def _workspace(self) -> str:
+        session = self.weaksession() if hasattr(self, "weaksession") else None
+        window = session.window if session else sublime.active_window()
+
+        return (window.folders() or [""])[0]
+
+    @classmethod
+    def analysis_cache(cls) -> AnalysisCache:
+        if not cls._analysis_cache:
+            cls._analysis_cache = AnalysisCache(os.path.join(cls.package_storage(), "analysis-cache"))
+        return cls._analysis_cache
+
+    @classmethod
+    def analysis_cache_budget(cls) -> int:
+        """ The size budget (in bytes) of all analysis cache folders, 0 if the managed cache is disabled. """
+
+        return int(cls.get_plugin_setting("analysis_cache_size_mb", 0) * 1024 * 1024)
+
+    def _assign_analysis_cache_folder(self) -> str:
+        cache = self.analysis_cache()
+        folder, is_new = cache.folder_for(self._workspace(), self.server_version() or self.extension_version)
+        # other folders in use have fit the budget when they were assigned
+        if is_new:
+            cache.evict_async(self.analysis_cache_budget())
+
+        return folder
+
+    @classmethod
+    def workspace_scanner(cls) -> WorkspaceScanner:
+        if not cls._workspace_scanner:
+            cache_path = os.path.join(cls.package_storage(), "workspace_scan_cache.json")
+            cls._workspace_scanner = WorkspaceScanner(cache_path)
+        return cls._workspace_scanner
+
+    def _apply_workspace_scan(self, settings: DottedDict) -> None:
+        """ Applies cached scan results of workspace folders and rescans them in the background. """
+
+        session = self.weaksession() if hasattr(self, "weaksession") else None
+        window = session.window if session else sublime.active_window()
+        weaksession = getattr(self, "weaksession", None)
+
+        scanner = self.workspace_scanner()
+        folders = window.folders()
+        cached_results = {folder: scanner.cached_result(folder) for folder in folders}
+        self._merge_scan_results(settings, [result for result in cached_results.values() if result])
+
+        def apply_result(folder: str, result: Dict[str, List[str]]) -> None:
+            session = weaksession() if weaksession else None
+            if result == cached_results[folder] or not session:
+                return
+
+            cached_results[folder] = result
+            settings = session.config.settings  # type: DottedDict
+            self._merge_scan_results(settings, [result for result in cached_results.values() if result])
+            self._push_settings(session)
+
+        def on_done(folder: str, result: Dict[str, List[str]]) -> None:
+            # called on the scanner's thread, sessions are only touched on LSP's async thread
+            sublime.set_timeout_async(lambda: apply_result(folder, result))
+
+        for folder in folders:
+            scanner.scan_async(folder, on_done)
+
+    def _merge_scan_results(self, settings: DottedDict, results: List[Dict[str, List[str]]]) -> None:
+        for key, default in (("python.analysis.exclude", DEFAULT_EXCLUDE), ("python.analysis.extraPaths", [])):
+            # values which are added by the last scan results may be stale
+            previous = self._scanned_settings.get(key, [])
+            values = [value for value in (settings.get(key) or default) if value not in previous]
+            scanned = [value for result in results for value in result[key.rpartition(".")[2]]]
+
+            settings.set(key, list(unique(values + scanned, stable=True)))
+            self._scanned_settings[key] = scanned
+
+    @classmethod
+    def memory_watchdog(cls) -> MemoryWatchdog:
+        if not cls._memory_watchdog:
+            cls._memory_watchdog = MemoryWatchdog(os.path.join(cls.package_storage(), "memory_watchdog.json"))
+        return cls._memory_watchdog
+
+    def _watch_server_memory(self) -> None:
+        interval = self.get_plugin_setting("memory_watchdog_interval", 30)
+        session = self.weaksession() if hasattr(self, "weaksession") else None
+        if not (interval and session and self.execute_with_node):
+            return
+
+        cls = type(self)
+
+        # lazy import since the watchdog may be disabled
+        from .helpers.vs_marketplace_lsp_utils.process_info import can_find_pid_by_env
+
+        if not can_find_pid_by_env():
+            if not cls._memory_watchdog_unsupported_logged:
+                cls._memory_watchdog_unsupported_logged = True
+                console_msg("{_}: The memory watchdog is disabled since it's not supported on this platform.")
+            return
+
+        watchdog = cls.memory_watchdog()
+        watchdog.configure(cls.get_plugin_setting("memory_budget_mb", 0), interval)
+
+        # callbacks must not keep this plugin object alive
+        weaksession = self.weaksession
+        window = session.window
+        workspace = (window.folders() or [""])[0]
+
+        # the server process is looked up until it's found, rather than every sample
+        pid = None  # type: Optional[int]
+
+        def find_pid() -> Optional[int]:
+            nonlocal pid
+            session = weaksession()
+            if not session:
+                return None
+            if pid is None:
+                pid = cls.find_server_pid(session.config)
+            return pid
+
+        def on_warning(rss: int) -> None:
+            def warn() -> None:
+                message = "{_}: The server uses {rss_mib:.0f} MiB, {ratio:.0%} of the memory budget."
+                kwargs = dict(rss_mib=rss / 1024 / 1024, ratio=rss / watchdog.budget_bytes)
+                console_msg(message, **kwargs)
+                status_msg(message, **kwargs)
+
+            sublime.set_timeout(warn)
+
+        def on_exceeded(rss: int) -> None:
+            def restart() -> None:
+                if not window.is_valid():
+                    return
+
+                console_msg(
+                    "{_}: The server uses {rss_mib:.0f} MiB, over the memory budget. Restarting...",
+                    rss_mib=rss / 1024 / 1024,
+                )
+                # the shared server can't be restarted from a window, new sessions start a new one instead
+                pid = find_pid()
+                if pid and cls.is_shared_server_pid(pid):
+                    cls.retire_shared_server()
+                window.run_command("lsp_restart_server", {"config_name": cls.package_name})
+
+            sublime.set_timeout(restart)
+
+        watchdog.watch(str(id(self)), workspace, find_pid, on_warning, on_exceeded)
+
+    @classmethod
+    def setup_request_latency_instrumentation(cls) -> None:
+        settings = sublime.load_settings(cls.package_name + ".sublime-settings")
+        settings.add_on_change(cls.package_name + ".request_latency", cls._update_request_latency_instrumentation)
+        cls._update_request_latency_instrumentation()
+
+    @classmethod
+    def teardown_request_latency_instrumentation(cls) -> None:
+        settings = sublime.load_settings(cls.package_name + ".sublime-settings")
+        settings.clear_on_change(cls.package_name + ".request_latency")
+        instrument_request_latency(cls.package_name, None)
+
+        if cls._request_latency_stats:
+            cls._request_latency_stats.flush()
+
+    @classmethod
+    def _update_request_latency_instrumentation(cls) -> None:
+        if not cls.get_plugin_setting("request_latency_instrumentation"):
+            instrument_request_latency(cls.package_name, None)
+            return
+
+        if not cls._request_latency_stats:
+            os.makedirs(cls.package_storage(), exist_ok=True)
+            cls._request_latency_stats = RequestLatencyStats(os.path.join(cls.package_storage(), "request_latency.log"))
+
+        instrument_request_latency(cls.package_name, cls._request_latency_stats)
+
+    @classmethod
+    def request_latency_stats(cls) -> Optional[RequestLatencyStats]:
+        return cls._request_latency_stats
+
+
+class LspPylanceShowRequestLatencyCommand(sublime_plugin.WindowCommand):
+    """ Shows latencies and payload sizes of requests sent to the server, per method. """
+
+    def is_enabled(self) -> bool:
+        return bool(LspPylancePlugin.request_latency_stats())
+
+    def run(self) -> None:
+        stats = LspPylancePlugin.request_latency_stats()
+        if stats:
+            text_view(self.window, "{_}: Request Latency", stats.report())
+
+
+class LspPylanceShowMemoryUsageCommand(sublime_plugin.WindowCommand):
+    """ Shows memory usages of server processes, peak memory usages per workspace and restarts. """
+
+    def run(self) -> None:
+        text_view(self.window, "{_}: Memory Usage", LspPylancePlugin.memory_watchdog().report())
+
+
+class LspPylanceAnalysisCacheCommand(sublime_plugin.WindowCommand):
+    """ Shows or purges the analysis cache folders of workspaces. """
+
+    def run(self, action: str = "report") -> None:
+        cache = LspPylancePlugin.analysis_cache()
+
+        if action in ("purge_unused", "purge_all"):
+            deleted = cache.purge(include_in_use=action == "purge_all")
+            status_msg("{_}: Deleted {count} analysis cache folders.", count=len(deleted))
+        else:
+            text_view(self.window, "{_}: Analysis Cache", cache.report(LspPylancePlugin.analysis_cache_budget()))
+
+    def input(self, args: Dict[str, Any]) -> Optional[sublime_plugin.ListInputHandler]:
+        return None if "action" in args else AnalysisCacheActionInputHandler()
+
+
+class AnalysisCacheActionInputHandler(sublime_plugin.ListInputHandler):
+    def name(self) -> str:
+        return "action"
+
+    def list_items(self) -> List[Tuple[str, str]]:
+        return [
+            ("Show report", "report"),
+            ("Purge folders not used by running servers", "purge_unused"),
+            ("Purge all folders", "purge_all"),
+        ]
+
+
+class LspPylanceCheckServerUpdateCommand(sublime_plugin.WindowCommand):
+    """ Checks whether there is a newer server version than the used one. """
+
+    def run(self) -> None:
+        status_msg("{_}: Checking for server updates...")
+        threading.Thread(target=self._check, daemon=True).start()
+
+    def _check(self) -> None:
+        try:
+            latest_version = LspPylancePlugin.discover_latest_version()
+        except Exception as e:
+            return status_msg("{_}: Failed to check for server updates: {error}", error=e)
+
+        if not latest_version:
+            return status_msg("{_}: No server version is found.")
+
+        version = LspPylancePlugin.server_version() or LspPylancePlugin.extension_version
+        if version_sort_key(latest_version) > (version_sort_key(version) or ()):
+            status_msg("{_}: Server {latest} is available (using {version}).", latest=latest_version, version=version)
+        else:
+            status_msg("{_}: Server {version} is up to date.", version=version)
+
+
+class LspPylanceShowServerStorageCommand(sublime_plugin.WindowCommand):
+    """ Shows disk usages of installed server versions. """
+
+    def run(self) -> None:
+        storage = LspPylancePlugin.server_storage()
+        text_view(self.window, "{_}: Server Storage", storage.report(LspPylancePlugin.server_versions_in_use()))
+
+
+class LspPylanceShowAnalysisHistoryCommand(sublime_plugin.WindowCommand):
+    """ Shows the analysis performance history (from telemetry events) as a report, JSON or CSV. """
+
+    def run(self, format: str = "report") -> None:
+        history = LspPylancePlugin.analysis_history()
+
+        if format == "json":
+            text_view(self.window, "{_}: Analysis History.json", history.to_json(), "Packages/JSON/JSON.sublime-syntax")
+        elif format == "csv":
+            text_view(self.window, "{_}: Analysis History.csv", history.to_csv())
+        else:
+            text_view(self.window, "{_}: Analysis History", history.report() or "No record yet.")
 
-    @staticmethod
-    def find_package_dependency_dirs() -> List[str]:
-        dep_dirs = sys.path.copy()
+    def input(self, args: Dict[str, Any]) -> Optional[sublime_plugin.ListInputHandler]:
+        return None if "format" in args else AnalysisHistoryFormatInputHandler()
 
-        # move the "Packages/" to the last
-        # @see https://github.com/sublimelsp/LSP-pyright/pull/26#discussion_r520747708
-        packages_path = sublime.packages_path()
-        dep_dirs.remove(packages_path)
-        dep_dirs.append(packages_path)
 
-        # just for laziness because sometimes I just decompress the package source there
-        dep_dirs.append(sublime.installed_packages_path())
+class AnalysisHistoryFormatInputHandler(sublime_plugin.ListInputHandler):
+    def name(self) -> str:
+        return "format"
 
-        return [path for path in dep_dirs if os.path.isdir(path)]
+    def list_items(self) -> List[str]:
+        return ["report", "json", "csv"]
@@ -0,0 +1,556 @@
+"""
+A headless benchmark of the server installation and startup pipeline.
+
+It runs `helpers/vs_marketplace_lsp_utils` outside of Sublime Text against stubbed
+`sublime`, `sublime_lib`, `LSP` and `lsp_utils` modules. The VSIX is a synthetic one served
+by a local HTTP server and its "server.bundle.js" is a stub stdio LSP server which only
+answers the `initialize` request, so the numbers reflect the plugin side of the pipeline:
+
+    plugin_loaded -> get_server -> install_or_update -> on_pre_start -> server initialized
+
+The "launch" scenario compares spawning the installed server directly, via `launch.js` without
+a code cache, and via `launch.js` with a cold/populated V8 code cache. The stub server is padded
+with `--bundle-mib` of webpack-like modules so that parsing and compiling the bundle is measurable.
+
+Usage:
+
+    python tools/benchmark_startup.py [--runs 3] [--files 2000] [--payload-mib 20] [--bundle-mib 10] \
+        [--output result.json]
+
+The result is printed as JSON.
+"""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import typing
+import zipfile
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "LSP-pylance"
+BENCH_PACKAGE = "lsp_pylance_bench"
+
+EXTENSION_UID = "pylance-insiders.vscode-pylance"
+EXTENSION_VERSION = "0.0.0-bench"
+SERVER_BINARY_PATH = os.path.join("extension", "dist", "server.bundle.js")
+
+# a stdio LSP server which only answers "initialize" and "shutdown"
+STUB_SERVER_JS = r"""
+let buffer = Buffer.alloc(0);
+const send = (msg) => {
+    const body = Buffer.from(JSON.stringify(msg), "utf8");
+    process.stdout.write("Content-Length: " + body.length + "\r\n\r\n");
+    process.stdout.write(body);
+};
+process.stdin.on("data", (chunk) => {
+    buffer = Buffer.concat([buffer, chunk]);
+    for (;;) {
+        const sep = buffer.indexOf("\r\n\r\n");
+        if (sep < 0) return;
+        const length = parseInt(/Content-Length: (\d+)/i.exec(buffer.slice(0, sep).toString())[1], 10);
+        if (buffer.length < sep + 4 + length) return;
+        const msg = JSON.parse(buffer.slice(sep + 4, sep + 4 + length).toString("utf8"));
+        buffer = buffer.slice(sep + 4 + length);
+        if (msg.method === "initialize") send({ jsonrpc: "2.0", id: msg.id, result: { capabilities: {} } });
+        else if (msg.method === "shutdown") send({ jsonrpc: "2.0", id: msg.id, result: null });
+        else if (msg.method === "exit") process.exit(0);
+    }
+});
+"""
+
+# a webpack-like module which is executed at startup, used to pad the stub server
+BUNDLE_MODULE_JS = (
+    "function m{i}(exports) {{ class C{i} {{ constructor(a) {{ this.a = a + {i}; }} get(b) {{ return this.a * b; }} }} "
+    "exports.c{i} = new C{i}(1).get(2); }}\n"
+)
+
+# ----- #
+# stubs #
+# ----- #
+
+
+def install_stubs(package_storage: str, logs: List[str]) -> None:
+    def module(name: str, **attrs: Any) -> types.ModuleType:
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    class Settings(dict):
+        def get(self, key: str, default: Any = None) -> Any:
+            return dict.get(self, key, default)
+
+        def set(self, key: str, value: Any) -> None:
+            self[key] = value
+
+        def add_on_change(self, key: str, callback: Callable) -> None:
+            pass
+
+        def clear_on_change(self, key: str) -> None:
+            pass
+
+    settings = Settings()
+
+    module(
+        "sublime",
+        Settings=Settings,
+        View=object,
+        Window=object,
+        active_window=lambda: None,
+        expand_variables=lambda value, variables: value,
+        installed_packages_path=lambda: os.path.join(package_storage, "Installed Packages"),
+        load_settings=lambda name: settings,
+        packages_path=lambda: os.path.join(package_storage, "Packages"),
+        set_timeout=lambda callback, delay=0: callback(),
+        set_timeout_async=lambda callback, delay=0: callback(),
+        status_message=lambda msg: None,
+    )
+    module("sublime_plugin", WindowCommand=object, ListInputHandler=object)
+
+    class ResourcePath:
+        """ Maps "Packages/LSP-pylance/..." to this repository. """
+
+        def __init__(self, path: str) -> None:
+            self._parts = tuple(part for part in path.split("/") if part)
+            self._path = os.path.join(PACKAGE_ROOT, *self._parts[2:])
+
+        def copytree(self, dst: str, exist_ok: bool = False) -> None:
+            shutil.copytree(self._path, dst, dirs_exist_ok=exist_ok)
+
+        def rglob(self, pattern: str) -> List["ResourcePath"]:
+            # like sublime_lib's, only files are resources and `pattern` is always "*" here
+            paths = []  # type: List[ResourcePath]
+            for root, _, names in os.walk(self._path):
+                for name in sorted(names):
+                    relative_path = os.path.relpath(os.path.join(root, name), self._path)
+                    paths.append(ResourcePath("/".join(self._parts + tuple(relative_path.split(os.sep)))))
+            return paths
+
+        def relative_to(self, other: "ResourcePath") -> Tuple[str, ...]:
+            return self._parts[len(other._parts):]
+
+        def read_bytes(self) -> bytes:
+            with open(self._path, "rb") as f:
+                return f.read()
+
+    module("sublime_lib", ResourcePath=ResourcePath)
+
+    class ServerStatus:
+        UNINITIALIZED = 0
+        ERROR = 1
+        READY = 2
+
+    class GenericClientHandler:
+        @classmethod
+        def package_storage(cls) -> str:
+            return package_storage
+
+        @classmethod
+        def get_additional_variables(cls) -> Dict[str, str]:
+            return {}
+
+        @classmethod
+        def binary_path(cls) -> str:
+            server = cls.get_server()  # type: ignore
+            return server.binary_path if server else ""
+
+        @classmethod
+        def on_pre_start(cls, *args: Any) -> Optional[str]:
+            return None
+
+    def run_command_sync(command: List[str]) -> Any:
+        try:
+            return subprocess.check_output(command, universal_newlines=True).strip(), None
+        except (OSError, subprocess.CalledProcessError) as e:
+            return "", str(e)
+
+    module("LSP")
+    module(
+        "LSP.plugin",
+        ClientConfig=type("ClientConfig", (), {}),
+        DottedDict=dict,
+        WorkspaceFolder=object,
+        unregister_plugin=lambda plugin: None,
+    )
+    module("LSP.plugin.core")
+    sys.modules["LSP.plugin.core.typing"] = typing
+    sessions = module(
+        "LSP.plugin.core.sessions",
+        Session=type("Session", (), {"send_request_async": lambda *args: None}),
+        get_initialize_params=lambda *args, **kwargs: {"clientInfo": {}},
+    )
+    setattr(sys.modules["LSP.plugin.core"], "sessions", sessions)
+
+    module(
+        "lsp_utils",
+        GenericClientHandler=GenericClientHandler,
+        ServerResourceInterface=object,
+        ServerStatus=ServerStatus,
+        notification_handler=lambda name: (lambda func: func),
+    )
+    module(
+        "lsp_utils.helpers",
+        log_and_show_message=lambda msg, *args, **kwargs: logs.append(msg),
+        parse_version=lambda version: tuple(int(part) for part in version.lstrip("v").split(".")[:3]),
+        run_command_sync=run_command_sync,
+        version_to_string=lambda version: ".".join(map(str, version)),
+    )
+    module("lsp_utils.server_npm_resource", NodeVersionResolver=object)
+
+
+def import_helpers() -> types.ModuleType:
+    """ Imports `helpers/vs_marketplace_lsp_utils` as if it's in the "LSP-pylance" package. """
+
+    for name, path in (
+        (BENCH_PACKAGE, PACKAGE_ROOT),
+        (BENCH_PACKAGE + ".helpers", os.path.join(PACKAGE_ROOT, "helpers")),
+    ):
+        pkg = types.ModuleType(name)
+        pkg.__path__ = [path]  # type: ignore
+        sys.modules[name] = pkg
+
+    return importlib.import_module(BENCH_PACKAGE + ".helpers.vs_marketplace_lsp_utils")
+
+
+# -------------- #
+# synthetic VSIX #
+# -------------- #
+
+
+def build_vsix(path: str, files: int, payload_mib: float, bundle_mib: float) -> int:
+    """ Builds a VSIX which looks like Pylance's one. Returns its size. """
+
+    rng = random.Random(0)
+    # the bundle is large and incompressible, like minified JS in a zip
+    bundle_padding = max(0, int(payload_mib * 1024 * 1024) - files * 512)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("extension.vsixmanifest", "<PackageManifest/>")
+        zf.writestr("extension/package.json", json.dumps({"name": "vscode-pylance", "version": EXTENSION_VERSION}))
+        zf.writestr("extension/dist/server.bundle.js", build_bundle(bundle_mib))
+        zf.writestr("extension/dist/server.bundle.padding", random_bytes(rng, bundle_padding))
+
+        for i in range(files):
+            stub = "def f{}() -> int: ...\n".format(i) * 16
+            zf.writestr("extension/dist/typeshed-fallback/stdlib/mod{}.pyi".format(i), stub)
+
+        # stuffs which the server doesn't need
+        for i in range(files // 10):
+            zf.writestr("extension/images/image{}.png".format(i), random_bytes(rng, 512))
+
+    return os.path.getsize(path)
+
+
+def build_bundle(bundle_mib: float) -> str:
+    """ The stub server padded with modules which are executed at startup. """
+
+    modules = []  # type: List[str]
+    size = 0
+    while size < bundle_mib * 1024 * 1024:
+        modules.append(BUNDLE_MODULE_JS.format(i=len(modules)))
+        size += len(modules[-1])
+
+    return "".join(
+        [
+            "const exports_ = {};\n",
+            "".join(modules),
+            "".join("m{}(exports_);\n".format(i) for i in range(len(modules))),
+            STUB_SERVER_JS,
+        ]
+    )
+
+
+def random_bytes(rng: random.Random, size: int) -> bytes:
+    return rng.getrandbits(8 * size).to_bytes(size, "little") if size else b""
+
+
+def serve_file(path: str) -> ThreadingHTTPServer:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            start = 0
+            if self.headers.get("Range"):
+                start = int(self.headers["Range"].split("=")[1].split("-")[0])
+                self.send_response(206)
+            else:
+                self.send_response(200)
+
+            self.send_header("Content-Length", str(len(data) - start))
+            self.end_headers()
+            self.wfile.write(data[start:])
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+# --------- #
+# benchmark #
+# --------- #
+
+
+class Timer:
+    def __init__(self) -> None:
+        self.timings = {}  # type: Dict[str, float]
+        self._originals = []  # type: List[Any]
+
+    def wrap(self, obj: Any, method: str, name: str) -> None:
+        """ Accumulates the time spent in `obj.method` into `timings[name]`. """
+
+        original = getattr(obj, method)
+        self._originals.append((obj, method, original))
+
+        def wrapped(*args: Any, **kwargs: Any) -> Any:
+            time_start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - time_start
+
+        setattr(obj, method, wrapped)
+
+    def restore(self) -> None:
+        for obj, method, original in reversed(self._originals):
+            setattr(obj, method, original)
+        self._originals.clear()
+
+
+def lsp_message(payload: Dict[str, Any]) -> bytes:
+    body = json.dumps(payload).encode("utf-8")
+    return "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii") + body
+
+
+def read_lsp_message(stream: io.BufferedReader) -> Dict[str, Any]:
+    length = 0
+    while True:
+        line = stream.readline()
+        if not line:
+            raise EOFError("The server exited unexpectedly")
+        if line in (b"\r\n", b"\n"):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def start_and_initialize(command: List[str], env: Dict[str, str]) -> float:
+    """ Spawns the server and returns seconds until the "initialize" response arrives. """
+
+    time_start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=dict(os.environ, **env))
+
+    try:
+        assert process.stdin and process.stdout
+        process.stdin.write(lsp_message({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}}))
+        process.stdin.flush()
+        read_lsp_message(process.stdout)  # type: ignore
+        elapsed = time.perf_counter() - time_start
+        process.stdin.write(lsp_message({"jsonrpc": "2.0", "method": "exit"}))
+        process.stdin.flush()
+    finally:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    return elapsed
+
+
+def expand_variables(value: str, variables: Dict[str, str]) -> str:
+    for key, variable in variables.items():
+        value = value.replace("${" + key + "}", variable)
+    return value
+
+
+def create_plugin_class(lib: types.ModuleType) -> Any:
+    class BenchPlugin(lib.VsMarketplaceClientHandler):  # type: ignore
+        package_name = PACKAGE_NAME
+        extension_uid = EXTENSION_UID
+        extension_version = EXTENSION_VERSION
+        server_binary_path = SERVER_BINARY_PATH
+        execute_with_node = True
+        pretend_vscode = True
+        download_from = "bench"
+        extraction_mode = lib.EXTRACTION_MODE_SERVER
+        extraction_prefixes = ["extension/package.json"]
+        resource_dirs = ["_resources"]
+        # measured by the "launch" scenario
+        node_compile_cache = True
+
+    return BenchPlugin
+
+
+def run_scenario(lib: types.ModuleType, scenario: str, package_storage: str, vsix_size: int) -> Dict[str, Any]:
+    resource_class = lib.ServerVsMarketplaceResource
+    BenchPlugin = create_plugin_class(lib)
+
+    # every scenario simulates a new plugin_host
+    sys.modules[resource_class.__module__].node_version_resolver._version = None
+
+    timer = Timer()
+    timer.wrap(resource_class, "_download_extension", "download")
+    timer.wrap(resource_class, "_extract_extension", "extract")
+    result = {"scenario": scenario}  # type: Dict[str, Any]
+    time_start = time.perf_counter()
+
+    try:
+        # plugin_loaded()
+        lib.configure_lsp_like_vscode()
+        server = BenchPlugin.get_server()
+        result["get_server_s"] = time.perf_counter() - time_start
+
+        if server.needs_installation():
+            server.install_or_update()
+        result["installed_s"] = time.perf_counter() - time_start
+
+        # on_pre_start()
+        variables = BenchPlugin.additional_variables() or {}
+        command = [expand_variables(part, variables) for part in BenchPlugin.get_command()]
+        env = {}  # type: Dict[str, Any]
+        lib.configure_server_settings_like_vscode(env)
+        result["pre_start_s"] = time.perf_counter() - time_start
+
+        if shutil.which("node"):
+            result["initialize_s"] = start_and_initialize(command, env["env"])
+            result["server_initialized_s"] = time.perf_counter() - time_start
+    finally:
+        timer.restore()
+
+    result.update({key + "_s": value for key, value in timer.timings.items()})
+    if "download_s" in result:
+        result["download_mib_per_s"] = vsix_size / 1024 / 1024 / result["download_s"]
+
+    return result
+
+
+def run_launch_scenario(lib: types.ModuleType) -> Dict[str, Any]:
+    """ Compares ways of spawning the installed server. """
+
+    BenchPlugin = create_plugin_class(lib)
+    BenchPlugin.get_server()
+    variables = BenchPlugin.additional_variables() or {}
+    cache_path = variables["node_compile_cache_path"]
+    env = {}  # type: Dict[str, Any]
+    lib.configure_server_settings_like_vscode(env)
+
+    direct_command = ["node", variables["server_path"], "--stdio"]
+    launcher_command = ["node", variables["node_launcher_path"], "", variables["server_path"], "--stdio"]
+    cached_command = [expand_variables(part, variables) for part in BenchPlugin.get_command()]
+
+    result = {"scenario": "launch"}  # type: Dict[str, Any]
+    result["direct_s"] = start_and_initialize(direct_command, env["env"])
+    result["launcher_no_cache_s"] = start_and_initialize(launcher_command, env["env"])
+    shutil.rmtree(cache_path, ignore_errors=True)
+    result["compile_cache_cold_s"] = start_and_initialize(cached_command, env["env"])
+    # the cache has been written when the server exits
+    result["compile_cache_cached_s"] = start_and_initialize(cached_command, env["env"])
+
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3, help="how many times each scenario runs")
+    parser.add_argument("--files", type=int, default=2000, help="how many .pyi files in the synthetic VSIX")
+    parser.add_argument("--payload-mib", type=float, default=20, help="the rough size of the synthetic VSIX")
+    parser.add_argument("--bundle-mib", type=float, default=10, help="the rough size of the stub server bundle")
+    parser.add_argument("--output", default="", help="also write the result into this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="lsp-pylance-bench-")
+    logs = []  # type: List[str]
+
+    try:
+        vsix_path = os.path.join(work_dir, "bench.vsix")
+        vsix_size = build_vsix(vsix_path, args.files, args.payload_mib, args.bundle_mib)
+        http_server = serve_file(vsix_path)
+
+        package_storage = os.path.join(work_dir, "Package Storage", PACKAGE_NAME)
+        install_stubs(package_storage, logs)
+
+        time_start = time.perf_counter()
+        lib = import_helpers()
+        import_s = time.perf_counter() - time_start
+
+        lib.ServerVsMarketplaceResource.templates["bench"] = {
+            "download": "http://127.0.0.1:{}/{{vendor}}/{{name}}-{{version}}.vsix".format(http_server.server_port),
+            "referer": "",
+            "user_agent": "benchmark",
+        }
+
+        runs = []  # type: List[Dict[str, Any]]
+        server_dir = os.path.join(package_storage, "{}~{}".format(EXTENSION_UID, EXTENSION_VERSION))
+
+        for _ in range(args.runs):
+            # cold: nothing in the package storage
+            shutil.rmtree(package_storage, ignore_errors=True)
+            runs.append(run_scenario(lib, "cold", package_storage, vsix_size))
+            # cached: the server is gone but the VSIX is cached
+            shutil.rmtree(server_dir, ignore_errors=True)
+            runs.append(run_scenario(lib, "cached", package_storage, vsix_size))
+            # warm: the server is installed
+            runs.append(run_scenario(lib, "warm", package_storage, vsix_size))
+            # launch: spawning the installed server with/without the V8 code cache
+            if shutil.which("node"):
+                runs.append(run_launch_scenario(lib))
+
+        http_server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "vsix_bytes": vsix_size,
+        "vsix_files": args.files,
+        "import_s": import_s,
+        "node": shutil.which("node") or "",
+        "runs": runs,
+        "median": summarize(runs),
+    }
+
+    output = json.dumps(result, indent=2)
+    print(output)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    return 0
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    summary = {}  # type: Dict[str, Dict[str, float]]
+
+    for scenario in sorted({run["scenario"] for run in runs}):
+        scenario_runs = [run for run in runs if run["scenario"] == scenario]
+        keys = sorted({key for run in scenario_runs for key in run if key != "scenario"})
+        summary[scenario] = {
+            key: sorted(run[key] for run in scenario_runs if key in run)[len(scenario_runs) // 2]
+            for key in keys
+            if all(key in run for run in scenario_runs)
+        }
+
+    return summary
+
+
+if __name__ == "__main__":
+    sys.exit(main())
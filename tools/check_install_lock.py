@@ -0,0 +1,208 @@
+"""
+A headless check of `InstallLock` with multiple processes racing to install the same server version.
+
+Each worker process imports `helpers/vs_marketplace_lsp_utils` against the stubbed modules of
+`benchmark_startup.py` and calls `_install_or_update()` of the same server at the same time.
+The synthetic VSIX is served by a local HTTP server. It verifies that:
+
+- exactly one worker downloads the server and the others reuse its installation
+- a lock file left by a dead process is broken
+- a lock file which hasn't been touched for `stale_after` seconds is broken
+
+Usage:
+
+    python tools/check_install_lock.py [--workers 4]
+
+It exits with a non-zero code if any check fails.
+"""
+
+from benchmark_startup import build_vsix
+from benchmark_startup import create_plugin_class
+from benchmark_startup import EXTENSION_UID
+from benchmark_startup import EXTENSION_VERSION
+from benchmark_startup import import_helpers
+from benchmark_startup import install_stubs
+from benchmark_startup import PACKAGE_NAME
+from benchmark_startup import serve_file
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# workers wait for this file so they start racing at the same time
+START_FILE = "start"
+# each worker which downloads the server appends its PID into this file
+DOWNLOADS_FILE = "downloads.log"
+
+# how long a download takes at least, so workers surely overlap
+DOWNLOAD_DELAY_S = 1.0
+
+
+def run_worker(work_dir: str, package_storage: str, port: int) -> int:
+    logs = []  # type: List[str]
+    install_stubs(package_storage, logs)
+    lib = import_helpers()
+
+    lib.ServerVsMarketplaceResource.templates["bench"] = {
+        "download": "http://127.0.0.1:{}/{{vendor}}/{{name}}-{{version}}.vsix".format(port),
+        "referer": "",
+        "user_agent": "check",
+    }
+
+    download_extension = lib.ServerVsMarketplaceResource._download_extension
+
+    def download_extension_recorded(self: Any) -> str:
+        with open(os.path.join(work_dir, DOWNLOADS_FILE), "a", encoding="utf-8") as f:
+            f.write("{}\n".format(os.getpid()))
+        time.sleep(DOWNLOAD_DELAY_S)
+        return download_extension(self)
+
+    lib.ServerVsMarketplaceResource._download_extension = download_extension_recorded
+
+    server = create_plugin_class(lib)._create_server(EXTENSION_VERSION)
+
+    while not os.path.exists(os.path.join(work_dir, START_FILE)):
+        time.sleep(0.01)
+
+    time_start = time.perf_counter()
+    error = ""
+    try:
+        server._install_or_update()
+    except Exception as e:
+        error = str(e)
+
+    print(json.dumps({"pid": os.getpid(), "elapsed_s": time.perf_counter() - time_start, "error": error, "logs": logs}))
+
+    return 1 if error else 0
+
+
+def race(work_dir: str, package_storage: str, port: int, workers: int) -> List[Dict[str, Any]]:
+    """ Starts workers, lets them race and returns their results. """
+
+    for name in (START_FILE, DOWNLOADS_FILE):
+        if os.path.exists(os.path.join(work_dir, name)):
+            os.remove(os.path.join(work_dir, name))
+
+    command = [sys.executable, os.path.abspath(__file__), "--worker", work_dir, package_storage, str(port)]
+    processes = [subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True) for _ in range(workers)]
+
+    # let all workers be ready before starting
+    time.sleep(1.0)
+    open(os.path.join(work_dir, START_FILE), "w").close()
+
+    results = []  # type: List[Dict[str, Any]]
+    for process in processes:
+        stdout, _ = process.communicate(timeout=300)
+        try:
+            results.append(json.loads(stdout.strip().splitlines()[-1]))
+        except (IndexError, ValueError):
+            results.append({"error": "exited with {}: {}".format(process.returncode, stdout)})
+
+    return results
+
+
+def read_downloads(work_dir: str) -> List[str]:
+    try:
+        with open(os.path.join(work_dir, DOWNLOADS_FILE), "r", encoding="utf-8") as f:
+            return f.read().split()
+    except OSError:
+        return []
+
+
+def dead_pid() -> int:
+    """ The PID of a process which has exited. """
+
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+
+    return process.pid
+
+
+def write_lock_file(lock_path: str, owner: Dict[str, Any], mtime: float) -> None:
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "w", encoding="utf-8") as f:
+        json.dump(owner, f)
+    os.utime(lock_path, (mtime, mtime))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4, help="how many processes race to install the server")
+    parser.add_argument("--worker", nargs=3, metavar=("WORK_DIR", "PACKAGE_STORAGE", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args.worker[0], args.worker[1], int(args.worker[2]))
+
+    work_dir = tempfile.mkdtemp(prefix="lsp-pylance-check-")
+    failures = []  # type: List[str]
+
+    def check(name: str, condition: bool, detail: Any = "") -> None:
+        if condition:
+            print("PASS {}".format(name))
+        else:
+            print("FAIL {}{}".format(name, " ({})".format(detail) if detail else ""))
+            failures.append(name)
+
+    try:
+        vsix_path = os.path.join(work_dir, "check.vsix")
+        build_vsix(vsix_path, 200, 1, 0.1)
+        http_server = serve_file(vsix_path)
+        port = http_server.server_port
+
+        package_storage = os.path.join(work_dir, "Package Storage", PACKAGE_NAME)
+        server_dir = os.path.join(package_storage, "{}~{}".format(EXTENSION_UID, EXTENSION_VERSION))
+
+        # the lock path is computed in this process too, against the same stubs as workers
+        install_stubs(package_storage, [])
+        lib = import_helpers()
+        lock_path = create_plugin_class(lib)._create_server(EXTENSION_VERSION).install_lock_path
+        manifest_file = sys.modules[lib.ServerVsMarketplaceResource.__module__].MANIFEST_FILE
+
+        # racing workers
+        results = race(work_dir, package_storage, port, args.workers)
+        errors = [r["error"] for r in results if r["error"]]
+        check("all workers succeed", not errors, errors)
+        check("exactly one worker downloads", len(read_downloads(work_dir)) == 1, read_downloads(work_dir))
+        check(
+            "other workers reuse the installation",
+            sum(1 for r in results if any("installed by another process" in log for log in r.get("logs", [])))
+            == args.workers - 1,
+        )
+        check("the server is installed", os.path.isfile(os.path.join(server_dir, manifest_file)))
+        check("the lock file is released", not os.path.exists(lock_path))
+        check("no staging directory is left", not [n for n in os.listdir(package_storage) if ".staging-" in n])
+
+        # a lock file of a dead process on this host, which has been touched just now
+        shutil.rmtree(server_dir)
+        owner = {"token": "dead", "pid": dead_pid(), "host": socket.gethostname(), "time": time.time()}
+        write_lock_file(lock_path, owner, time.time())
+        results = race(work_dir, package_storage, port, 1)
+        check("a lock of a dead process is broken", not results[0]["error"], results[0]["error"])
+        check("it's broken without waiting", results[0].get("elapsed_s", 0) < 30, results[0].get("elapsed_s"))
+
+        # a lock file of a process on another host, which hasn't been touched for a long time
+        shutil.rmtree(server_dir)
+        owner = {"token": "abandoned", "pid": 1, "host": "elsewhere", "time": 0}
+        write_lock_file(lock_path, owner, time.time() - 3600)
+        results = race(work_dir, package_storage, port, 1)
+        check("an untouched lock is broken", not results[0]["error"], results[0]["error"])
+        check("the server is installed again", os.path.isfile(os.path.join(server_dir, manifest_file)))
+
+        http_server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("{} check(s) failed".format(len(failures)) if failures else "All checks passed")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+A headless check of `VersionDiscovery` against a local stand-in of the Azure blob container listing.
+
+It verifies the pagination of the listing, the TTL of the cache, ETag revalidation (304) and that
+a changed listing is downloaded again. `helpers/vs_marketplace_lsp_utils` is imported against the
+stubbed modules of `benchmark_startup.py`, so this runs outside of Sublime Text.
+
+Usage:
+
+    python tools/check_version_discovery.py
+
+It exits with a non-zero code if any check fails.
+"""
+
+from benchmark_startup import BENCH_PACKAGE
+from benchmark_startup import import_helpers
+from benchmark_startup import install_stubs
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any, List, Optional
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.parse
+
+BLOB_PREFIX = "vscode-pylance-"
+PAGE_SIZE = 2
+
+# insiders builds before VSCode supports pre-release extensions, releases and pre-releases after that
+REAL_VERSIONS = ["2021.1.3", "2021.1.4-pre.1", "2023.10.40", "2023.10.41", "2024.8.1", "2024.8.2", "2024.8.103"]
+REAL_OTHER_NAMES = [
+    "vscode-pylance-2024.8.2.vsix.sha256",
+    "vscode-pylance-latest.vsix",
+    "vscode-pylance-insiders-2024.8.103.vsix",
+    "pylance-2024.8.2.vsix",
+]
+
+
+class Listing:
+    """ The blobs of the stand-in container and the requests it has received. """
+
+    def __init__(self, versions: List[str], other_names: Optional[List[str]] = None) -> None:
+        self.versions = versions
+        self.other_names = ["unrelated.txt"] if other_names is None else other_names
+        self.etag = '"0x1"'
+        self.requests = []  # type: List[dict[str, str]]
+
+    def update(self, versions: List[str]) -> None:
+        self.versions = versions
+        self.etag = '"0x{:x}"'.format(int(self.etag.strip('"'), 16) + 1)
+
+    def page(self, marker: str) -> bytes:
+        names = [BLOB_PREFIX + version + ".vsix" for version in self.versions] + self.other_names
+        start = int(marker or 0)
+        next_marker = str(start + PAGE_SIZE) if start + PAGE_SIZE < len(names) else ""
+
+        blobs = "".join("<Blob><Name>{}</Name></Blob>".format(name) for name in names[start:start + PAGE_SIZE])
+
+        return (
+            '<?xml version="1.0" encoding="utf-8"?><EnumerationResults>'
+            "<Blobs>{}</Blobs><NextMarker>{}</NextMarker></EnumerationResults>".format(blobs, next_marker)
+        ).encode("utf-8")
+
+
+def serve_listing(listing: Listing) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+            marker = query.get("marker", "")
+            listing.requests.append({"marker": marker, "if_none_match": self.headers.get("If-None-Match") or ""})
+
+            if not marker and self.headers.get("If-None-Match") == listing.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            body = listing.page(marker)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", listing.etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def expire_cache(cache_path: str) -> None:
+    """ Makes cached listings look like they are fetched before the TTL. """
+
+    with open(cache_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    for entry in data.values():
+        entry["fetched_at"] = 0
+
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp(prefix="lsp-pylance-check-")
+    failures = []  # type: List[str]
+
+    def check(name: str, condition: bool, detail: Any = "") -> None:
+        if condition:
+            print("PASS {}".format(name))
+        else:
+            print("FAIL {}{}".format(name, " ({})".format(detail) if detail else ""))
+            failures.append(name)
+
+    try:
+        install_stubs(tmp_dir, [])
+        import_helpers()
+        module = importlib.import_module(BENCH_PACKAGE + ".helpers.vs_marketplace_lsp_utils.version_discovery")
+
+        listing = Listing(["2021.1.3", "2021.1.4-pre.1", "2021.1.10", "2021.1.4", "not-a-version"])
+        server = serve_listing(listing)
+        listing_url = "http://127.0.0.1:{}/pylance-insiders?restype=container&comp=list".format(server.server_port)
+        cache_path = os.path.join(tmp_dir, "versions.json")
+        discovery = module.VersionDiscovery(listing_url, cache_path, ttl=3600)
+
+        versions = discovery.versions(BLOB_PREFIX)
+        check("downloaded at first", discovery.last_result == "downloaded", discovery.last_result)
+        check("all pages are requested", len(listing.requests) == 3, listing.requests)
+        check("versions are sorted", versions == ["2021.1.3", "2021.1.4-pre.1", "2021.1.4", "2021.1.10"], versions)
+        check("latest stable", discovery.latest(BLOB_PREFIX) == "2021.1.10")
+
+        del listing.requests[:]
+        versions = discovery.versions(BLOB_PREFIX)
+        check("cached within the TTL", discovery.last_result == "cache", discovery.last_result)
+        check("no request within the TTL", not listing.requests, listing.requests)
+
+        expire_cache(cache_path)
+        versions = discovery.versions(BLOB_PREFIX)
+        check("revalidated after the TTL", discovery.last_result == "not-modified", discovery.last_result)
+        check(
+            "revalidated with the ETag",
+            [r["if_none_match"] for r in listing.requests] == [listing.etag],
+            listing.requests,
+        )
+        check("versions are kept on 304", versions[-1] == "2021.1.10", versions)
+
+        del listing.requests[:]
+        discovery.versions(BLOB_PREFIX)
+        check("304 refreshes the TTL", discovery.last_result == "cache" and not listing.requests, listing.requests)
+
+        listing.update(listing.versions + ["2021.2.0-pre.1"])
+        expire_cache(cache_path)
+        del listing.requests[:]
+        versions = discovery.versions(BLOB_PREFIX)
+        check("downloaded after a change", discovery.last_result == "downloaded", discovery.last_result)
+        check("new version is discovered", versions[-1] == "2021.2.0-pre.1", versions)
+        check("latest daily", discovery.latest(BLOB_PREFIX, module.CHANNEL_DAILY) == "2021.2.0-pre.1")
+
+        server.shutdown()
+
+        # blob names like the ones in the "pvsc" containers
+        listing = Listing(REAL_VERSIONS, REAL_OTHER_NAMES)
+        server = serve_listing(listing)
+        listing_url = "http://127.0.0.1:{}/pylance?restype=container&comp=list".format(server.server_port)
+        discovery = module.VersionDiscovery(listing_url, os.path.join(tmp_dir, "real.json"), ttl=3600)
+
+        versions = discovery.versions(BLOB_PREFIX)
+        check("only versions of vsix blobs", versions == sorted(REAL_VERSIONS, key=module.version_sort_key), versions)
+        check("latest stable of real names", discovery.latest(BLOB_PREFIX) == "2024.8.2")
+        check("latest daily of real names", discovery.latest(BLOB_PREFIX, module.CHANNEL_DAILY) == "2024.8.103")
+
+        server.shutdown()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print("{} check(s) failed".format(len(failures)) if failures else "All checks passed")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())